@@ -1,98 +1,374 @@
+import atexit
 import copy
+import itertools
+import pickle
+import queue
 import time
 from multiprocessing import Process, Queue, cpu_count
-from .models import model_to_module
 import numpy as np
+from .models import model_to_module, ensemble, task_budget
+from .models.task_budget import TaskFailure
+from . import result_cache, task_timings
 
 
-def worker(input, output):
-    for model, args in iter(input.get, 'STOP'):
-        print(f"{time.time():.1f} Running task for model: {model}")
+# returns (model, res) where res is (sol, kvals), ("ENSEMBLE", [(model, sol, kvals),...]) or (failure, args)
+# failures are task_budget.TaskFailure, which equals "FAILURE" and holds the reason and any partial solution
+def run_task(model, args):
+    if isinstance(args, list):  # a list of args is an ensemble, see run_tasks_ensemble
+        print(f"{time.time():.1f} Running ensemble of {len(args)} tasks for model: {model}")
         try:
-            result = model_to_module(model).run_model(copy.deepcopy(args))
-            output.put((model, result))
+            return model, ("ENSEMBLE", ensemble.run_ensemble(model, args))
         except Exception as e:
-            print(f"{time.time():.1f} Exception occurred while running task for model {model}; {e}")
-            output.put((model, ("FAILURE",args)))
+            print(f"{time.time():.1f} Exception occurred while running ensemble for model {model}; {e}")
+            return model, (TaskFailure(str(e)), args)
+
+    print(f"{time.time():.1f} Running task for model: {model}")
+    try:
+        start = time.time()
+        sol, kvals = model_to_module(model).run_model(copy.deepcopy(args))
+        kvals["compute_seconds"] = time.time() - start
+        res = task_budget.result_or_failure(sol, kvals)
+        if isinstance(res[0], TaskFailure):
+            print(f"{time.time():.1f} Task for model {model} stopped; {res[0].reason}")
+        return model, res
+    except Exception as e:
+        print(f"{time.time():.1f} Exception occurred while running task for model {model}; {e}")
+        return model, (TaskFailure(str(e)), args)
+
+
+# each worker has its own input queue so the pool knows which task a worker was running if it dies
+def worker(worker_i, input, output):
+    for task_id, model, args in iter(input.get, 'STOP'):
+        output.put((worker_i, task_id) + run_task(model, args))
+
+
+# Pool of worker processes that stay alive between calls to run, so sweeps that run many small
+# batches (e.g. par3add_parameter_search) only start processes and import modules once
+#   with TaskPool(8) as pool:
+#       results = pool.run(task_list)
+# tasks are handed out one at a time to idle workers, longest expected first (see task_timings)
+# if a worker dies its task is given to a new worker, and a task that has killed MAX_ATTEMPTS
+# workers comes back as a failure
+class TaskPool:
+    MAX_ATTEMPTS = 2
+
+    # seconds between checks on the workers while waiting for results
+    POLL_INTERVAL = 1
+
+    def __init__(self, NUMBER_OF_PROCESSES=int(cpu_count()/1.5)):
+        assert NUMBER_OF_PROCESSES >= 1
+        assert cpu_count() >= NUMBER_OF_PROCESSES
+
+        self.NUMBER_OF_PROCESSES = NUMBER_OF_PROCESSES
+        self.closed = False
+        self.done_queue = Queue()
+        self.task_ids = itertools.count()  # unique across runs so a late result can't be mistaken for a new task
+        self.workers = [None] * NUMBER_OF_PROCESSES
+        for i in range(NUMBER_OF_PROCESSES):
+            self.start_worker(i)
+
+    def start_worker(self, i):
+        input = Queue()
+        process = Process(target=worker, args=(i, input, self.done_queue), daemon=True)
+        process.start()
+        self.workers[i] = (process, input)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(terminate=exc_type is not None)
+
+    # Output of form [(model, sol, kvals),...] in the order tasks finish
+    # callback is called with each result as it comes in, failures included, and may return a list of
+    # further tasks to run in this run, so later stages of a pipeline (see run_pipeline) don't wait for
+    # the whole batch
+    # NUMBER_OF_PROCESSES limits the run to that many of the pool's workers, by default all of them
+    def run(self, task_list, callback=None, NUMBER_OF_PROCESSES=None) -> list[tuple]:
+        assert not self.closed
+        processes = self.NUMBER_OF_PROCESSES if NUMBER_OF_PROCESSES is None else min(NUMBER_OF_PROCESSES, self.NUMBER_OF_PROCESSES)
+
+        print(f"{time.time():.1f} Running {len(task_list)} tasks on {processes} processes")
+
+        history = task_timings.load_history()
+        tasks = {}
+        costs = {}
+        output_list = []
+        waiting = []
+        attempts = {}
+        running = {}  # worker index -> task id
+
+        # every result, from a worker or a failure of the pool's own, ends up here
+        def finish(model_res_combo):
+            output_list.append(model_res_combo)
+            if callback != None:
+                print(f"{time.time()} Running callback!")
+                add_tasks(callback(model_res_combo) or [])
+
+        # waiting is kept longest expected first
+        def add_tasks(new_tasks):
+            for task, cost in zip(new_tasks, task_timings.estimate_costs(new_tasks, history)):
+                try:
+                    pickle.dumps(task)
+                except Exception as e:  # would otherwise be lost in the queue's feeder thread
+                    print(f"{time.time():.1f} Task for model {task[0]} can't be sent to a worker; {e}")
+                    finish((task[0], TaskFailure(f"can't be sent to a worker; {e}"), task[1]))
+                    continue
+                task_id = next(self.task_ids)
+                tasks[task_id], costs[task_id], attempts[task_id] = task, cost, 0
+                waiting.append(task_id)
+            waiting.sort(key=lambda task_id: -costs[task_id])
+
+        add_tasks(task_list)
+
+        try:
+            while len(waiting) > 0 or len(running) > 0:
+                for i in range(processes):
+                    if len(waiting) > 0 and i not in running:
+                        task_id = waiting.pop(0)
+                        attempts[task_id] += 1
+                        running[i] = task_id
+                        self.workers[i][1].put((task_id,) + tasks[task_id])
+
+                try:
+                    worker_i, task_id, model, res = self.done_queue.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    self.replace_dead_workers(running, waiting, attempts, tasks, finish)
+                    continue
+
+                if running.get(worker_i) != task_id:
+                    continue  # from a task given up on after its worker was replaced
+                del running[worker_i]
+
+                finish((model,)+res)
+
+                print(f"{time.time():.1f} Finished running a task for model: {model}")
+                print(f"{len(waiting) + len(running)} tasks remaining")
+        except BaseException:
+            # workers may be part way through tasks of this run, don't let them into the next one
+            self.shutdown(terminate=True)
+            raise
+
+        task_timings.record([member for model_res_combo in output_list for member in split_ensemble_result(model_res_combo)])
+
+        return output_list
+
+    # a task that has killed MAX_ATTEMPTS workers is passed to finish as a failure
+    def replace_dead_workers(self, running, waiting, attempts, tasks, finish):
+        for i, (process, _) in enumerate(self.workers):
+            if process.is_alive():
+                continue
+
+            print(f"{time.time():.1f} Worker {i} died (exit code {process.exitcode}), starting a new one")
+            self.start_worker(i)
+
+            task_id = running.pop(i, None)
+            if task_id is None:
+                continue
+            model, args = tasks[task_id]
+            if attempts[task_id] < self.MAX_ATTEMPTS:
+                waiting.insert(0, task_id)
+            else:
+                print(f"{time.time():.1f} Task for model {model} killed {attempts[task_id]} workers, giving up on it")
+                finish((model, TaskFailure(f"killed {attempts[task_id]} workers"), args))
+
+    # stops the workers, waiting for them to finish their current task unless terminate
+    def shutdown(self, terminate=False, timeout=10):
+        if self.closed:
+            return
+        self.closed = True
+
+        for process, input in self.workers:
+            if terminate:
+                process.terminate()
+            else:
+                input.put("STOP")
+
+        for process, input in self.workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            input.close()
+        self.done_queue.close()
+
+
+# run_tasks_parallel reuses one pool between calls, a call for fewer processes runs on some of its
+# workers (e.g. run_tasks on one) and the pool is only replaced if more processes are asked for
+shared_pool = None
+
+
+def get_shared_pool(NUMBER_OF_PROCESSES) -> TaskPool:
+    global shared_pool
+    if shared_pool is None or shared_pool.closed or shared_pool.NUMBER_OF_PROCESSES < NUMBER_OF_PROCESSES:
+        if shared_pool is not None:
+            shared_pool.shutdown()
+        shared_pool = TaskPool(NUMBER_OF_PROCESSES)
+    return shared_pool
+
+
+@atexit.register
+def shutdown_shared_pool():
+    if shared_pool is not None:
+        shared_pool.shutdown()
 
 
 # Output of form [(model, sol, kvals),...]
 def run_tasks_parallel(task_list, NUMBER_OF_PROCESSES=int(cpu_count()/1.5), callback=None) -> list[tuple]:
-    assert NUMBER_OF_PROCESSES >= 1
-    assert cpu_count() >= NUMBER_OF_PROCESSES
-
-    # create queues
-    task_queue = Queue()
-    done_queue = Queue()
+    return get_shared_pool(NUMBER_OF_PROCESSES).run(task_list, callback, NUMBER_OF_PROCESSES)
 
-    # add tasks to queue
-    for task in task_list:
-        task_queue.put(task)
 
-    print(f"{time.time():.1f} Running {len(task_list)} tasks on {NUMBER_OF_PROCESSES} processes")
+# ensemble results come back as (model, "ENSEMBLE", [(model, sol, kvals),...]), split them into their members
+def split_ensemble_result(model_res_combo) -> list[tuple]:
+    model, sol, member_results = model_res_combo
+    if sol == "ENSEMBLE":
+        return member_results
+    if sol == "FAILURE" and isinstance(member_results, list):
+        return [(model, sol, args) for args in member_results]
+    return [model_res_combo]
 
-    # start worker processes
-    for i in range(NUMBER_OF_PROCESSES):
-        Process(target=worker, args=(task_queue, done_queue)).start()
 
-    output_list = []
+# Output of form [(model, sol, kvals),...] as for run_tasks_parallel
+# tasks that can share a stacked solve (same model, grid, times and functions) are run together as
+# ensembles of up to ENSEMBLE_SIZE members, sized so that every process still gets work
+# tasks of ensemble.SEPARATE_MODELS are run on their own as in run_tasks_parallel
+def run_tasks_ensemble(task_list, NUMBER_OF_PROCESSES=int(cpu_count()/1.5), ENSEMBLE_SIZE=16, callback=None) -> list[tuple]:
+    groups = {}
+    separate_tasks = []
+    for model, args in task_list:
+        if model in ensemble.SEPARATE_MODELS:
+            separate_tasks.append((model, args))
+            continue
+        key = ensemble.ensemble_key(model, model_to_module(model).setup_kvals(copy.deepcopy(args)))
+        groups.setdefault(key, []).append((model, args))
 
-    # get and handle results (unordered)
-    for i in range(len(task_list)):
-        model, res = done_queue.get()
-        model_res_combo = (model,)+res
-        output_list.append(model_res_combo)
+    ensemble_tasks = []
+    for group in groups.values():
+        size = max(1, min(ENSEMBLE_SIZE, -(-len(group) // NUMBER_OF_PROCESSES)))
+        for i in range(0, len(group), size):
+            ensemble_tasks.append((group[i][0], [args for _, args in group[i:i + size]]))
 
-        if callback != None:
-            print(f"{time.time()} Running callback!")
-            callback(model_res_combo)
+    print(f"{time.time():.1f} Grouped {len(task_list)} tasks into {len(ensemble_tasks)} ensembles"
+          f" and {len(separate_tasks)} separate tasks")
 
-        print(f"{time.time():.1f} Finished running a task for model: {model}")
-        print(f"{len(task_list)-len(output_list)} tasks remaining")
+    def ensemble_callback(model_res_combo):
+        for member in split_ensemble_result(model_res_combo):
+            callback(member)
 
-    # stop child processes
-    for i in range(NUMBER_OF_PROCESSES):
-        task_queue.put("STOP")
+    results = run_tasks_parallel(ensemble_tasks + separate_tasks, NUMBER_OF_PROCESSES, ensemble_callback if callback is not None else None)
 
-    return output_list
+    return [member for model_res_combo in results for member in split_ensemble_result(model_res_combo)]
 
 
 def run_tasks(task_list, callback=None) -> list[tuple]:
-    return run_tasks_parallel(task_list, 1, callable)
+    return run_tasks_parallel(task_list, 1, callback)
 
 
+# results are cached per task in ./savedata/cache (see result_cache), name is only used for messages
 def load_or_run(name: str, tasks: list[tuple], force_run=False) -> list[tuple]:
-    filename = f"{name}_{bad_hash_for_filename(tasks):.7g}"
+    return result_cache.load_or_run(name, tasks, run_tasks_parallel, force_run)
 
-    try:
-        if force_run:
-            raise Exception("force_run=True")
-        
-        loaded_data = np.load("./savedata/"+filename+".npy", allow_pickle=True)
-        print(f"Loading of {name} succeeded!")
-        return loaded_data
-    except Exception as e:
-        print(f"Failed loading of {name} because: " + str(e))
-        res = run_tasks_parallel(tasks)
-
-        print("Saving results")
-        np.save("./savedata/"+filename+".npy", res, allow_pickle=True)
-
-        return res
-
-
-def bad_hash_for_filename(tasks):
-    bad_hash = 0
-
-    for task in tasks:
-        params = task[1]
-        for key in params:
-            element = params[key]
-            if isinstance(element, (int, float)):
-                bad_hash += element
-            elif key == "initial_condition":
-                bad_hash += np.sum(element)
-    
-    bad_hash += len(tasks)
-    
-    return bad_hash
+
+# Warm starting: each task starts from the final state of a neighbouring task instead of its own
+# initial_condition, so nearby parameter values don't repeat the same transient
+# parents[i] is the index of the task i starts from (None to use its own initial_condition)
+# tasks run in waves, a task running once its parent has finished, and if the parent failed the
+# nearest finished ancestor is used
+# each started task's kvals records "warm_start_from" (the parent's label) and "warm_start_lineage"
+# (labels from the first task of the chain down to the parent) so a result can be reproduced
+# run_tasks is e.g. run_tasks_parallel, or a load_or_run, output is in the order of task_list
+def run_tasks_warm_start(task_list, parents: list, run_tasks=run_tasks_parallel) -> list[tuple]:
+    depth = [None] * len(task_list)
+    for i in range(len(task_list)):
+        chain = [i]
+        while parents[chain[-1]] is not None and depth[chain[-1]] is None:
+            chain.append(parents[chain[-1]])
+            assert len(chain) <= len(task_list), "parents of warm started tasks can't form a loop"
+        for j in reversed(chain):
+            depth[j] = 0 if parents[j] is None else depth[parents[j]] + 1
+
+    results = [None] * len(task_list)
+    for wave in range(max(depth, default=-1) + 1):
+        wave_tasks = []
+        for i in [i for i in range(len(task_list)) if depth[i] == wave]:
+            model, args = task_list[i]
+            args = {**args, "warm_start_index": i}
+
+            ancestor = parents[i]
+            while ancestor is not None and results[ancestor][1] == "FAILURE":
+                ancestor = parents[ancestor]
+            if ancestor is not None:
+                _, sol, kvals = results[ancestor]
+                label = kvals.get("label", f"task {ancestor}")
+                args.update({"initial_condition": np.array(sol.y[:, -1]), "warm_start_from": label,
+                             "warm_start_lineage": list(kvals.get("warm_start_lineage", [])) + [label]})
+            wave_tasks.append((model, args))
+
+        print(f"{time.time():.1f} Warm start wave {wave + 1}/{max(depth) + 1}, {len(wave_tasks)} tasks")
+        for res in run_tasks(wave_tasks):
+            results[res[2]["warm_start_index"]] = res
+
+    return results
+
+
+# parents for run_tasks_warm_start from the tasks' coordinates (e.g. their variation multipliers)
+# each task starts from its nearest task among those closer to seed, so chains grow outwards from seed
+def nearest_parents(coordinates: list, seed) -> list:
+    coordinates = np.asarray(coordinates, dtype=float).reshape(len(coordinates), -1)
+    from_seed = np.linalg.norm(coordinates - np.asarray(seed, dtype=float), axis=1)
+
+    parents = []
+    for i in range(len(coordinates)):
+        closer = np.flatnonzero(from_seed < from_seed[i])
+        if len(closer) == 0:
+            parents.append(None)
+        else:
+            parents.append(int(closer[np.argmin(np.linalg.norm(coordinates[closer] - coordinates[i], axis=1))]))
+    return parents
+
+
+# Staged evaluation of candidates, where cheap stages screen out candidates before the expensive ones
+# stages[k](candidate, results) gives the (model, args) task of stage k from the candidate and its results
+# of the earlier stages, or None to stop there (e.g. when the last result shows the candidate is far off)
+# stages run as a stream on one pool: a candidate's next stage is queued as soon as its previous one
+# finishes, so a slow task of one stage doesn't hold up the rest of the pipeline
+# results are cached per task as for load_or_run, output is each candidate's list of stage results
+def run_pipeline(name: str, candidates: list, stages: list, NUMBER_OF_PROCESSES=int(cpu_count()/1.5),
+                 force_run=False) -> list[list[tuple]]:
+    outputs = [[] for _ in candidates]
+
+    # next task of candidate i to run, taking stages that are already cached as they come
+    def advance(i):
+        while len(outputs[i]) < len(stages):
+            task = stages[len(outputs[i])](candidates[i], outputs[i])
+            if task is None:
+                return None
+            model, args = task
+            args = {**args, "pipeline_index": i, "pipeline_stage": len(outputs[i])}
+            key = result_cache.task_key(model, args)
+            cached = None if force_run else result_cache.load_result(key, args)
+            if cached is None:
+                return model, {**args, "task_key": key}
+            outputs[i].append(cached)
+        return None
+
+    def next_stage(res):
+        model, sol, kvals = res
+        if not sol == "FAILURE":
+            result_cache.save_result(kvals["task_key"], res)
+        outputs[kvals["pipeline_index"]].append(res)
+        task = advance(kvals["pipeline_index"])
+        return [] if task is None else [task]
+
+    first_tasks = [task for task in (advance(i) for i in range(len(candidates))) if task is not None]
+    print(f"{time.time():.1f} Pipeline {name}: {len(first_tasks)}/{len(candidates)} candidates have stages to run")
+    if len(first_tasks) > 0:
+        run_tasks_parallel(first_tasks, NUMBER_OF_PROCESSES, next_stage)
+
+    if result_cache.MAX_CACHE_BYTES is not None:
+        result_cache.prune(result_cache.MAX_CACHE_BYTES)
+
+    for stage in range(len(stages)):
+        print(f"{time.time():.1f} Pipeline {name}: {sum(len(output) > stage for output in outputs)} candidates reached stage {stage + 1}")
+
+    return outputs
@@ -0,0 +1,201 @@
+# Pseudo-arclength continuation of steady states in one parameter
+# Instead of a long time integration per parameter value, follow the curve F(U, p) = 0 from one
+# steady state, each step predicting along the tangent and correcting with a few Newton iterations
+# Because the curve is parametrised by arclength rather than p it carries on round folds, so both
+# stable branches of a bistable range are found, which a sweep from one initial condition misses
+#   branch = continuation.follow_branch(MODELS.PAR3ADD, {"Nx": 50}, "konA", 0.02)
+#   [(point["p"], point["polarity"], point["stable"]) for point in branch["points"]]
+import copy
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg
+from . import MODELS, model_to_module, steady_state, velocity
+from .metric_functions import polarity_measure
+
+# which species blocks of U are the membrane A and P for polarity_measure
+POLARITY_SPECIES = {MODELS.GOEHRING: (0, 1), MODELS.PAR3ADD: (2, 3), MODELS.CRUMBS: (1, 2), MODELS.TOSTEVIN: (0, 2)}
+
+MAX_CORRECTOR_ITERATIONS = 8
+
+# steps grow by STEP_GROWTH after an easy correction (at most EASY_ITERATIONS) and halve after a failed one
+EASY_ITERATIONS = 3
+STEP_GROWTH = 1.5
+
+
+# sign of the determinant of a sparse matrix from its LU factors, L has a unit diagonal
+def det_sign(lu):
+    def permutation_sign(perm):
+        # parity of a permutation from its cycle decomposition
+        seen = np.zeros(len(perm), dtype=bool)
+        sign = 1
+        for i in range(len(perm)):
+            if not seen[i]:
+                j, length = i, 0
+                while not seen[j]:
+                    seen[j] = True
+                    j = perm[j]
+                    length += 1
+                sign *= -1 if length % 2 == 0 else 1
+        return sign
+
+    return int(np.prod(np.sign(lu.U.diagonal())) * permutation_sign(lu.perm_r) * permutation_sign(lu.perm_c))
+
+
+# jacobian of (F(U, p), arclength condition) with respect to (U, p)
+def bordered_matrix(J, F_p, row):
+    return sparse.bmat([[J, sparse.csc_matrix(F_p[:, None])],
+                        [sparse.csr_matrix(row[None, :-1]), sparse.csr_matrix([[row[-1]]])]], format="csc")
+
+
+# Follows the steady states of model from args (which should be near a steady state, or is solved to one
+# with mode "steady_state") as kvals[key] moves towards p_end, stopping once p leaves the range between
+# its start and p_end or after max_steps
+# ds is the step in arclength, measured in p as a fraction of the range and in U as the rms change
+# returns {"parameter", "points", "folds", "branch_points"} where each point is a dict of
+# p, U, polarity, stable, max_real_eigenvalue (None above steady_state.MAX_STABILITY_SIZE) and kind,
+# one of "start", "regular", "fold" (p turns back) or "branch_point" (another branch crosses)
+def follow_branch(model: MODELS, args: dict, key: str, p_end: float, ds=0.02, ds_min=1e-4, ds_max=0.1,
+                  max_steps=200):
+    module = model_to_module(model)
+    kvals = module.setup_kvals(copy.deepcopy(args))
+    rhs, rhs_args = module.vectorised_rhs(kvals)
+    jac_U = module.jacobian if kvals["jacobian"] == "analytic" else module.sparsity_jacobian
+    tL = kvals["tL"]
+    tol = kvals["steady_state_tol"]
+
+    p_start = float(kvals[key])
+    p_range = p_end - p_start
+    if p_range == 0:
+        raise ValueError("p_end must differ from the starting value of " + key)
+
+    # parameters are changed in place in kvals, which rhs_args holds on to
+    def F(U, p):
+        kvals[key] = p
+        velocity.forget(kvals)
+        return rhs(tL, U, *rhs_args)
+
+    def jacobians(U, p):
+        kvals[key] = p
+        velocity.forget(kvals)
+        J = sparse.csc_matrix(jac_U(tL, U, *rhs_args))
+        h = np.sqrt(np.finfo(float).eps) * max(1, abs(p))
+        F_p = (F(U, p + h) - F(U, p)) / h
+        return J, F_p
+
+    # start from a steady state
+    U = np.asarray(kvals["initial_condition"], dtype=float)
+    if np.max(np.abs(F(U, p_start))) > tol:
+        sol, _ = module.run_model({**args, "mode": "steady_state"})
+        U = np.asarray(sol.y[:, -1], dtype=float)
+    n = len(U)
+
+    # arclength weights, scaled so U and p contribute comparably
+    w = np.concatenate([np.full(n, 1 / n), [1 / p_range ** 2]])
+
+    def point(U, p, kind, J):
+        a, b = POLARITY_SPECIES[model]
+        Nx = kvals["Nx"]
+        eigenvalue = steady_state.max_real_eigenvalue(J)
+        return {"p": p, "U": U.copy(), "kind": kind,
+                "polarity": polarity_measure(kvals["X"], U[a * Nx:(a + 1) * Nx], U[b * Nx:(b + 1) * Nx], Nx),
+                "stable": None if eigenvalue is None else bool(eigenvalue < tol), "max_real_eigenvalue": eigenvalue}
+
+    # initial tangent from F_U dU + F_p dp = 0 with dp towards p_end
+    p = p_start
+    J, F_p = jacobians(U, p)
+    dp = np.sign(p_range)
+    tangent = np.concatenate([linalg.spsolve(J, -F_p * dp), [dp]])
+    tangent /= np.sqrt(np.sum(w * tangent ** 2))
+
+    points = [point(U, p, "start", J)]
+    folds, branch_points = [], []
+    bordered_sign = None
+
+    for step in range(max_steps):
+        z = np.concatenate([U, [p]])
+
+        while True:
+            # predictor along the tangent, corrector on F = 0 plus the arclength condition
+            z_new = z + ds * tangent
+            converged = False
+            for iteration in range(MAX_CORRECTOR_ITERATIONS):
+                J, F_p = jacobians(z_new[:-1], z_new[-1])
+                G = np.concatenate([F(z_new[:-1], z_new[-1]), [np.sum(w * tangent * (z_new - z)) - ds]])
+                if np.max(np.abs(G[:-1])) < tol and abs(G[-1]) < 1e-9:
+                    converged = True
+                    break
+                dz = linalg.spsolve(bordered_matrix(J, F_p, w * tangent), -G)
+                if not np.all(np.isfinite(dz)):
+                    break
+                z_new = z_new + dz
+
+            if converged:
+                break
+            ds /= 2
+            if ds < ds_min:
+                return {"parameter": key, "points": points, "folds": folds, "branch_points": branch_points}
+
+        U_new, p_new = z_new[:-1], z_new[-1]
+
+        # new tangent from the bordered system, keeping the direction of travel
+        lu = linalg.splu(bordered_matrix(J, F_p, w * tangent))
+        new_tangent = lu.solve(np.concatenate([np.zeros(n), [1.0]]))
+        new_tangent /= np.sqrt(np.sum(w * new_tangent ** 2))
+
+        # a fold is where p turns back, a branch point is where the bordered determinant changes sign
+        kind = "regular"
+        if np.sign(new_tangent[-1]) != np.sign(tangent[-1]):
+            kind = "fold"
+            folds.append(p_new)
+        sign = det_sign(lu)
+        if bordered_sign is not None and sign != bordered_sign and kind != "fold":
+            kind = "branch_point"
+            branch_points.append(p_new)
+        bordered_sign = sign
+
+        tangent, U, p = new_tangent, U_new, p_new
+        points.append(point(U, p, kind, J))
+
+        if iteration <= EASY_ITERATIONS:
+            ds = min(ds * STEP_GROWTH, ds_max)
+
+        if not min(p_start, p_end) <= p <= max(p_start, p_end):
+            break
+
+    return {"parameter": key, "points": points, "folds": folds, "branch_points": branch_points}
+
+
+# ranges of p with more than one stable steady state on the branch, [(p_low, p_high),...]
+# the branch is split at its folds into pieces that each give at most one state per p
+def bistable_ranges(branch: dict) -> list[tuple]:
+    pieces, piece = [], []
+    for point in branch["points"]:
+        piece.append(point)
+        if point["kind"] == "fold":
+            pieces.append(piece)
+            piece = [point]
+    pieces.append(piece)
+
+    # stable intervals of p on each piece
+    stable = []
+    for piece in pieces:
+        intervals, current = [], []
+        for point in piece:
+            if point["stable"]:
+                current.append(point["p"])
+            elif len(current) > 0:
+                intervals.append((min(current), max(current)))
+                current = []
+        if len(current) > 0:
+            intervals.append((min(current), max(current)))
+        stable.append(intervals)
+
+    ranges = []
+    for i in range(len(stable)):
+        for j in range(i + 1, len(stable)):
+            for a in stable[i]:
+                for b in stable[j]:
+                    low, high = max(a[0], b[0]), min(a[1], b[1])
+                    if low < high:
+                        ranges.append((low, high))
+    return ranges
@@ -1,11 +1,13 @@
 # Expansion on the existing model by Goehring et al. 2011 in order to better represent the endometrial epithelia
-import time
+import functools
 from typing import Callable
 import numpy as np
-from matplotlib import pyplot as plt, animation
-from scipy import integrate
+from scipy import sparse
 
-from src.models.metric_functions import polarity_measure, orientation_marker, polarity_orientation, polarity_get_all
+from src.models import task_budget, steady_state
+from src.models.velocity import velocity
+from src.models.discretisation import diffusion_term, advection_term, RHSContext, diffusion_matrix, advection_matrix, \
+    rank_one, diag, simpson_weights, functional_gradient, local_sparsity, group_columns, grouped_jacobian, Ybar
 
 
 def default_v_func(kvals, x, t):
@@ -19,7 +21,11 @@ def default_v_func(kvals, x, t):
     return time_factor * peak * np.exp(-(x - center) ** 2 / (2 * sd ** 2))
 
 
-Ybar = lambda kvals, Y: 2 * integrate.simpson(Y, kvals["X"]) / kvals["L"]  # all of J,A,P-bar
+# only time_factor depends on t, so velocity.VelocityField can scale one profile instead of recomputing it
+default_v_func.separable = True
+
+
+# Ybar (from discretisation) gives all of J,A,P-bar
 def default_J_cyto(kvals, J): return kvals["rho_J"] - kvals["psi"] * Ybar(kvals, J)
 def default_A_cyto(kvals, A): return kvals["rho_A"] - kvals["psi"] * Ybar(kvals, A)
 def default_P_cyto(kvals, P): return kvals["rho_P"] - kvals["psi"] * Ybar(kvals, P)
@@ -77,6 +83,28 @@ DEFAULT_PARAMETERS = {
     "p_1": 0.05,  # P + P -> P
     "k_CJ": 1,
 
+    # "vectorised" evaluates the right hand side over whole arrays, "loop" goes point by point
+    "rhs_mode": "vectorised",
+    # "analytic" passes jacobian to the solver, "sparsity" passes sparsity_jacobian (grouped finite differences)
+    # None leaves BDF to estimate it by finite differences
+    "jacobian": "analytic",
+
+    # "integrate" solves over [t0, tL], "steady_state" integrates for steady_state_transient then solves
+    # for the steady state directly (see steady_state.py), stopping at max|dU/dt| < steady_state_tol
+    "mode": "integrate",
+    "steady_state_transient": 100,
+    "steady_state_tol": 1e-9,
+    # with mode "integrate", stop once max|dU/dt| < steady_state_event_tol for steady_state_event_window
+    # and pad the output with the settled state, None to always integrate to tL
+    "steady_state_event_tol": None,
+    "steady_state_event_window": 100,
+
+    # limits on the solve, None for no limit, see task_budget
+    "max_seconds": None,
+    "max_nfev": None,
+    "min_step": None,
+    "divergence_bounds": (-100, 100),  # stop if any value leaves these, numerical issues can otherwise run forever
+
     # R_X
     # Xbar
     "J_cyto": default_J_cyto,
@@ -118,12 +146,6 @@ R_C = lambda kvals, J, A, P, C, C_cyto_r, t, x_i: A[x_i] * (
 def odefunc(t, U, kvals):
     assert len(U) == 4 * kvals["Nx"]
 
-    # Failure so odefunc doesn't run forever trying to fix numerical issues
-    if min(U) < -100 or max(U) > 100:
-        print(f"FAILURE with par3addition labelled {kvals['label']} at simulation time {t:.4f}")
-        # plot_failure(U, t, kvals)
-        raise AssertionError
-
     J = U[:kvals["Nx"]]
     A = U[kvals["Nx"]:2*kvals["Nx"]]
     P = U[2*kvals["Nx"]:3*kvals["Nx"]]
@@ -140,15 +162,19 @@ def odefunc(t, U, kvals):
     P_cyto_r = kvals["P_cyto"](kvals, P)
     C_cyto_r = kvals["C_cyto"](kvals, C)
 
+    # v_func on the grid, zero when there's no advection
+    v = velocity(kvals, t)
+    v = np.zeros(kvals["Nx"]) if v is None else v
+
     # manually handle right boundary ( x_i = Nx-1 ) since v(x,t) is odd
     # reflect Nx over Nx-1 to Nx-2; for v_func, also negate on the reflection as v(x)=-v(-x)
     dudt_J[kvals["Nx"]-1] = kvals["D_J"] * disc_diffusion_term(kvals, J, kvals["Nx"]-1) \
-        - (-kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-2], t) * J[kvals["Nx"]-2] - kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-1], t) * J[kvals["Nx"]-1]) / kvals["deltax"] \
+        - (-v[kvals["Nx"]-2] * J[kvals["Nx"]-2] - v[kvals["Nx"]-1] * J[kvals["Nx"]-1]) / kvals["deltax"] \
         + R_J(kvals, J, A, P, C, J_cyto_r, t, kvals["Nx"]-1)
     dudt_A[kvals["Nx"]-1] = kvals["D_A"] * disc_diffusion_term(kvals, A, kvals["Nx"]-1) \
         + R_A(kvals, J, A, P, C, A_cyto_r, t, kvals["Nx"]-1)
     dudt_P[kvals["Nx"]-1] = kvals["D_P"] * disc_diffusion_term(kvals, P, kvals["Nx"]-1) \
-        - (-kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-2], t) * P[kvals["Nx"]-2] - kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-1], t) * P[kvals["Nx"]-1]) / kvals["deltax"] \
+        - (-v[kvals["Nx"]-2] * P[kvals["Nx"]-2] - v[kvals["Nx"]-1] * P[kvals["Nx"]-1]) / kvals["deltax"] \
         + R_P(kvals, J, A, P, C, P_cyto_r, t, kvals["Nx"]-1)
     dudt_C[kvals["Nx"]-1] = kvals["D_C"] * disc_diffusion_term(kvals, C, kvals["Nx"]-1) \
         + R_C(kvals, J, A, P, C, C_cyto_r, t, kvals["Nx"]-1)
@@ -157,12 +183,12 @@ def odefunc(t, U, kvals):
     # diffusion function handles left boundary
     for x_i in np.arange(0, kvals["Nx"] - 1):
         dudt_J[x_i] = kvals["D_J"] * disc_diffusion_term(kvals, J, x_i) \
-            - kvals["sigma_J"] * disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t) * J[x_ii], x_i) \
+            - kvals["sigma_J"] * disc_spatial_derivative(kvals, lambda x_ii: v[x_ii] * J[x_ii], x_i) \
             + R_J(kvals, J, A, P, C, J_cyto_r, t, x_i)
         dudt_A[x_i] = kvals["D_A"] * disc_diffusion_term(kvals, A, x_i) \
             + R_A(kvals, J, A, P, C, A_cyto_r, t, x_i)
         dudt_P[x_i] = kvals["D_P"] * disc_diffusion_term(kvals, P, x_i) \
-            - kvals["sigma_P"] * disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t) * P[x_ii], x_i) \
+            - kvals["sigma_P"] * disc_spatial_derivative(kvals, lambda x_ii: v[x_ii] * P[x_ii], x_i) \
             + R_P(kvals, J, A, P, C, P_cyto_r, t, x_i)
         dudt_C[x_i] = kvals["D_C"] * disc_diffusion_term(kvals, C, x_i) \
             + R_C(kvals, J, A, P, C, C_cyto_r, t, x_i)
@@ -170,7 +196,124 @@ def odefunc(t, U, kvals):
     return dudt_J + dudt_A + dudt_P + dudt_C
 
 
-def run_model(args=None):
+# the nonlocal cytoplasmic values [J_cyto_r, A_cyto_r, P_cyto_r, C_cyto_r]
+def cytoplasm_pools(U, kvals):
+    Nx = kvals["Nx"]
+    return np.array([kvals["J_cyto"](kvals, U[:Nx]), kvals["A_cyto"](kvals, U[Nx:2*Nx]),
+                     kvals["P_cyto"](kvals, U[2*Nx:3*Nx]), kvals["C_cyto"](kvals, U[3*Nx:])])
+
+
+# same system as odefunc but evaluated over the whole grid at once
+# results are written into the preallocated buffer held by ctx (an RHSContext for 4 species)
+# pools overrides cytoplasm_pools(U), used to hold them fixed for sparsity_jacobian
+def odefunc_vectorised(t, U, kvals, ctx, pools=None):
+    Nx = kvals["Nx"]
+
+    assert len(U) == 4 * Nx
+
+    J = U[:Nx]
+    A = U[Nx:2*Nx]
+    P = U[2*Nx:3*Nx]
+    C = U[3*Nx:]
+
+    dudt_J, dudt_A, dudt_P, dudt_C = ctx.species
+
+    # r is for "resolved"
+    J_cyto_r, A_cyto_r, P_cyto_r, C_cyto_r = cytoplasm_pools(U, kvals) if pools is None else pools
+
+    v = velocity(kvals, t)
+    deltax = kvals["deltax"]
+
+    # reactions with the shared factor pulled out, R_A's saturating term is an elementwise minimum
+    dudt_J[:] = kvals["D_J"]*diffusion_term(J, deltax) + advection_term(v, J, deltax, kvals["sigma_J"]) \
+        + kvals["k_onJ"]*J_cyto_r - J*(kvals["k_JP"]*P**kvals["gamma"] + kvals["k_CJ"]*C**2)
+    dudt_A[:] = kvals["D_A"]*diffusion_term(A, deltax) \
+        - kvals["k_offA"]*A + np.minimum(C*A, kvals["k_offA"]*A) + kvals["k_AJ"]*J**kvals["alpha"]*A_cyto_r
+    dudt_P[:] = kvals["D_P"]*diffusion_term(P, deltax) + advection_term(v, P, deltax, kvals["sigma_P"]) \
+        + kvals["k_onP"]*P_cyto_r - P*(kvals["k_offP"] + kvals["k_PA"]*A**kvals["beta"] + kvals["p_c"]*C
+                                       - kvals["p_1"]*(1 - P/kvals["rho_P"]))
+    dudt_C[:] = kvals["D_C"]*diffusion_term(C, deltax) \
+        + A*(kvals["c_1"]*J*C_cyto_r + kvals["c_2"]*A*C*(1 - C/kvals["rho_C"])) - kvals["c_3"]*P*C
+
+    return ctx.result()
+
+
+# gradient of a cytoplasm function with respect to its membrane species
+def cyto_gradient(kvals, cyto_func, default_cyto_func, Y):
+    if cyto_func is default_cyto_func:
+        return -kvals["psi"] * 2 * simpson_weights(kvals["X"]) / kvals["L"]
+    return functional_gradient(lambda Y_h: cyto_func(kvals, Y_h), Y)
+
+
+# analytic jacobian of odefunc as a sparse matrix
+# the cytoplasmic terms couple every point of a species, giving dense rank one blocks
+# ctx is unused, it is accepted so jacobian can share solve_ivp's args with odefunc_vectorised
+def jacobian(t, U, kvals, ctx=None):
+    Nx = kvals["Nx"]
+    J = U[:Nx]
+    A = U[Nx:2*Nx]
+    P = U[2*Nx:3*Nx]
+    C = U[3*Nx:]
+
+    A_cyto_r = kvals["A_cyto"](kvals, A)
+    C_cyto_r = kvals["C_cyto"](kvals, C)
+
+    L = diffusion_matrix(Nx, kvals["deltax"])
+    v = velocity(kvals, t)
+
+    # branch taken by the saturating minimum in R_A
+    CA_smaller = C*A <= kvals["k_offA"]*A
+
+    dJ_dJ = kvals["D_J"]*L + advection_matrix(v, Nx, kvals["deltax"], kvals["sigma_J"]) \
+        + diag(-kvals["k_JP"]*P**kvals["gamma"] - kvals["k_CJ"]*C**2, Nx) \
+        + rank_one(kvals["k_onJ"], cyto_gradient(kvals, kvals["J_cyto"], default_J_cyto, J))
+    dJ_dP = diag(-kvals["k_JP"]*kvals["gamma"]*P**(kvals["gamma"] - 1)*J, Nx)
+    dJ_dC = diag(-2*kvals["k_CJ"]*C*J, Nx)
+
+    dA_dJ = diag(kvals["k_AJ"]*kvals["alpha"]*J**(kvals["alpha"] - 1)*A_cyto_r, Nx)
+    dA_dA = kvals["D_A"]*L + diag(-kvals["k_offA"] + np.where(CA_smaller, C, kvals["k_offA"]), Nx) \
+        + rank_one(kvals["k_AJ"]*J**kvals["alpha"], cyto_gradient(kvals, kvals["A_cyto"], default_A_cyto, A))
+    dA_dC = diag(np.where(CA_smaller, A, 0), Nx)
+
+    dP_dA = diag(-kvals["k_PA"]*kvals["beta"]*A**(kvals["beta"] - 1)*P, Nx)
+    dP_dP = kvals["D_P"]*L + advection_matrix(v, Nx, kvals["deltax"], kvals["sigma_P"]) \
+        + diag(-kvals["k_offP"] - kvals["k_PA"]*A**kvals["beta"] - kvals["p_c"]*C
+               + kvals["p_1"]*(1 - 2*P/kvals["rho_P"]), Nx) \
+        + rank_one(kvals["k_onP"], cyto_gradient(kvals, kvals["P_cyto"], default_P_cyto, P))
+    dP_dC = diag(-kvals["p_c"]*P, Nx)
+
+    dC_dJ = diag(kvals["c_1"]*A*C_cyto_r, Nx)
+    dC_dA = diag(kvals["c_1"]*J*C_cyto_r + 2*kvals["c_2"]*A*C*(1 - C/kvals["rho_C"]), Nx)
+    dC_dP = diag(-kvals["c_3"]*C, Nx)
+    dC_dC = kvals["D_C"]*L + diag(kvals["c_2"]*A**2*(1 - 2*C/kvals["rho_C"]) - kvals["c_3"]*P, Nx) \
+        + rank_one(kvals["c_1"]*A*J, cyto_gradient(kvals, kvals["C_cyto"], default_C_cyto, C))
+
+    return sparse.bmat([[dJ_dJ, None, dJ_dP, dJ_dC],
+                        [dA_dJ, dA_dA, None, dA_dC],
+                        [None, dP_dA, dP_dP, dP_dC],
+                        [dC_dJ, dC_dA, dC_dP, dC_dC]], format="csc")
+
+
+# pattern of odefunc's jacobian with the cytoplasmic pools held fixed, and its column groups
+@functools.lru_cache
+def jac_sparsity(Nx):
+    pattern = local_sparsity(Nx, [[1, 0, 1, 1],
+                                  [1, 1, 0, 1],
+                                  [0, 1, 1, 1],
+                                  [1, 1, 1, 1]])
+    return pattern, group_columns(pattern)
+
+
+# finite difference jacobian needing one call per column group plus one per cytoplasmic pool
+# ctx is created if missing so this also works alongside the loop odefunc
+def sparsity_jacobian(t, U, kvals, ctx=None):
+    ctx = RHSContext(4, kvals["Nx"]) if ctx is None else ctx
+    return grouped_jacobian(lambda Y, pools: odefunc_vectorised(t, Y, kvals, ctx, pools),
+                            lambda Y: cytoplasm_pools(Y, kvals), U, *jac_sparsity(kvals["Nx"]))
+
+
+# kvals for a run: the parameters plus the grid, output times and initial condition
+def setup_kvals(args=None):
     if args is None:
         args = {}
     params = {**DEFAULT_PARAMETERS, **args}
@@ -178,6 +321,7 @@ def run_model(args=None):
     # calculate other widely used values
     X = np.linspace(params["x0"], params["xL"], params["Nx"])
     deltax = np.abs(X[1] - X[0])
+    simpson_weights(X)  # worked out once here for Ybar on every right hand side call
 
     # key values
     kvals: dict = {**params, "X": X, "deltax": deltax}
@@ -188,101 +332,35 @@ def run_model(args=None):
     # default initial condition (just all 0) if none passed
     kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else [0]*(kvals["Nx"]*4)
 
-    sol = integrate.solve_ivp(odefunc, [kvals["t0"], kvals["tL"]], kvals["initial_condition"], method="BDF",
-                              t_eval=kvals["t_eval"], args=(kvals,))
+    return kvals
+
+
+# right hand side and its extra solve_ivp args for rhs_mode "vectorised"
+# batch_shape sizes any output buffer for a stack of states (n, ...), as used by ensemble.py
+def vectorised_rhs(kvals, batch_shape=()):
+    return odefunc_vectorised, (kvals, RHSContext(4, kvals["Nx"], batch_shape=batch_shape))
+
+
+def run_model(args=None):
+    kvals = setup_kvals(args)
+
+    rhs, rhs_args = vectorised_rhs(kvals) if kvals["rhs_mode"] == "vectorised" else (odefunc, (kvals,))
+
+    jac = {"analytic": jacobian, "sparsity": sparsity_jacobian}.get(kvals["jacobian"])
+
+    if kvals["mode"] == "steady_state":
+        return steady_state.solve(kvals, rhs, rhs_args, jac, jac or sparsity_jacobian), kvals
+
+    sol = steady_state.integrate(kvals, rhs, kvals["initial_condition"], method="BDF", args=rhs_args, jac=jac)
 
     return sol, kvals
 
 
-# Plotting
-def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
-    if file_code is None:
-        file_code = f'{time.time_ns()}'[5:]
-
-    # rescale so maximal protein quantity is 1
-    scalar = 1 if not rescale else np.max(sol.y)
-    v_rescale_for_visibility = np.max(sol.y)/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
-
-    # J = U[:kvals["Nx"]]
-    # A = U[kvals["Nx"]:2 * kvals["Nx"]]
-    # P = U[2 * kvals["Nx"]:3*kvals["Nx"]]
-    # C = U[3 * kvals["Nx"]:]
-    fig, ax = plt.subplots()
-    line1, = ax.plot(kvals["X"], sol.y[:kvals["Nx"], 0]/scalar, label="par3", color="green")
-    line2, = ax.plot(kvals["X"], sol.y[kvals["Nx"]:2*kvals["Nx"], 0]/scalar, label="anterior", color="blue")
-    line3, = ax.plot(kvals["X"], sol.y[2*kvals["Nx"]:3*kvals["Nx"], 0]/scalar, label="posterior", color="orange")
-    line4, = ax.plot(kvals["X"], sol.y[3*kvals["Nx"]:, 0]/scalar, label="crumbs", color="red")
-    p_m = 0 #polarity_measure(kvals["X"], sol.y[:kvals["Nx"], 0], sol.y[kvals["Nx"]:, 0], kvals["Nx"])
-    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
-    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,np.max(sol.y)/scalar+0.05], xlabel="x", ylabel="par3,A/P,crb")
-    ax.legend()
-
-    def animate(t_i):
-        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
-        line1.set_ydata(sol.y[:kvals["Nx"], t_i]/scalar)
-        line2.set_ydata(sol.y[kvals["Nx"]:2*kvals["Nx"], t_i]/scalar)
-        line3.set_ydata(sol.y[2*kvals["Nx"]:3*kvals["Nx"], t_i]/scalar)
-        line4.set_ydata(sol.y[3*kvals["Nx"]:, t_i]/scalar)
-        p_m = 0 #polarity_measure(kvals["X"], sol.y[:kvals["Nx"], t_i], sol.y[kvals["Nx"]:, t_i], kvals["Nx"])
-        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
-        return (line1, line2, line3, line4, linev, time_label)
-
-    ani = animation.FuncAnimation(fig, animate, interval=5000/len(sol.t), blit=True, frames=len(sol.t))
-
-    if save_file:
-        file_name = f"{file_code}_spatialPar.mp4"
-        print(f"Saving animation to {file_name}")
-        ani.save(file_name)
-
-    plt.show(block=False)
-
-
-def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
-    plt.figure()
-    ax = plt.subplot()
-
-    # add then remove plot with xticks so that they get ordered correctly in the figure
-    sentinel, = ax.plot(x_axis_labels, [0.5]*len(x_axis_labels))
-    sentinel.remove()
-
-    for i in np.arange(0, len(variation_sets)):
-        variation = variation_sets[i]
-        sol_list = variation[0]
-        kvals_list = variation[1]
-
-        polarity_m_list = []
-        xticks = []
-        if len(variation_sets) > 7:
-            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
-        else:
-            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
-
-        for j in np.arange(0, len(sol_list)):
-            sol = sol_list[j]
-            kvals = kvals_list[j]
-
-            if not sol == "FAILURE":
-                p_measure, _p_orientation, p_marker = polarity_get_all(kvals["X"], sol.y[kvals["Nx"]:2*kvals["Nx"], -1], sol.y[2*kvals["Nx"]:3*kvals["Nx"], -1], kvals["Nx"])
-
-                xtick = x_axis_labels[j] if x_axis_labels is not None else j
-                marker = 'o' if not show_orientation else p_marker
-
-                # jitter the near-0 values so they are visible
-                if p_measure<0.02:
-                    p_measure += 0.02*i/len(variation_sets)-0.01
-
-                polarity_m_list.append(p_measure)
-                xticks.append(xtick)
-                ax.scatter(xtick, p_measure, color=color, marker=marker, s=100)
-
-        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
-        # TODO - check what label above is using and if it is what we want
-
-    ax.legend()
-    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
-    ax.title.set_text(label)
-    plt.show(block=False)
\ No newline at end of file
+# Plotting functions are in crumbs_plots, imported on first use of one through this module
+# (e.g. crumbs.animate_plot) so that solving doesn't import matplotlib
+def __getattr__(attr):
+    if not attr.startswith("__"):
+        from . import crumbs_plots
+        if hasattr(crumbs_plots, attr):
+            return getattr(crumbs_plots, attr)
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
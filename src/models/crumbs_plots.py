@@ -0,0 +1,102 @@
+# Plotting for crumbs, kept out of the model module so runs don't import matplotlib
+import time
+import numpy as np
+from matplotlib import pyplot as plt, animation
+
+from src.models.metric_functions import orientation_marker, polarity_of_results
+from src.models.crumbs import DEFAULT_PARAMETERS
+
+
+def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
+    if file_code is None:
+        file_code = f'{time.time_ns()}'[5:]
+
+    # rescale so maximal protein quantity is 1
+    scalar = 1 if not rescale else np.max(sol.y)
+    v_rescale_for_visibility = np.max(sol.y)/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
+
+    # J = U[:kvals["Nx"]]
+    # A = U[kvals["Nx"]:2 * kvals["Nx"]]
+    # P = U[2 * kvals["Nx"]:3*kvals["Nx"]]
+    # C = U[3 * kvals["Nx"]:]
+    fig, ax = plt.subplots()
+    line1, = ax.plot(kvals["X"], sol.y[:kvals["Nx"], 0]/scalar, label="par3", color="green")
+    line2, = ax.plot(kvals["X"], sol.y[kvals["Nx"]:2*kvals["Nx"], 0]/scalar, label="anterior", color="blue")
+    line3, = ax.plot(kvals["X"], sol.y[2*kvals["Nx"]:3*kvals["Nx"], 0]/scalar, label="posterior", color="orange")
+    line4, = ax.plot(kvals["X"], sol.y[3*kvals["Nx"]:, 0]/scalar, label="crumbs", color="red")
+    p_m = 0 #polarity_measure(kvals["X"], sol.y[:kvals["Nx"], 0], sol.y[kvals["Nx"]:, 0], kvals["Nx"])
+    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
+    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
+
+    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+
+    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,np.max(sol.y)/scalar+0.05], xlabel="x", ylabel="par3,A/P,crb")
+    ax.legend()
+
+    def animate(t_i):
+        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
+        line1.set_ydata(sol.y[:kvals["Nx"], t_i]/scalar)
+        line2.set_ydata(sol.y[kvals["Nx"]:2*kvals["Nx"], t_i]/scalar)
+        line3.set_ydata(sol.y[2*kvals["Nx"]:3*kvals["Nx"], t_i]/scalar)
+        line4.set_ydata(sol.y[3*kvals["Nx"]:, t_i]/scalar)
+        p_m = 0 #polarity_measure(kvals["X"], sol.y[:kvals["Nx"], t_i], sol.y[kvals["Nx"]:, t_i], kvals["Nx"])
+        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
+        return (line1, line2, line3, line4, linev, time_label)
+
+    ani = animation.FuncAnimation(fig, animate, interval=5000/len(sol.t), blit=True, frames=len(sol.t))
+
+    if save_file:
+        file_name = f"{file_code}_spatialPar.mp4"
+        print(f"Saving animation to {file_name}")
+        ani.save(file_name)
+
+    plt.show(block=False)
+
+
+def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
+    plt.figure()
+    ax = plt.subplot()
+
+    # add then remove plot with xticks so that they get ordered correctly in the figure
+    sentinel, = ax.plot(x_axis_labels, [0.5]*len(x_axis_labels))
+    sentinel.remove()
+
+    for i in np.arange(0, len(variation_sets)):
+        variation = variation_sets[i]
+        sol_list = variation[0]
+        kvals_list = variation[1]
+
+        polarity_m_list = []
+        xticks = []
+        if len(variation_sets) > 7:
+            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+        else:
+            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+
+        p_measure_all, p_orientation_all = polarity_of_results(sol_list, kvals_list, 4, 1, 2)
+
+        for j in np.arange(0, len(sol_list)):
+            sol = sol_list[j]
+            kvals = kvals_list[j]
+
+            if not sol == "FAILURE":
+                p_measure = p_measure_all[j]
+
+                xtick = x_axis_labels[j] if x_axis_labels is not None else j
+                marker = 'o' if not show_orientation else orientation_marker(p_orientation_all[j])
+
+                # jitter the near-0 values so they are visible
+                if p_measure<0.02:
+                    p_measure += 0.02*i/len(variation_sets)-0.01
+
+                polarity_m_list.append(p_measure)
+                xticks.append(xtick)
+                ax.scatter(xtick, p_measure, color=color, marker=marker, s=100)
+
+        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
+        # TODO - check what label above is using and if it is what we want
+
+    ax.legend()
+    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
+    ax.title.set_text(label)
+    plt.show(block=False)
\ No newline at end of file
@@ -0,0 +1,227 @@
+# Array versions of the finite difference stencils used by the models
+# Space is always the first axis, so Y can be a single profile (Nx,)
+# or a stack of profiles (Nx, ...) that share the same grid
+import numpy as np
+from scipy import integrate, sparse
+
+
+# broadcast a per-point array (e.g. v on the grid) against Y along the spatial axis
+def expand_to(a, Y):
+    a = np.asarray(a)
+    return a.reshape(a.shape + (1,) * (np.ndim(Y) - a.ndim)) if a.ndim > 0 else a
+
+
+# equivalent of disc_diffusion_term over the whole grid
+# reflecting boundaries: Y[-1] -> Y[1] and Y[Nx] -> Y[Nx-2]
+def diffusion_term(Y, deltax):
+    lap = np.empty_like(Y, dtype=float)
+    lap[1:-1] = Y[2:] - 2 * Y[1:-1] + Y[:-2]
+    lap[0] = 2 * (Y[1] - Y[0])
+    lap[-1] = 2 * (Y[-2] - Y[-1])
+    return lap / deltax ** 2
+
+
+# equivalent of -disc_spatial_derivative(v*Y) over the whole grid
+# v(x,t) is odd so on the right boundary the reflected flux is negated, v(x)=-v(-x)
+# sigma scales the internal points only, as in the loop versions the right boundary is left unscaled
+# v is None for no advection (see velocity.velocity)
+def advection_term(v, Y, deltax, sigma=1):
+    if v is None:
+        return 0
+    flux = expand_to(v, Y) * Y
+    div = np.empty_like(Y, dtype=float)
+    div[:-1] = sigma * (flux[1:] - flux[:-1])
+    div[-1] = -flux[-2] - flux[-1]
+    return -div / deltax
+
+
+# Jacobian building blocks (sparse, Nx by Nx)
+
+# derivative of diffusion_term with respect to Y
+def diffusion_matrix(Nx, deltax):
+    lower = np.ones(Nx - 1)
+    upper = np.ones(Nx - 1)
+    lower[-1] = 2  # right boundary reflects Y[Nx] to Y[Nx-2]
+    upper[0] = 2  # left boundary reflects Y[-1] to Y[1]
+    return sparse.diags([lower, np.full(Nx, -2.0), upper], [-1, 0, 1], format="csr") / deltax ** 2
+
+
+# derivative of advection_term with respect to Y for a fixed v on the grid
+def advection_matrix(v, Nx, deltax, sigma=1):
+    if v is None:
+        return sparse.csr_matrix((Nx, Nx))
+    v = np.broadcast_to(np.asarray(v, dtype=float), (Nx,))
+    diag = sigma * v
+    diag[-1] = v[-1]
+    lower = np.zeros(Nx - 1)
+    lower[-1] = v[-2]
+    return sparse.diags([lower, diag, -sigma * v[1:]], [-1, 0, 1], format="csr") / deltax
+
+
+# dense rank one block u_i * g_j, e.g. a local reaction rate times the gradient of a cytoplasmic pool
+def rank_one(u, g):
+    return sparse.csr_matrix(np.outer(np.broadcast_to(u, np.shape(g)), g))
+
+
+def diag(d, Nx):
+    return sparse.diags(np.broadcast_to(np.asarray(d, dtype=float), (Nx,)), format="csr")
+
+
+# simpson_weights of the grids seen so far, by the grid array itself and by its values
+# a run passes the same X on every call, so the identity lookup is usually all it takes
+weights_of_grid_id = {}
+weights_of_grid_values = {}
+MAX_GRIDS_BY_ID = 64
+
+
+# integrate.simpson is linear in Y so its weights are the integrals of the unit vectors
+# worked out once per grid, the returned array is read only
+def simpson_weights(X):
+    entry = weights_of_grid_id.get(id(X))
+    if entry is not None and entry[0] is X:
+        return entry[1]
+
+    X_values = np.asarray(X, dtype=float)
+    key = X_values.tobytes()
+    weights = weights_of_grid_values.get(key)
+    if weights is None:
+        weights = integrate.simpson(np.eye(len(X_values)), x=X_values)
+        weights.setflags(write=False)
+        weights_of_grid_values[key] = weights
+
+    if len(weights_of_grid_id) >= MAX_GRIDS_BY_ID:
+        weights_of_grid_id.clear()
+    weights_of_grid_id[id(X)] = (X, weights)  # holding X keeps its id from being reused
+    return weights
+
+
+# 2/L times the integral of Y over the grid, the membrane average in the models' cytoplasmic pools
+# a dot product with simpson_weights, equal to 2 * integrate.simpson(Y, x=X, axis=0) / L
+# integrates along the first axis so a stack of profiles (Nx, ...) gives one value per profile
+def Ybar(kvals, Y):
+    return 2 * np.tensordot(simpson_weights(kvals["X"]), Y, axes=(0, 0)) / kvals["L"]
+
+
+# forward difference gradient of a scalar function of a profile
+# used for user supplied cytoplasm functions which have no analytic derivative
+def functional_gradient(func, Y):
+    Y = np.asarray(Y, dtype=float)
+    f0 = func(Y)
+    grad = np.empty(len(Y))
+    for j in range(len(Y)):
+        h = np.sqrt(np.finfo(float).eps) * max(1, abs(Y[j]))
+        Y_h = Y.copy()
+        Y_h[j] += h
+        grad[j] = (func(Y_h) - f0) / h
+    return grad
+
+
+# per-run workspace for the vectorised right hand sides
+# out is allocated once and each species' rates are written into its view in species
+# n_extra leaves room for non-spatial variables after the species (e.g. tostevin's l)
+# batch_shape adds trailing axes for a stack of states, e.g. (K,) for an ensemble of K runs
+class RHSContext:
+    def __init__(self, n_species, Nx, n_extra=0, batch_shape=()):
+        self.out = np.empty((n_species * Nx + n_extra,) + tuple(batch_shape))
+        self.species = [self.out[i * Nx:(i + 1) * Nx] for i in range(n_species)]
+        self.extra = self.out[n_species * Nx:]
+
+    # solve_ivp keeps hold of previous f values (e.g. for finite difference jacobians)
+    # so hand back a copy rather than the buffer that the next call overwrites
+    def result(self):
+        return self.out.copy()
+
+
+# Finite difference jacobians from the model structure
+
+# sparsity pattern of the local terms for species stacked as [Y_0, Y_1, ...]
+# coupling[i][j] is true if species i's rates depend on species j at the same point
+# a species always depends on its own neighbours (tridiagonal) through diffusion and advection
+def local_sparsity(Nx, coupling):
+    tridiagonal = sparse.diags([1.0, 1.0, 1.0], [-1, 0, 1], shape=(Nx, Nx), format="csr")
+    point = sparse.identity(Nx, format="csr")
+    return sparse.bmat([[tridiagonal if i == j else point if coupling[i][j] else None
+                         for j in range(len(coupling))] for i in range(len(coupling))], format="csc")
+
+
+# greedily assign columns to groups whose columns share no rows
+# columns in a group can be perturbed together in one right hand side call
+def group_columns(pattern):
+    pattern = sparse.csc_matrix(pattern)
+    n_rows, n_cols = pattern.shape
+    groups = np.empty(n_cols, dtype=int)
+    group_rows = []
+
+    for j in range(n_cols):
+        rows = pattern.indices[pattern.indptr[j]:pattern.indptr[j + 1]]
+        for g, used in enumerate(group_rows):
+            if not used[rows].any():
+                break
+        else:
+            g = len(group_rows)
+            group_rows.append(np.zeros(n_rows, dtype=bool))
+        group_rows[g][rows] = True
+        groups[j] = g
+
+    return groups
+
+
+# gradient of each pool with respect to its own member's state, shape (n_pools, K, n) for U of shape (n, K)
+# tries all perturbed states at once as a stack (n, n, K), the member axis kept last so per-member
+# parameters of a stacked ensemble still line up, cytoplasm functions that integrate along the first
+# axis handle that, otherwise falls back to one call per perturbed point
+def pools_gradient(pools_func, U, pools, h):
+    n, K = U.shape
+    U_h = np.repeat(U[:, None, :], n, axis=1)
+    U_h[np.arange(n), np.arange(n), :] += h
+    try:
+        pools_h = np.asarray(pools_func(U_h), dtype=float)
+        if pools_h.shape != (len(pools), n, K):
+            raise ValueError("pools_func does not broadcast over a stack")
+    except (ValueError, TypeError, IndexError):
+        pools_h = np.stack([np.asarray(pools_func(U_h[:, j]), dtype=float).reshape(len(pools), K)
+                            for j in range(n)], axis=1)
+    return np.transpose(pools_h - pools[:, None, :], (0, 2, 1)) / h.T
+
+
+# jacobian of fun(U, pools) + its dependence on pools_func(U)
+# fun is the right hand side with the cytoplasmic pools (the nonlocal scalars) passed in
+# with the pools held fixed the rates are local, so pattern is sparse and each column group costs one call
+# the pools then add back dense rank one terms (d rates / d pool) * (d pool / dU)
+# U can also be a stack (n, K) of independent states (an ensemble), then every call covers all of them
+# and the result is block diagonal with the states one after another
+def grouped_jacobian(fun, pools_func, U, pattern, groups):
+    U = np.asarray(U, dtype=float)
+    batch_shape = U.shape[1:]
+    n = U.shape[0]
+    U_nk = U.reshape(n, -1)
+    K = U_nk.shape[1]
+
+    pools = np.asarray(pools_func(U), dtype=float).reshape(-1, K)
+    pools_shape = (len(pools),) + batch_shape
+    f0 = fun(U, pools.reshape(pools_shape)).reshape(n, K)
+    h = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.abs(U_nk))
+
+    df = np.empty((n, K, groups.max() + 1))
+    for g in range(df.shape[2]):
+        U_h = U_nk + h * (groups == g)[:, None]
+        df[:, :, g] = fun(U_h.reshape(U.shape), pools.reshape(pools_shape)).reshape(n, K) - f0
+
+    rows = pattern.indices
+    cols = np.repeat(np.arange(n), np.diff(pattern.indptr))
+    values = df[rows, :, groups[cols]] / h[cols]  # (nnz, K)
+    offsets = n * np.arange(K)
+    local = sparse.csc_matrix((values.T.ravel(), ((rows + offsets[:, None]).ravel(), (cols + offsets[:, None]).ravel())),
+                              shape=(n * K, n * K))
+
+    df_dpools = np.empty((n, K, len(pools)))
+    for p in range(len(pools)):
+        h_p = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.abs(pools[p]))
+        pools_h = pools.copy()
+        pools_h[p] += h_p
+        df_dpools[:, :, p] = (fun(U, pools_h.reshape(pools_shape)).reshape(n, K) - f0) / h_p
+
+    grad = pools_gradient(pools_func, U_nk, pools, h)
+    nonlocal_part = sparse.block_diag([sparse.csr_matrix(df_dpools[:, k]) @ sparse.csr_matrix(grad[:, k])
+                                       for k in range(K)])
+    return (local + nonlocal_part).tocsc()
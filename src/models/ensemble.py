@@ -0,0 +1,181 @@
+# Run many parameter sets of one model as a single stacked ODE system
+# Members share the grid, time span and output times, parameters that differ become arrays of shape (K,)
+# and the state is stored member by member so the jacobian is block diagonal
+# Members share step sizes and BDF's error norm is taken over the whole stack, so the stacked solve
+# tightens rtol and atol by sqrt(K) to hold every member's local error within the tolerance of its single
+# run. Members still don't take the same steps as their single runs, they agree with them to within the
+# global error of that tolerance (RTOL, ATOL, scipy's defaults), not bit for bit
+import copy
+import time
+import numpy as np
+from scipy import sparse
+from . import MODELS, model_to_module, task_budget, steady_state
+
+# values that are allowed to differ between members without being model parameters
+PER_MEMBER_KEYS = ["initial_condition", "label", "key_varied", "warm_start_from", "warm_start_lineage"]
+
+# numeric values that set the shape of the problem, so members must agree on them
+SHARED_NUMBER_KEYS = ["Nx", "x0", "xL", "t0", "tL", "points_per_second", "steady_state_event_tol",
+                      "steady_state_event_window"] + task_budget.BUDGET_KEYS
+
+# tolerance of a single run (solve_ivp's defaults), which every member of a stack is held to
+RTOL = 1e-3
+ATOL = 1e-6
+
+# models whose tasks are always run on their own: tostevin's l chatters along grid points, which stalls
+# a stack that shares its step sizes (see STALL_CALLS) and then reruns every member separately anyway
+SEPARATE_MODELS = [MODELS.TOSTEVIN]
+
+# right hand side calls allowed without the stacked solve moving forward in time
+# members share step sizes, so one member chattering on a discontinuity (e.g. tostevin's l sliding
+# along a grid point) can hold the whole stack at tiny steps which it would get through on its own
+STALL_CALLS = 1000
+
+
+class EnsembleStalled(Exception):
+    pass
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def hashable(value):
+    if isinstance(value, np.ndarray):
+        return value.shape, value.tobytes()
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return id(value)
+
+
+# kvals with the same key can be solved in one ensemble
+def ensemble_key(model: MODELS, kvals: dict):
+    key = [model, tuple(sorted(kvals))]
+    for name in sorted(kvals):
+        value = kvals[name]
+        if name in PER_MEMBER_KEYS or (is_number(value) and name not in SHARED_NUMBER_KEYS):
+            continue
+        key.append((name, hashable(value)))
+    return tuple(key)
+
+
+def same_value(a, b):
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    return a is b or a == b
+
+
+# combine member kvals into one dict, shared values are kept as they are and
+# numeric values that differ become arrays over the members
+def stack_kvals(kvals_list: list[dict]) -> dict:
+    stacked = {}
+    for name in kvals_list[0]:
+        values = [kvals[name] for kvals in kvals_list]
+        if all(same_value(value, values[0]) for value in values):
+            stacked[name] = values[0]
+        elif all(is_number(value) for value in values):
+            stacked[name] = np.array(values, dtype=float)
+        else:
+            stacked[name] = values  # bookkeeping values (labels etc.) which the right hand side doesn't use
+    return stacked
+
+
+# Output of form [(model, sol, kvals),...] in the order of args_list, matching run_tasks_parallel
+# all args must give the same ensemble_key, the stacked solve shares step sizes between members
+# if the stacked solve fails each member is rerun on its own so one bad member doesn't take the others with it
+def run_ensemble(model: MODELS, args_list: list[dict]) -> list[tuple]:
+    if model in SEPARATE_MODELS:
+        return [run_member(model, args) for args in args_list]
+
+    module = model_to_module(model)
+    kvals_list = [module.setup_kvals(copy.deepcopy(args)) for args in args_list]
+
+    keys = {ensemble_key(model, kvals) for kvals in kvals_list}
+    if len(keys) != 1:
+        raise ValueError("run_ensemble needs members that share the grid, times and functions")
+
+    start = time.time()
+    try:
+        sols = solve_ensemble(module, kvals_list)
+    except Exception as e:
+        print(f"{time.time():.1f} Ensemble of {len(args_list)} failed, running members separately; {e}")
+        sols = None
+
+    if sols is None:
+        return [run_member(model, args) for args in args_list]
+
+    # members share the solve so they share its cost
+    for kvals in kvals_list:
+        kvals["compute_seconds"] = (time.time() - start) / len(kvals_list)
+
+    return [(model, sol, kvals) for sol, kvals in zip(sols, kvals_list)]
+
+
+def run_member(model: MODELS, args: dict):
+    try:
+        start = time.time()
+        sol, kvals = model_to_module(model).run_model(copy.deepcopy(args))
+        kvals["compute_seconds"] = time.time() - start
+        return (model,) + task_budget.result_or_failure(sol, kvals)
+    except Exception as e:
+        print(f"{time.time():.1f} Exception occurred while running task for model {model}; {e}")
+        return model, task_budget.TaskFailure(str(e)), args
+
+
+# returns one OdeResult per member, or None if the solver didn't reach the end
+# only time integration is stacked, other modes (e.g. "steady_state") return None so members run on their own
+def solve_ensemble(module, kvals_list: list[dict]):
+    K = len(kvals_list)
+    stacked = stack_kvals(kvals_list)
+    if stacked["mode"] != "integrate":
+        return None
+    y0 = np.concatenate([np.asarray(kvals["initial_condition"], dtype=float) for kvals in kvals_list])
+    n = len(y0) // K
+
+    rhs, rhs_args = module.vectorised_rhs(stacked, (K,))
+
+    progress = {"t": stacked["t0"], "calls": 0}
+    min_progress = 1e-9 * abs(stacked["tL"] - stacked["t0"])
+
+    # the model works on (n, K) with space first, the solver sees members one after another
+    def ensemble_rhs(t, u):
+        if t > progress["t"] + min_progress:
+            progress["t"], progress["calls"] = t, 0
+        else:
+            progress["calls"] += 1
+            if progress["calls"] > STALL_CALLS:
+                raise EnsembleStalled(f"no progress past t={progress['t']:.4f}")
+        return rhs(t, u.reshape(K, n).T, *rhs_args).T.ravel()
+
+    # sparsity_jacobian differences every member with the same calls, per-member analytic jacobians
+    # would be assembled one by one, so the stack always uses the grouped finite differences
+    if stacked["jacobian"] is not None:
+        def ensemble_jac(t, u):
+            return module.sparsity_jacobian(t, u.reshape(K, n).T, *rhs_args)
+        jac_args = {"jac": ensemble_jac}
+    else:
+        # members are independent so BDF can difference all of them with the same n calls
+        jac_args = {"jac_sparsity": sparse.block_diag([np.ones((n, n))] * K, format="csc")}
+
+    # every member gets its own time, a member that would run out of budget stops the stack
+    # (status != 0) and is then run on its own
+    budget = {**stacked, "max_seconds": None if stacked["max_seconds"] is None else K * stacked["max_seconds"]}
+    # with steady_state_event_tol the stack stops once every member has settled
+    # the error norm is an rms over the K members, so each member's share of it is scaled back up by sqrt(K)
+    sol = steady_state.integrate(budget, ensemble_rhs, y0, method="BDF", rtol=RTOL / np.sqrt(K), atol=ATOL / np.sqrt(K),
+                                 **jac_args)
+
+    if sol.status != 0:
+        return None
+
+    y = sol.y.reshape(K, n, -1)
+    sols = []
+    for k in range(K):
+        member = copy.copy(sol)
+        member.y = y[k]
+        sols.append(member)
+    return sols
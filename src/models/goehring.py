@@ -1,10 +1,12 @@
 # Based on Goehring et al. 2011
-import time
+import functools
 from typing import Callable
 import numpy as np
-from matplotlib import pyplot as plt, animation
-from scipy import integrate
-from .metric_functions import polarity_measure, polarity_orientation, orientation_marker
+from scipy import sparse
+from . import task_budget, steady_state
+from .velocity import velocity
+from .discretisation import diffusion_term, advection_term, diffusion_matrix, advection_matrix, rank_one, diag, \
+    simpson_weights, functional_gradient, local_sparsity, group_columns, grouped_jacobian, Ybar
 
 
 def default_v_func(kvals, x, t):
@@ -18,7 +20,11 @@ def default_v_func(kvals, x, t):
     return time_factor * peak * np.exp(-(x - center) ** 2 / (2 * sd ** 2))
 
 
-Ybar = lambda kvals, Y: 2 * integrate.simpson(Y, x = kvals["X"]) / kvals["L"]  # handles both A-bar and P-bar
+# only time_factor depends on t, so velocity.VelocityField can scale one profile instead of recomputing it
+default_v_func.separable = True
+
+
+# Ybar (from discretisation) handles both A-bar and P-bar
 def default_A_cyto(kvals, A): return kvals["rho_A"] - kvals["psi"] * Ybar(kvals, A)
 def default_P_cyto(kvals, P): return kvals["rho_P"] - kvals["psi"] * Ybar(kvals, P)
 
@@ -50,6 +56,28 @@ DEFAULT_PARAMETERS = {
     "alpha": 1,
     "beta": 2,
 
+    # "vectorised" evaluates the right hand side over whole arrays, "loop" goes point by point
+    "rhs_mode": "vectorised",
+    # "analytic" passes jacobian to the solver, "sparsity" passes sparsity_jacobian (grouped finite differences)
+    # None leaves BDF to estimate it by finite differences
+    "jacobian": "analytic",
+
+    # "integrate" solves over [t0, tL], "steady_state" integrates for steady_state_transient then solves
+    # for the steady state directly (see steady_state.py), stopping at max|dU/dt| < steady_state_tol
+    "mode": "integrate",
+    "steady_state_transient": 100,
+    "steady_state_tol": 1e-9,
+    # with mode "integrate", stop once max|dU/dt| < steady_state_event_tol for steady_state_event_window
+    # and pad the output with the settled state, None to always integrate to tL
+    "steady_state_event_tol": None,
+    "steady_state_event_window": 100,
+
+    # limits on the solve, None for no limit, see task_budget
+    "max_seconds": None,
+    "max_nfev": None,
+    "min_step": None,
+    "divergence_bounds": (-100, 100),  # stop if any value leaves these, numerical issues can otherwise run forever
+
     # R_X
     # Xbar
     "A_cyto": default_A_cyto,
@@ -82,12 +110,6 @@ R_P = lambda kvals, A, P, P_cyto_r, t, x_i: kvals["k_onP"] * P_cyto_r \
 def odefunc(t, U, kvals):
     assert len(U) == 2 * kvals["Nx"]
 
-    # Failure so odefunc doesn't run forever trying to fix numerical issues
-    if min(U) < -100 or max(U) > 100:
-        print(f"FAILURE with goehring labelled {kvals['label']} at simulation time {t:.4f}")
-        # plot_failure(U, t, kvals)
-        raise AssertionError
-
     A = U[:kvals["Nx"]]
     P = U[kvals["Nx"]:]
 
@@ -98,312 +120,148 @@ def odefunc(t, U, kvals):
     A_cyto_r = kvals["A_cyto"](kvals, A)
     P_cyto_r = kvals["P_cyto"](kvals, P)
 
+    # v_func on the grid, zero when there's no advection
+    v = velocity(kvals, t)
+    v = np.zeros(kvals["Nx"]) if v is None else v
+
     # manually handle right boundary ( x_i = Nx-1 ) since v(x,t) is odd
     # reflect Nx over Nx-1 to Nx-2; for v_func, also negate on the reflection as v(x)=-v(-x)
     dudt_A[kvals["Nx"]-1] = kvals["D_A"] * disc_diffusion_term(kvals, A, kvals["Nx"]-1) \
-        - (-kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-2], t) * A[kvals["Nx"]-2] - kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-1], t) * A[kvals["Nx"]-1]) / kvals["deltax"] \
+        - (-v[kvals["Nx"]-2] * A[kvals["Nx"]-2] - v[kvals["Nx"]-1] * A[kvals["Nx"]-1]) / kvals["deltax"] \
         + R_A(kvals, A, P, A_cyto_r, t, kvals["Nx"]-1)
     dudt_P[kvals["Nx"]-1] = kvals["D_P"] * disc_diffusion_term(kvals, P, kvals["Nx"]-1) \
-        - (-kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-2], t) * P[kvals["Nx"]-2] - kvals["v_func"](kvals, kvals["X"][kvals["Nx"]-1], t) * P[kvals["Nx"]-1]) / kvals["deltax"] \
+        - (-v[kvals["Nx"]-2] * P[kvals["Nx"]-2] - v[kvals["Nx"]-1] * P[kvals["Nx"]-1]) / kvals["deltax"] \
         + R_P(kvals, A, P, P_cyto_r, t, kvals["Nx"]-1)
 
     # insides
     # diffusion function handles left boundary
     for x_i in np.arange(0, kvals["Nx"] - 1):
         dudt_A[x_i] = kvals["D_A"] * disc_diffusion_term(kvals, A, x_i) \
-              - disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t) * A[x_ii], x_i) \
+              - disc_spatial_derivative(kvals, lambda x_ii: v[x_ii] * A[x_ii], x_i) \
               + R_A(kvals, A, P, A_cyto_r, t, x_i)
         dudt_P[x_i] = kvals["D_P"] * disc_diffusion_term(kvals, P, x_i) \
-              - disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t) * P[x_ii], x_i) \
+              - disc_spatial_derivative(kvals, lambda x_ii: v[x_ii] * P[x_ii], x_i) \
               + R_P(kvals, A, P, P_cyto_r, t, x_i)
 
     return np.ravel([dudt_A, dudt_P])
 
 
-def run_model(args=None):
-    if args is None:
-        args = {}
-    params = {**DEFAULT_PARAMETERS, **args}
-
-    # calculate other widely used values
-    X = np.linspace(params["x0"], params["xL"], params["Nx"])
-    deltax = np.abs(X[1] - X[0])
-
-    # key values
-    kvals: dict = {**params, "X": X, "deltax": deltax}
-
-    # default time points for solver output
-    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"] * np.abs(kvals["tL"] - kvals["t0"])))
-
-    # default initial condition if none passed
-    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else np.ravel([[1.51, 0.0] for x_i in np.arange(0, kvals["Nx"])], order='F')
-
-    sol = integrate.solve_ivp(odefunc, [kvals["t0"], kvals["tL"]], kvals["initial_condition"], method="BDF",
-                              t_eval=kvals["t_eval"], args=(kvals,))
-
-    return sol, kvals
-
-
-# Plotting
-def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
-    if file_code is None:
-        file_code = f'{time.time_ns()}'[5:]
-
-    # rescale so maximal protein quantity is 1
-    scalar = 1 if not rescale else np.max(sol.y)
-    v_rescale_for_visibility = np.max(sol.y)/scalar * 10 # rescale so 0.1 is equal to max protein quantity in the plotting of v
-
-
-    fig, ax = plt.subplots()
-    line1, = ax.plot(kvals["X"], sol.y[:kvals["Nx"], 0]/scalar, label="anterior", color="blue")
-    line2, = ax.plot(kvals["X"], sol.y[kvals["Nx"]:, 0]/scalar, label="posterior", color="orange")
-    p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], 0], sol.y[kvals["Nx"]:, 0], kvals["Nx"])
-    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
-    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,np.max(sol.y)/scalar+0.05], xlabel="x", ylabel="A/P")
-    ax.legend()
-
-    def animate(t_i):
-        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
-        line1.set_ydata(sol.y[:kvals["Nx"], t_i]/scalar)
-        line2.set_ydata(sol.y[kvals["Nx"]:, t_i]/scalar)
-        p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], t_i], sol.y[kvals["Nx"]:, t_i], kvals["Nx"])
-        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
-        return (line1, line2, linev, time_label)
-
-    ani = animation.FuncAnimation(fig, animate, interval=5000/len(sol.t), blit=True, frames=len(sol.t))
-
-    if save_file:
-        file_name = f"{file_code}_spatialPar.mp4"
-        print(f"Saving animation to {file_name}")
-        ani.save(file_name)
-
-    plt.show(block=False)
-
-
-def plot_final_timestep(sol, kvals, rescale=False):
-    plt.figure()
-    ax = plt.subplot()
-
-    scalar = 1 if not rescale else np.max(sol.y)
-
-    ax.plot(kvals["X"], sol.y[:kvals["Nx"], -1]/scalar, label="anterior", color="blue") # A
-    ax.plot(kvals["X"], sol.y[kvals["Nx"]:, -1]/scalar, label="posterior", color="orange") # P
-
-    p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], -1], sol.y[kvals["Nx"]:, -1], kvals["Nx"])
-    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center") # time value
-    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black") # v_func
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, -1])/scalar-0.05, np.max(sol.y[:, -1])/scalar+0.05], xlabel="x", ylabel="A/P")
-    ax.legend()
-
-    plt.show(block=False)
-
+# the nonlocal cytoplasmic values [A_cyto_r, P_cyto_r]
+def cytoplasm_pools(U, kvals):
+    return np.array([kvals["A_cyto"](kvals, U[:kvals["Nx"]]), kvals["P_cyto"](kvals, U[kvals["Nx"]:])])
 
-# this one is different from others cause I wrote it for my poster plots and I didn't generify it
-def plot_timestep(sol, kvals, t_i=0, rescale=False, upperYTick=None, show_legend=True, left_ticks=True, ax=None):
-    if ax is None:
-        plt.figure()
-        ax = plt.subplot()
 
-    COLOR_APAR = (0, 150/255, 150/255)
-    COLOR_PPAR = (230/255, 0, 0)
-    LINE_WIDTH = 5
-
-    scalar = 1 if not rescale else np.max(sol.y[:, t_i])
-
-    ax.plot(kvals["X"], sol.y[:kvals["Nx"], t_i]/scalar, label="Anterior", color=COLOR_APAR, linewidth=LINE_WIDTH) # A
-    ax.plot(kvals["X"], sol.y[kvals["Nx"]:, t_i]/scalar, label="Posterior", color=COLOR_PPAR, linewidth=LINE_WIDTH) # P
-
-    # p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], t_i], sol.y[kvals["Nx"]:, t_i], kvals["Nx"])
-    # ax.text(0.1, 1.05, f"t={sol.t[t_i]},p={p_m:.4f}", transform=ax.transAxes, ha="center") # time value
-
-    ax.text(0.1, 1.05, f"t={sol.t[t_i]:.0f}", transform=ax.transAxes, ha="center") # time value
-
-
-    v_scalar = upperYTick/0.1 if upperYTick is not None else 1/0.1 if rescale else 1
-    ax.plot(kvals["X"], [v_scalar*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]], label="v", linestyle="--", color="black", linewidth=LINE_WIDTH) # v_func
-
-    # ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, t_i])/scalar-0.05, np.max(sol.y[:, t_i])/scalar+0.05])#, xlabel="x", ylabel="A/P")
-    
-    if show_legend: ax.legend()
-
-    plt.xticks([0,kvals["xL"]//2,kvals["xL"]],['0','','L'])
-
-    if upperYTick is not None:
-        plt.yticks([0, upperYTick], [0,1] if left_ticks else ['',''])
-
-    plt.show(block=False)
-
-
-# plot cytoplasmic quantities over time
-def plot_cyto(sol, kvals):
-    plt.figure()
-    ax = plt.subplot()
-
-    ax.plot(sol.t, [kvals["A_cyto"](kvals, sol.y[:kvals["Nx"], t_i]) for t_i in np.arange(0, len(sol.t))], label="A_cyto", color="blue")
-    ax.plot(sol.t, [kvals["P_cyto"](kvals, sol.y[kvals["Nx"]:, t_i]) for t_i in np.arange(0, len(sol.t))], label="P_cyto", color="orange")
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlabel="time")
-
-    ax.title.set_text("Cytoplasmic Quantities")
-
-    ax.legend()
-    plt.show(block=False)
-
-def plot_overall_quantities_over_time(sol, kvals, rescale_by_length=True):
-    plt.figure()
-    ax = plt.subplot()
-
-    # since this is overall quantity, rescale by space length
-    length_scalar = 1 if not rescale_by_length else np.abs(kvals["xL"] - kvals["x0"])
-
-    #TODO - unsure if I should plot with or without the psi multiple
-    ax.plot(sol.t, [kvals["A_cyto"](kvals, sol.y[:kvals["Nx"], t_i])/length_scalar for t_i in np.arange(0, len(sol.t))],
-            label="A_cyto", color="blue", linestyle="--")
-    ax.plot(sol.t, [kvals["P_cyto"](kvals, sol.y[kvals["Nx"]:, t_i])/length_scalar for t_i in np.arange(0, len(sol.t))],
-            label="P_cyto", color="orange", linestyle="--")
-
-    ax.plot(sol.t, [Ybar(kvals, sol.y[:kvals["Nx"], t_i])/length_scalar for t_i in np.arange(0, len(sol.t))], label="A_bar", color="blue")
-    ax.plot(sol.t, [Ybar(kvals, sol.y[kvals["Nx"]:, t_i])/length_scalar for t_i in np.arange(0, len(sol.t))], label="P_bar", color="orange")
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlabel="time")
-
-    ax.title.set_text("Quantities")
-
-    ax.legend()
-    plt.show(block=False)
+# same system as odefunc but evaluated over the whole grid at once
+# pools overrides cytoplasm_pools(U), used to hold them fixed for sparsity_jacobian
+def odefunc_vectorised(t, U, kvals, pools=None):
+    assert len(U) == 2 * kvals["Nx"]
 
+    A = U[:kvals["Nx"]]
+    P = U[kvals["Nx"]:]
 
-# plot a bunch of different solutions final timestep (just A,P) on single figure
-# Assumes that all solutions have the same X,Nx,x0,xL, and time points
-def plot_multi_final_timestep(sol_list, kvals_list, label=DEFAULT_PARAMETERS["label"], plot_A=True, plot_P=True):
-    kvals = kvals_list[0]
+    # r is for "resolved"
+    A_cyto_r, P_cyto_r = cytoplasm_pools(U, kvals) if pools is None else pools
 
-    plt.figure()
-    ax = plt.subplot()
+    v = velocity(kvals, t)
 
-    for i in np.arange(0,len(sol_list)):
-        sol = sol_list[i]
-        kvals_this_sol = kvals_list[i]
+    dudt_A = kvals["D_A"] * diffusion_term(A, kvals["deltax"]) + advection_term(v, A, kvals["deltax"]) \
+        + kvals["k_onA"] * A_cyto_r - kvals["k_offA"] * A - kvals["k_AP"] * (P ** kvals["alpha"]) * A
+    dudt_P = kvals["D_P"] * diffusion_term(P, kvals["deltax"]) + advection_term(v, P, kvals["deltax"]) \
+        + kvals["k_onP"] * P_cyto_r - kvals["k_offP"] * P - kvals["k_PA"] * (A ** kvals["beta"]) * P
 
-        if plot_A:
-            ax.plot(kvals["X"], sol.y[:kvals["Nx"], -1], label=f"A_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)))
-        if plot_P:
-            ax.plot(kvals["X"], sol.y[kvals["Nx"]:, -1], label=f"P_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)))
+    return np.concatenate((dudt_A, dudt_P))
 
-    ax.text(0.1, 1.05, f"t={sol_list[0].t[-1]}", transform=ax.transAxes, ha="center") # timestamp
-    ax.text(1, 1.05, label, transform=ax.transAxes, ha="center") # label
 
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min([sol.y[:, -1] for sol in sol_list])-0.05, np.max([sol.y[:, -1] for sol in sol_list])+0.05], xlabel="x", ylabel="A/P")
-    ax.title.set_text("Multiple Sims")
-    ax.legend()
+# gradient of a cytoplasm function with respect to its membrane species
+def cyto_gradient(kvals, cyto_func, default_cyto_func, Y):
+    if cyto_func is default_cyto_func:
+        return -kvals["psi"] * 2 * simpson_weights(kvals["X"]) / kvals["L"]
+    return functional_gradient(lambda Y_h: cyto_func(kvals, Y_h), Y)
 
-    plt.show(block=False)
 
-def plot_failure(U, t, kvals):
-    plt.figure()
-    ax = plt.subplot()
+# analytic jacobian of odefunc as a sparse matrix
+# the cytoplasmic terms couple every point of a species, giving a dense rank one block
+def jacobian(t, U, kvals):
+    Nx = kvals["Nx"]
+    A = U[:Nx]
+    P = U[Nx:]
 
-    ax.plot(kvals["X"], U[:kvals["Nx"]], label="anterior", color="blue")
-    ax.plot(kvals["X"], U[kvals["Nx"]:], label="posterior", color="orange")
-    ax.text(0.1, 1.05, f"t={t}", transform=ax.transAxes, ha="center")
-    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, t) for x in kvals["X"]], label="v", linestyle="--", color="black")
+    L = diffusion_matrix(Nx, kvals["deltax"])
+    V = advection_matrix(velocity(kvals, t), Nx, kvals["deltax"])
 
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+    dA_dA = kvals["D_A"] * L + V + diag(-kvals["k_offA"] - kvals["k_AP"] * P ** kvals["alpha"], Nx) \
+        + rank_one(kvals["k_onA"], cyto_gradient(kvals, kvals["A_cyto"], default_A_cyto, A))
+    dA_dP = diag(-kvals["k_AP"] * kvals["alpha"] * P ** (kvals["alpha"] - 1) * A, Nx)
+    dP_dP = kvals["D_P"] * L + V + diag(-kvals["k_offP"] - kvals["k_PA"] * A ** kvals["beta"], Nx) \
+        + rank_one(kvals["k_onP"], cyto_gradient(kvals, kvals["P_cyto"], default_P_cyto, P))
+    dP_dA = diag(-kvals["k_PA"] * kvals["beta"] * A ** (kvals["beta"] - 1) * P, Nx)
 
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(U)-0.05, np.max(U)+0.05], xlabel="x", ylabel="A/P")
-    ax.title.set_text("Failure Plot")
-    ax.legend()
+    return sparse.bmat([[dA_dA, dA_dP], [dP_dA, dP_dP]], format="csc")
 
-    plt.show(block=True)
 
+# pattern of odefunc's jacobian with the cytoplasmic pools held fixed, and its column groups
+# A and P react at the same point, so cross-species blocks are diagonal
+@functools.lru_cache
+def jac_sparsity(Nx):
+    pattern = local_sparsity(Nx, [[1, 1], [1, 1]])
+    return pattern, group_columns(pattern)
 
-# assume lists are [base, ...others]
-def plot_metric_comparisons(sol_list, kvals_list, label=DEFAULT_PARAMETERS["label"]):
-    assert len(sol_list) == len(kvals_list)
 
-    # kvals = kvals_list[0]
-    # polarity measure metric (final timestep)
-    # plt.figure()
-    # ax1 = plt.subplot()
+# finite difference jacobian needing one call per column group plus one per cytoplasmic pool
+def sparsity_jacobian(t, U, kvals):
+    return grouped_jacobian(lambda Y, pools: odefunc_vectorised(t, Y, kvals, pools),
+                            lambda Y: cytoplasm_pools(Y, kvals), U, *jac_sparsity(kvals["Nx"]))
 
-    # TODO other metric
-    # plt.figure()
-    # ax2 = plt.subplot()
 
-    plt.figure()
+# kvals for a run: the parameters plus the grid, output times and initial condition
+def setup_kvals(args=None):
+    if args is None:
+        args = {}
+    params = {**DEFAULT_PARAMETERS, **args}
 
-    for i in np.arange(0, len(sol_list)):
-        sol = sol_list[i]
-        kvals = kvals_list[i]
+    # calculate other widely used values
+    X = np.linspace(params["x0"], params["xL"], params["Nx"])
+    deltax = np.abs(X[1] - X[0])
+    simpson_weights(X)  # worked out once here for Ybar on every right hand side call
 
-        polarity_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], -1], sol.y[kvals["Nx"]:, -1], kvals["Nx"])
+    # key values
+    kvals: dict = {**params, "X": X, "deltax": deltax}
 
-        plt.plot(0, polarity_m, marker="o", linestyle="None", label=kvals["label"])
+    # default time points for solver output
+    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"] * np.abs(kvals["tL"] - kvals["t0"])))
 
-    plt.legend()
-    # plt.title.set_text(label)
-    plt.show(block=False)
+    # default initial condition if none passed
+    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else np.ravel([[1.51, 0.0] for x_i in np.arange(0, kvals["Nx"])], order='F')
 
+    return kvals
 
-# variation_sets is a list [([sol,sol,sol], [kvals, kvals, kvals]), ... ]
-# assumes kvals has key_varied property
-# can handle sol with value "FAILURE"
-def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
-    plt.figure()
-    ax = plt.subplot()
 
-    # add then remove plot with xticks so that they get ordered correctly in the figure
-    sentinel, = ax.plot(x_axis_labels, [0.5]*len(x_axis_labels))
-    sentinel.remove()
+# right hand side and its extra solve_ivp args for rhs_mode "vectorised"
+# batch_shape sizes any output buffer for a stack of states (n, ...), as used by ensemble.py
+def vectorised_rhs(kvals, batch_shape=()):
+    return odefunc_vectorised, (kvals,)
 
-    for i in np.arange(0, len(variation_sets)):
-        variation = variation_sets[i]
-        sol_list = variation[0]
-        kvals_list = variation[1]
 
-        polarity_m_list = []
-        xticks = []
-        if len(variation_sets) > 7:
-            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
-        else:
-            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+def run_model(args=None):
+    kvals = setup_kvals(args)
 
-        for j in np.arange(0, len(sol_list)):
-            sol = sol_list[j]
-            kvals = kvals_list[j]
+    rhs, rhs_args = vectorised_rhs(kvals) if kvals["rhs_mode"] == "vectorised" else (odefunc, (kvals,))
 
-            if not sol == "FAILURE":
-                polarity_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], -1], sol.y[kvals["Nx"]:, -1], kvals["Nx"])
-                xtick = x_axis_labels[j] if x_axis_labels is not None else j
-                marker = 'o' if not show_orientation else orientation_marker(polarity_orientation(kvals["X"], sol.y[:kvals["Nx"], -1], sol.y[kvals["Nx"]:, -1], kvals["Nx"]))
+    jac = {"analytic": jacobian, "sparsity": sparsity_jacobian}.get(kvals["jacobian"])
 
-                # jitter the near-0 values so they are visible
-                if polarity_m<0.02:
-                    polarity_m += 0.02*i/len(variation_sets)-0.01
+    if kvals["mode"] == "steady_state":
+        return steady_state.solve(kvals, rhs, rhs_args, jac, jac or sparsity_jacobian), kvals
 
-                polarity_m_list.append(polarity_m)
-                xticks.append(xtick)
-                ax.scatter(xtick, polarity_m, color=color, marker=marker, s=100)
+    sol = steady_state.integrate(kvals, rhs, kvals["initial_condition"], method="BDF", args=rhs_args, jac=jac)
 
-        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
+    return sol, kvals
 
-    ax.legend()
-    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
-    ax.title.set_text(label)
-    ax.tick_params(which="both", labelsize=15)
-    ax.tick_params(axis='x', labelrotation=60)
-    plt.show(block=False)
 
+# Plotting functions are in goehring_plots, imported on first use of one through this module
+# (e.g. goehring.animate_plot) so that solving doesn't import matplotlib
+def __getattr__(attr):
+    if not attr.startswith("__"):
+        from . import goehring_plots
+        if hasattr(goehring_plots, attr):
+            return getattr(goehring_plots, attr)
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
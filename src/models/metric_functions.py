@@ -1,5 +1,5 @@
 import numpy as np
-from scipy import integrate
+from .discretisation import simpson_weights
 
 
 # Analysis Metric
@@ -22,26 +22,74 @@ def orientation_marker(orientation_code):
     return ['o', '<', '>'][orientation_code]
 
 
-# returns (measure, orientation, marker)
-def polarity_get_all(X, Am, Pm, Nx):
-    a_left = integrate.simpson(Am[:Nx//2], x = X[:Nx//2])
-    a_right = integrate.simpson(Am[Nx//2:], x = X[Nx//2:])
-    p_left = integrate.simpson(Pm[:Nx//2], x = X[:Nx//2])
-    p_right = integrate.simpson(Pm[Nx//2:], x = X[Nx//2:])
+# weights over the full grid for the simpson integrals of the left and right halves used for polarity
+def half_weights(X, Nx) -> tuple[np.ndarray, np.ndarray]:
+    w_left = np.zeros(Nx)
+    w_right = np.zeros(Nx)
+    w_left[:Nx//2] = simpson_weights(X[:Nx//2])
+    w_right[Nx//2:] = simpson_weights(X[Nx//2:])
+    return w_left, w_right
 
-    measure = 0 if ((a_left + a_right)*(p_left + p_right)) == 0 else np.abs(a_left - a_right) * np.abs(p_left - p_right) / ((a_left + a_right)*(p_left + p_right))
+
+def measure_and_orientation(a_left, a_right, p_left, p_right):
+    total = (a_left + a_right)*(p_left + p_right)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        measure = np.where(total == 0, 0, np.abs(a_left - a_right) * np.abs(p_left - p_right) / total)
 
     # Orientation
-    if a_left > a_right and p_right > p_left:  # A is on the left, P is on the right
-        orientation = 1
-    elif a_left < a_right and p_right < p_left:  # A is on the right, P is on the left
-        orientation = 2
-    else:  # undetermined
-        orientation = 0
+    # 1 - A is on the left, P is on the right, 2 - A is on the right, P is on the left, 0 - undetermined
+    orientation = np.where((a_left > a_right) & (p_right > p_left), 1,
+                           np.where((a_left < a_right) & (p_right < p_left), 2, 0))
+    return measure, orientation
+
 
+# returns (measure, orientation, marker)
+def polarity_get_all(X, Am, Pm, Nx):
+    w_left, w_right = half_weights(X, Nx)
+    measure, orientation = measure_and_orientation(w_left @ Am, w_right @ Am, w_left @ Pm, w_right @ Pm)
+    measure, orientation = float(measure), int(orientation)
     return measure, orientation, orientation_marker(orientation)
 
 
+# polarity of many snapshots at once, Y is (..., n_species, Nx, n_times), e.g. (n_runs, n_species, Nx, n_times)
+# a_species and p_species are the index, or list of indices summed, of the species counted as A and P
+# returns (measure, orientation) arrays of shape (..., n_times)
+def polarity_batch(X, Y, a_species, p_species):
+    Y = np.asarray(Y)
+    w_left, w_right = half_weights(X, Y.shape[-2])
+    halves = np.einsum("hx,...xt->...ht", np.stack([w_left, w_right]), Y)  # (..., n_species, 2, n_times)
+
+    a = np.sum(halves[..., np.atleast_1d(a_species), :, :], axis=-3)
+    p = np.sum(halves[..., np.atleast_1d(p_species), :, :], axis=-3)
+    return measure_and_orientation(a[..., 0, :], a[..., 1, :], p[..., 0, :], p[..., 1, :])
+
+
+# species blocks of sol.y, (n_species*Nx, n_times) to (n_species, Nx, n_times)
+# anything after the species blocks (e.g. tostevin's length) is left out
+def species_blocks(y, n_species, Nx):
+    return np.asarray(y)[:n_species*Nx].reshape(n_species, Nx, -1)
+
+
+# (measure, orientation) at t_index of each of a list of results, e.g. a set of variations
+# runs on the same grid are done in one batch, failures give a measure of nan and orientation 0
+def polarity_of_results(sol_list, kvals_list, n_species, a_species, p_species, t_index=-1):
+    measure = np.full(len(sol_list), np.nan)
+    orientation = np.zeros(len(sol_list), dtype=int)
+
+    runs_of_grid = {}
+    for i, (sol, kvals) in enumerate(zip(sol_list, kvals_list)):
+        if not sol == "FAILURE":
+            runs_of_grid.setdefault(np.asarray(kvals["X"], dtype=float).tobytes(), []).append(i)
+
+    for runs in runs_of_grid.values():
+        kvals = kvals_list[runs[0]]
+        Y = np.stack([species_blocks(sol_list[i].y[:, t_index], n_species, kvals["Nx"]) for i in runs])
+        run_measure, run_orientation = polarity_batch(kvals["X"], Y, a_species, p_species)
+        measure[runs], orientation[runs] = run_measure[:, 0], run_orientation[:, 0]
+
+    return measure, orientation
+
+
 # polarity metric but just using the posterior quantity
 # def posterior_polarity_get_all(X, Pm, Nx):
 #     assert Nx > 3  # no meaningful information when step-size too low
@@ -1,11 +1,13 @@
 # Expansion on the existing model by Goehring et al. 2011 in order to better represent the endometrial epithelia
-import time
+import functools
 from typing import Callable
 import numpy as np
-from matplotlib import pyplot as plt, animation
-from scipy import integrate
+from scipy import sparse
 
-from src.models.metric_functions import polarity_measure, orientation_marker, polarity_orientation, polarity_get_all
+from src.models import task_budget, steady_state
+from src.models.velocity import velocity
+from src.models.discretisation import diffusion_term, advection_term, RHSContext, diffusion_matrix, advection_matrix, \
+    rank_one, diag, simpson_weights, local_sparsity, group_columns, grouped_jacobian, Ybar
 
 
 def default_v_func(kvals, x, t):
@@ -19,7 +21,11 @@ def default_v_func(kvals, x, t):
     return time_factor * peak * np.exp(-(x - center) ** 2 / (2 * sd ** 2))
 
 
-Ybar = lambda kvals, Y: 2 * integrate.simpson(Y, x = kvals["X"]) / kvals["L"]  # all of J,A,P-bar
+# only time_factor depends on t, so velocity.VelocityField can scale one profile instead of recomputing it
+default_v_func.separable = True
+
+
+# Ybar (from discretisation) gives all of J,A,P-bar
 def J_cyto(kvals, J, M): return kvals["rho_J"] - kvals["psi"] * Ybar(kvals, J) \
         - kvals["psi"] * Ybar(kvals, M)
 def A_cyto(kvals, A, M): return kvals["rho_A"] - kvals["psi"] * Ybar(kvals, A) \
@@ -74,6 +80,28 @@ DEFAULT_PARAMETERS = {
     # not used in writeup
     "konA": 0,
     "alpha": 1, "beta": 2,
+
+    # "vectorised" evaluates the right hand side over whole arrays, "loop" goes point by point
+    "rhs_mode": "vectorised",
+    # "analytic" passes jacobian to the solver, "sparsity" passes sparsity_jacobian (grouped finite differences)
+    # None leaves BDF to estimate it by finite differences
+    "jacobian": "analytic",
+
+    # "integrate" solves over [t0, tL], "steady_state" integrates for steady_state_transient then solves
+    # for the steady state directly (see steady_state.py), stopping at max|dU/dt| < steady_state_tol
+    "mode": "integrate",
+    "steady_state_transient": 100,
+    "steady_state_tol": 1e-9,
+    # with mode "integrate", stop once max|dU/dt| < steady_state_event_tol for steady_state_event_window
+    # and pad the output with the settled state, None to always integrate to tL
+    "steady_state_event_tol": None,
+    "steady_state_event_window": 100,
+
+    # limits on the solve, None for no limit, see task_budget
+    "max_seconds": None,
+    "max_nfev": None,
+    "min_step": None,
+    "divergence_bounds": (-100, 100),  # stop if any value leaves these, numerical issues can otherwise run forever
 }
 
 
@@ -110,12 +138,6 @@ def odefunc(t, U, kvals):
 
     assert len(U) == 4 * Nx
 
-    # Failure so odefunc doesn't run forever trying to fix numerical issues
-    if min(U) < -100 or max(U) > 100:
-        print(f"FAILURE with par3addition labelled {kvals['label']} at simulation time {t:.4f}")
-        # plot_failure(U, t, kvals)
-        raise AssertionError
-
     J = U[:Nx]
     M = U[Nx:2*Nx]
     A = U[2*Nx:3*Nx]
@@ -131,268 +153,205 @@ def odefunc(t, U, kvals):
     A_cyto_r = A_cyto(kvals, A, M)
     P_cyto_r = P_cyto(kvals, P)
 
+    # v_func on the grid, zero when there's no advection
+    v = velocity(kvals, t)
+    v = np.zeros(Nx) if v is None else v
+
     # insides
     # diffusion function handles left boundary
     for x_i in np.arange(0, Nx-1):
         dudt_J[x_i] = kvals["D_J"]*disc_diffusion_term(kvals, J, x_i) \
-                        -kvals["sigmaJ"]*disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t)*J[x_ii], x_i) \
+                        -kvals["sigmaJ"]*disc_spatial_derivative(kvals, lambda x_ii: v[x_ii]*J[x_ii], x_i) \
                         + R_J(kvals, J, M, A, P, t, x_i, A_cyto_r, J_cyto_r)
         dudt_M[x_i] = kvals["D_M"]*disc_diffusion_term(kvals, M, x_i) \
-                        -kvals["sigmaM"]*disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t)*M[x_ii], x_i) \
+                        -kvals["sigmaM"]*disc_spatial_derivative(kvals, lambda x_ii: v[x_ii]*M[x_ii], x_i) \
                         + R_M(kvals, J, M, A, P, t, x_i, A_cyto_r)
         dudt_A[x_i] = kvals["D_A"]*disc_diffusion_term(kvals, A, x_i) \
                         + R_A(kvals, J, M, A, P, t, x_i, A_cyto_r)
         dudt_P[x_i] = kvals["D_P"]*disc_diffusion_term(kvals, P, x_i) \
-                        -kvals["sigmaP"]*disc_spatial_derivative(kvals, lambda x_ii: kvals["v_func"](kvals, kvals["X"][x_ii], t)*P[x_ii], x_i) \
+                        -kvals["sigmaP"]*disc_spatial_derivative(kvals, lambda x_ii: v[x_ii]*P[x_ii], x_i) \
                         + R_P(kvals, J, M, A, P, t, x_i, P_cyto_r)
 
     # manually handle right boundary ( x_i = Nx-1 ) since v(x,t) is odd
     # reflect Nx over Nx-1 to Nx-2; for v_func, also negate on the reflection as v(x)=-v(-x)
     x_i = Nx-1
     dudt_J[x_i] = kvals["D_J"]*disc_diffusion_term(kvals, J, x_i) \
-                    - (-kvals["v_func"](kvals, kvals["X"][Nx-2], t)*J[Nx-2] - kvals["v_func"](kvals, kvals["X"][Nx-1], t)*J[Nx-1]) / kvals["deltax"] \
+                    - (-v[Nx-2]*J[Nx-2] - v[Nx-1]*J[Nx-1]) / kvals["deltax"] \
                     + R_J(kvals, J, M, A, P, t, x_i, A_cyto_r, J_cyto_r)
     dudt_M[x_i] = kvals["D_M"]*disc_diffusion_term(kvals, M, x_i) \
-                    - (-kvals["v_func"](kvals, kvals["X"][Nx-2], t)*M[Nx-2] - kvals["v_func"](kvals, kvals["X"][Nx-1], t)*M[Nx-1]) / kvals["deltax"] \
+                    - (-v[Nx-2]*M[Nx-2] - v[Nx-1]*M[Nx-1]) / kvals["deltax"] \
                     + R_M(kvals, J, M, A, P, t, x_i, A_cyto_r)
     dudt_A[x_i] = kvals["D_A"]*disc_diffusion_term(kvals, A, x_i) \
                     + R_A(kvals, J, M, A, P, t, x_i, A_cyto_r)
     dudt_P[x_i] = kvals["D_P"]*disc_diffusion_term(kvals, P, x_i) \
-                    - (-kvals["v_func"](kvals, kvals["X"][Nx-2], t)*P[Nx-2] - kvals["v_func"](kvals, kvals["X"][Nx-1], t)*P[Nx-1]) / kvals["deltax"] \
+                    - (-v[Nx-2]*P[Nx-2] - v[Nx-1]*P[Nx-1]) / kvals["deltax"] \
                     + R_P(kvals, J, M, A, P, t, x_i, P_cyto_r)
 
     return dudt_J + dudt_M + dudt_A + dudt_P
 
 
-def run_model(args=None):
-    if args is None:
-        args = {}
-    params = {**DEFAULT_PARAMETERS, **args}
-
-    # calculate other widely used values
-    X = np.linspace(params["x0"], params["xL"], params["Nx"])
-    deltax = np.abs(X[1] - X[0])
-
-    # key values
-    kvals: dict = {**params, "X": X, "deltax": deltax}
-
-    # default time points for solver output
-    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"] * np.abs(kvals["tL"] - kvals["t0"])))
-
-    # default initial condition (just all 0) if none passed
-    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else [0]*(kvals["Nx"]*4)
-
-    sol = integrate.solve_ivp(odefunc, [kvals["t0"], kvals["tL"]], kvals["initial_condition"], method="BDF",
-                              t_eval=kvals["t_eval"], args=(kvals,))
-
-    return sol, kvals
-
-
-# Plotting
-def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
-    if file_code is None:
-        file_code = f'{time.time_ns()}'[5:]
-
-    # rescale so maximal protein quantity is 1
-    scalar = 1 if not rescale else np.max(sol.y)
-    v_rescale_for_visibility = np.max(sol.y)/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
-
+# the nonlocal cytoplasmic values [J_cyto_r, A_cyto_r, P_cyto_r]
+def cytoplasm_pools(U, kvals):
     Nx = kvals["Nx"]
-    # J = U[:Nx]
-    # M = U[Nx:2 * Nx]
-    # A = U[2 * Nx:3 * Nx]
-    # P = U[3 * Nx:]
-    fig, ax = plt.subplots()
-    line1, = ax.plot(kvals["X"], sol.y[:Nx, 0]/scalar, label="par3", color="green")
-    line2, = ax.plot(kvals["X"], sol.y[Nx:2*Nx, 0]/scalar, label="par3-PKC", color="purple")
-    line3, = ax.plot(kvals["X"], sol.y[2*Nx:3*Nx, 0]/scalar, label="cdc42-PKC", color="blue")
-    line4, = ax.plot(kvals["X"], sol.y[3*Nx:, 0]/scalar, label="posterior", color="orange")
-    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, 0], sol.y[3*Nx:, 0], Nx)
-    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
-    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
-
-    ax.text(0.7, 1.05, kvals["label"] + ";Nx:" + str(Nx), transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,np.max(sol.y)/scalar+0.05], xlabel="x", ylabel="par3,A/P")
-    ax.legend()
-
-    def animate(t_i):
-        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
-        line1.set_ydata(sol.y[:Nx, t_i]/scalar)
-        line2.set_ydata(sol.y[Nx:2*Nx, t_i]/scalar)
-        line3.set_ydata(sol.y[2*Nx:3*Nx, t_i]/scalar)
-        line4.set_ydata(sol.y[3*Nx:, t_i]/scalar)
-        p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, t_i], sol.y[3*Nx:, t_i], Nx)
-        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
-        return (line1, line2, line3, line4, linev, time_label)
-
-    ani = animation.FuncAnimation(fig, animate, interval=10000/len(sol.t), blit=True, frames=len(sol.t))
-
-    if save_file:
-        file_name = f"{file_code}_spatialPar.mp4"
-        print(f"Saving animation to {file_name}")
-        ani.save(file_name)
-
-    plt.show(block=False)
-
-
-def plot_final_timestep(sol, kvals, rescale=False):
-    plt.figure()
-    ax = plt.subplot()
-
-    Nx = kvals["Nx"]
-    scalar = 1 if not rescale else np.max(sol.y)
-
-    ax.plot(kvals["X"], sol.y[:Nx, -1] / scalar, label="par3", color="green")
-    ax.plot(kvals["X"], sol.y[Nx:2 * Nx, -1] / scalar, label="par3-PKC", color="purple")
-    ax.plot(kvals["X"], sol.y[2 * Nx:3 * Nx, -1] / scalar, label="cdc42-PKC", color="blue")
-    ax.plot(kvals["X"], sol.y[3 * Nx:, -1] / scalar, label="posterior", color="orange")
-
-    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
-    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
-    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
+    J = U[:Nx]
+    M = U[Nx:2*Nx]
+    A = U[2*Nx:3*Nx]
+    P = U[3*Nx:]
+    return np.array([J_cyto(kvals, J, M), A_cyto(kvals, A, M), P_cyto(kvals, P)])
 
-    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
 
-    # ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, -1])/scalar-0.05, np.max(sol.y[:, -1])/scalar+0.05], xlabel="x", ylabel="A/P")
-    ax.legend()
+# same system as odefunc but evaluated over the whole grid at once
+# results are written into the preallocated buffer held by ctx (an RHSContext for 4 species)
+# pools overrides cytoplasm_pools(U), used to hold them fixed for sparsity_jacobian
+def odefunc_vectorised(t, U, kvals, ctx, pools=None):
+    Nx = kvals["Nx"]
 
-    plt.show(block=False)
+    assert len(U) == 4 * Nx
 
+    J = U[:Nx]
+    M = U[Nx:2*Nx]
+    A = U[2*Nx:3*Nx]
+    P = U[3*Nx:]
 
-# polarity based on the cdc42 quantity for Anterior
-# untested code
-def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
-    plt.figure()
-    ax = plt.subplot()
+    dudt_J, dudt_M, dudt_A, dudt_P = ctx.species
 
-    # add then remove plot with xticks so that they get ordered correctly in the figure
-    sentinel, = ax.plot(x_axis_labels, [0.5]*len(x_axis_labels))
-    sentinel.remove()
+    # r is for "resolved"
+    J_cyto_r, A_cyto_r, P_cyto_r = cytoplasm_pools(U, kvals) if pools is None else pools
 
-    for i in np.arange(0, len(variation_sets)):
-        variation = variation_sets[i]
-        sol_list = variation[0]
-        kvals_list = variation[1]
+    # advection flux v*Y is formed once per species inside advection_term, v is None for no advection
+    v = velocity(kvals, t)
+    deltax = kvals["deltax"]
 
-        polarity_m_list = []
-        xticks = []
-        if len(variation_sets) > 7:
-            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
-        else:
-            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+    # shared reaction terms
+    J_to_M = kvals["k1"]*A_cyto_r*J - kvals["k2"]*M
 
-        for j in np.arange(0, len(sol_list)):
-            sol = sol_list[j]
-            kvals = kvals_list[j]
+    dudt_J[:] = kvals["D_J"]*diffusion_term(J, deltax) + advection_term(v, J, deltax, kvals["sigmaJ"]) \
+        - J_to_M + kvals["konJ"]*J_cyto_r - kvals["koffJ"]*J - kvals["kJP"]*P**kvals["alpha"]*J
+    dudt_M[:] = kvals["D_M"]*diffusion_term(M, deltax) + advection_term(v, M, deltax, kvals["sigmaM"]) \
+        + J_to_M - kvals["koffM"]*M - kvals["kMP"]*P*M
+    dudt_A[:] = kvals["D_A"]*diffusion_term(A, deltax) \
+        + kvals["k2"]*M + kvals["konA"]*A_cyto_r - kvals["koffA"]*A - kvals["kAP"]*P*A
+    dudt_P[:] = kvals["D_P"]*diffusion_term(P, deltax) + advection_term(v, P, deltax, kvals["sigmaP"]) \
+        + kvals["konP"]*P_cyto_r - kvals["koffP"]*P - kvals["kPA"]*(A+M)**kvals["beta"]*P
 
-            if not sol == "FAILURE":
-                p_measure, _p_orientation, p_marker = polarity_get_all(kvals["X"], sol.y[2*kvals["Nx"]:3*kvals["Nx"], -1], sol.y[3*kvals["Nx"]:, -1], kvals["Nx"])
+    return ctx.result()
 
-                xtick = x_axis_labels[j] if x_axis_labels is not None else j
-                marker = 'o' if not show_orientation else p_marker
 
-                # jitter the near-0 values so they are visible
-                if p_measure<0.02:
-                    p_measure += 0.02*i/len(variation_sets)-0.01
+# analytic jacobian of odefunc as a sparse matrix
+# the cytoplasmic terms couple every point of a species, giving dense rank one blocks
+# ctx is unused, it is accepted so jacobian can share solve_ivp's args with odefunc_vectorised
+def jacobian(t, U, kvals, ctx=None):
+    Nx = kvals["Nx"]
+    J = U[:Nx]
+    M = U[Nx:2*Nx]
+    A = U[2*Nx:3*Nx]
+    P = U[3*Nx:]
 
-                polarity_m_list.append(p_measure)
-                xticks.append(xtick)
-                ax.scatter(xtick, p_measure, color=color, marker=marker, s=100)
+    A_cyto_r = A_cyto(kvals, A, M)
 
-        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
+    L = diffusion_matrix(Nx, kvals["deltax"])
+    v = velocity(kvals, t)
 
-    ax.legend()
-    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
-    ax.title.set_text(label)
-    ax.tick_params(which="both", labelsize=15)
-    ax.tick_params(axis='x', labelrotation=60)
-    plt.show(block=False)
+    # every cytoplasmic pool has the same gradient with respect to each membrane species it depends on
+    g = -kvals["psi"] * 2 * simpson_weights(kvals["X"]) / kvals["L"]
 
+    AM = (A + M) ** kvals["beta"]
+    dP_dAM = diag(-kvals["kPA"] * kvals["beta"] * (A + M) ** (kvals["beta"] - 1) * P, Nx)
 
-# plot combined A,M,J (aPars)
+    dJ_dJ = kvals["D_J"] * L + advection_matrix(v, Nx, kvals["deltax"], kvals["sigmaJ"]) \
+        + diag(-kvals["k1"] * A_cyto_r - kvals["koffJ"] - kvals["kJP"] * P ** kvals["alpha"], Nx) \
+        + rank_one(kvals["konJ"], g)
+    dJ_dM = diag(kvals["k2"], Nx) + rank_one(kvals["konJ"] - kvals["k1"] * J, g)
+    dJ_dA = rank_one(-kvals["k1"] * J, g)
+    dJ_dP = diag(-kvals["kJP"] * kvals["alpha"] * P ** (kvals["alpha"] - 1) * J, Nx)
 
-def animate_plot_apar_combo(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False, no_par3=False):
-    if file_code is None:
-        file_code = f'{time.time_ns()}'[5:]
+    dM_dJ = diag(kvals["k1"] * A_cyto_r, Nx)
+    dM_dM = kvals["D_M"] * L + advection_matrix(v, Nx, kvals["deltax"], kvals["sigmaM"]) \
+        + diag(-kvals["k2"] - kvals["koffM"] - kvals["kMP"] * P, Nx) + rank_one(kvals["k1"] * J, g)
+    dM_dA = rank_one(kvals["k1"] * J, g)
+    dM_dP = diag(-kvals["kMP"] * M, Nx)
 
-    Nx = kvals["Nx"]
-    # J = U[:Nx]
-    # M = U[Nx:2 * Nx]
-    # A = U[2 * Nx:3 * Nx]
-    # P = U[3 * Nx:]
+    dA_dM = diag(kvals["k2"], Nx) + rank_one(kvals["konA"], g)
+    dA_dA = kvals["D_A"] * L + diag(-kvals["koffA"] - kvals["kAP"] * P, Nx) + rank_one(kvals["konA"], g)
+    dA_dP = diag(-kvals["kAP"] * A, Nx)
 
-    combined_apar = []
+    dP_dP = kvals["D_P"] * L + advection_matrix(v, Nx, kvals["deltax"], kvals["sigmaP"]) \
+        + diag(-kvals["koffP"] - kvals["kPA"] * AM, Nx) + rank_one(kvals["konP"], g)
 
-    for i in np.arange(0,len(sol.t)):
-        combined_apar.append((sol.y[Nx:2*Nx, i] + sol.y[2*Nx:3*Nx, i]) if no_par3 else (sol.y[:Nx, i]) + sol.y[Nx:2*Nx, i] + sol.y[2*Nx:3*Nx, i])
-    scalar = 1 if not rescale else np.max(sol.y)
-    v_rescale_for_visibility = np.maximum(np.max(sol.y), np.max(combined_apar[0]))/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
+    return sparse.bmat([[dJ_dJ, dJ_dM, dJ_dA, dJ_dP],
+                        [dM_dJ, dM_dM, dM_dA, dM_dP],
+                        [None, dA_dM, dA_dA, dA_dP],
+                        [None, dP_dAM, dP_dAM, dP_dP]], format="csc")
 
-    fig, ax = plt.subplots()
-    line1, = ax.plot(kvals["X"], combined_apar[0]/scalar, label="anterior", color="green")
-    line2, = ax.plot(kvals["X"], sol.y[3*Nx:, 0]/scalar, label="posterior", color="orange")
-    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, 0], sol.y[3*Nx:, 0], Nx)  # polarisation metric
-    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
-    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
 
-    ax.text(0.7, 1.05, kvals["label"] + ";Nx:" + str(Nx), transform=ax.transAxes, ha="center")
+# pattern of odefunc's jacobian with the cytoplasmic pools held fixed, and its column groups
+# A only reaches J and M through A_cyto, so those blocks are empty
+@functools.lru_cache
+def jac_sparsity(Nx):
+    pattern = local_sparsity(Nx, [[1, 1, 0, 1],
+                                  [1, 1, 0, 1],
+                                  [0, 1, 1, 1],
+                                  [0, 1, 1, 1]])
+    return pattern, group_columns(pattern)
 
-    maxy = np.maximum(np.max(sol.y), np.max(combined_apar));
 
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,maxy/scalar+0.05], xlabel="x", ylabel="par3,A/P")
-    ax.legend()
-    ax.set_title("apar combo, plot without par3" if no_par3 else "apar combo")
+# finite difference jacobian needing one call per column group plus one per cytoplasmic pool
+# ctx is created if missing so this also works alongside the loop odefunc
+def sparsity_jacobian(t, U, kvals, ctx=None):
+    ctx = RHSContext(4, kvals["Nx"]) if ctx is None else ctx
+    return grouped_jacobian(lambda Y, pools: odefunc_vectorised(t, Y, kvals, ctx, pools),
+                            lambda Y: cytoplasm_pools(Y, kvals), U, *jac_sparsity(kvals["Nx"]))
 
-    def animate(t_i):
-        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
-        line1.set_ydata(combined_apar[t_i]/scalar)
-        line2.set_ydata(sol.y[3*Nx:, t_i]/scalar)
-        p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, t_i], sol.y[3*Nx:, t_i], Nx)
-        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
-        return (line1, line2, linev, time_label)
 
-    ani = animation.FuncAnimation(fig, animate, interval=10000/len(sol.t), blit=True, frames=len(sol.t))
+# kvals for a run: the parameters plus the grid, output times and initial condition
+def setup_kvals(args=None):
+    if args is None:
+        args = {}
+    params = {**DEFAULT_PARAMETERS, **args}
 
-    if save_file:
-        file_name = f"{file_code}_spatialPar.mp4"
-        print(f"Saving animation to {file_name}")
-        ani.save(file_name)
+    # calculate other widely used values
+    X = np.linspace(params["x0"], params["xL"], params["Nx"])
+    deltax = np.abs(X[1] - X[0])
+    simpson_weights(X)  # worked out once here for Ybar on every right hand side call
 
-    plt.show(block=False)
+    # key values
+    kvals: dict = {**params, "X": X, "deltax": deltax}
 
+    # default time points for solver output
+    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"] * np.abs(kvals["tL"] - kvals["t0"])))
 
-def plot_final_timestep_apar_combo(sol, kvals):
-    plt.figure()
-    ax = plt.subplot()
+    # default initial condition (just all 0) if none passed
+    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else [0]*(kvals["Nx"]*4)
 
-    Nx = kvals["Nx"]
-    scalar = 1
+    return kvals
 
-    combined_apar = (sol.y[:Nx, -1] + sol.y[Nx:2*Nx, -1] + sol.y[2*Nx:3*Nx, -1])
 
-    ax.plot(kvals["X"], combined_apar / scalar, label="anterior", color="green")
-    ax.plot(kvals["X"], sol.y[3 * Nx:, -1] / scalar, label="posterior", color="orange")
+# right hand side and its extra solve_ivp args for rhs_mode "vectorised"
+# batch_shape sizes any output buffer for a stack of states (n, ...), as used by ensemble.py
+def vectorised_rhs(kvals, batch_shape=()):
+    return odefunc_vectorised, (kvals, RHSContext(4, kvals["Nx"], batch_shape=batch_shape))
 
-    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
-    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
-    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
 
-    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-    ax.set_title("apar combo")
+def run_model(args=None):
+    kvals = setup_kvals(args)
 
-    ax.legend()
+    rhs, rhs_args = vectorised_rhs(kvals) if kvals["rhs_mode"] == "vectorised" else (odefunc, (kvals,))
 
-    plt.show(block=False)
+    jac = {"analytic": jacobian, "sparsity": sparsity_jacobian}.get(kvals["jacobian"])
 
+    if kvals["mode"] == "steady_state":
+        return steady_state.solve(kvals, rhs, rhs_args, jac, jac or sparsity_jacobian), kvals
 
-    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
-    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
-    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
+    sol = steady_state.integrate(kvals, rhs, kvals["initial_condition"], method="BDF", args=rhs_args, jac=jac)
 
-    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+    return sol, kvals
 
-    # ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, -1])/scalar-0.05, np.max(sol.y[:, -1])/scalar+0.05], xlabel="x", ylabel="A/P")
-    ax.legend()
 
-    plt.show(block=False)
\ No newline at end of file
+# Plotting functions are in par3addition_plots, imported on first use of one through this module
+# (e.g. par3addition.animate_plot) so that solving doesn't import matplotlib
+def __getattr__(attr):
+    if not attr.startswith("__"):
+        from . import par3addition_plots
+        if hasattr(par3addition_plots, attr):
+            return getattr(par3addition_plots, attr)
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
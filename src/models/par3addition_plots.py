@@ -0,0 +1,217 @@
+# Plotting for par3addition, kept out of the model module so runs don't import matplotlib
+import time
+import numpy as np
+from matplotlib import pyplot as plt, animation
+
+from src.models.metric_functions import orientation_marker, polarity_get_all, polarity_batch, polarity_of_results, \
+    species_blocks
+from src.models.par3addition import DEFAULT_PARAMETERS
+
+
+def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
+    if file_code is None:
+        file_code = f'{time.time_ns()}'[5:]
+
+    # rescale so maximal protein quantity is 1
+    scalar = 1 if not rescale else np.max(sol.y)
+    v_rescale_for_visibility = np.max(sol.y)/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
+
+    Nx = kvals["Nx"]
+    # J = U[:Nx]
+    # M = U[Nx:2 * Nx]
+    # A = U[2 * Nx:3 * Nx]
+    # P = U[3 * Nx:]
+    fig, ax = plt.subplots()
+    line1, = ax.plot(kvals["X"], sol.y[:Nx, 0]/scalar, label="par3", color="green")
+    line2, = ax.plot(kvals["X"], sol.y[Nx:2*Nx, 0]/scalar, label="par3-PKC", color="purple")
+    line3, = ax.plot(kvals["X"], sol.y[2*Nx:3*Nx, 0]/scalar, label="cdc42-PKC", color="blue")
+    line4, = ax.plot(kvals["X"], sol.y[3*Nx:, 0]/scalar, label="posterior", color="orange")
+    p_m_all, _ = polarity_batch(kvals["X"], species_blocks(sol.y, 4, Nx), 2, 3)
+    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m_all[0]:.4f}", transform=ax.transAxes, ha="center")
+    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
+
+    ax.text(0.7, 1.05, kvals["label"] + ";Nx:" + str(Nx), transform=ax.transAxes, ha="center")
+
+    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,np.max(sol.y)/scalar+0.05], xlabel="x", ylabel="par3,A/P")
+    ax.legend()
+
+    def animate(t_i):
+        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
+        line1.set_ydata(sol.y[:Nx, t_i]/scalar)
+        line2.set_ydata(sol.y[Nx:2*Nx, t_i]/scalar)
+        line3.set_ydata(sol.y[2*Nx:3*Nx, t_i]/scalar)
+        line4.set_ydata(sol.y[3*Nx:, t_i]/scalar)
+        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m_all[t_i]:.4f}")
+        return (line1, line2, line3, line4, linev, time_label)
+
+    ani = animation.FuncAnimation(fig, animate, interval=10000/len(sol.t), blit=True, frames=len(sol.t))
+
+    if save_file:
+        file_name = f"{file_code}_spatialPar.mp4"
+        print(f"Saving animation to {file_name}")
+        ani.save(file_name)
+
+    plt.show(block=False)
+
+
+def plot_final_timestep(sol, kvals, rescale=False):
+    plt.figure()
+    ax = plt.subplot()
+
+    Nx = kvals["Nx"]
+    scalar = 1 if not rescale else np.max(sol.y)
+
+    ax.plot(kvals["X"], sol.y[:Nx, -1] / scalar, label="par3", color="green")
+    ax.plot(kvals["X"], sol.y[Nx:2 * Nx, -1] / scalar, label="par3-PKC", color="purple")
+    ax.plot(kvals["X"], sol.y[2 * Nx:3 * Nx, -1] / scalar, label="cdc42-PKC", color="blue")
+    ax.plot(kvals["X"], sol.y[3 * Nx:, -1] / scalar, label="posterior", color="orange")
+
+    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
+    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
+    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
+
+    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+
+    # ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, -1])/scalar-0.05, np.max(sol.y[:, -1])/scalar+0.05], xlabel="x", ylabel="A/P")
+    ax.legend()
+
+    plt.show(block=False)
+
+
+# polarity based on the cdc42 quantity for Anterior
+# untested code
+def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
+    plt.figure()
+    ax = plt.subplot()
+
+    # add then remove plot with xticks so that they get ordered correctly in the figure
+    sentinel, = ax.plot(x_axis_labels, [0.5]*len(x_axis_labels))
+    sentinel.remove()
+
+    for i in np.arange(0, len(variation_sets)):
+        variation = variation_sets[i]
+        sol_list = variation[0]
+        kvals_list = variation[1]
+
+        polarity_m_list = []
+        xticks = []
+        if len(variation_sets) > 7:
+            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+        else:
+            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+
+        p_measure_all, p_orientation_all = polarity_of_results(sol_list, kvals_list, 4, 2, 3)
+
+        for j in np.arange(0, len(sol_list)):
+            sol = sol_list[j]
+            kvals = kvals_list[j]
+
+            if not sol == "FAILURE":
+                p_measure = p_measure_all[j]
+
+                xtick = x_axis_labels[j] if x_axis_labels is not None else j
+                marker = 'o' if not show_orientation else orientation_marker(p_orientation_all[j])
+
+                # jitter the near-0 values so they are visible
+                if p_measure<0.02:
+                    p_measure += 0.02*i/len(variation_sets)-0.01
+
+                polarity_m_list.append(p_measure)
+                xticks.append(xtick)
+                ax.scatter(xtick, p_measure, color=color, marker=marker, s=100)
+
+        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
+
+    ax.legend()
+    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
+    ax.title.set_text(label)
+    ax.tick_params(which="both", labelsize=15)
+    ax.tick_params(axis='x', labelrotation=60)
+    plt.show(block=False)
+
+
+# plot combined A,M,J (aPars)
+
+def animate_plot_apar_combo(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False, no_par3=False):
+    if file_code is None:
+        file_code = f'{time.time_ns()}'[5:]
+
+    Nx = kvals["Nx"]
+    # J = U[:Nx]
+    # M = U[Nx:2 * Nx]
+    # A = U[2 * Nx:3 * Nx]
+    # P = U[3 * Nx:]
+
+    combined_apar = []
+
+    for i in np.arange(0,len(sol.t)):
+        combined_apar.append((sol.y[Nx:2*Nx, i] + sol.y[2*Nx:3*Nx, i]) if no_par3 else (sol.y[:Nx, i]) + sol.y[Nx:2*Nx, i] + sol.y[2*Nx:3*Nx, i])
+    scalar = 1 if not rescale else np.max(sol.y)
+    v_rescale_for_visibility = np.maximum(np.max(sol.y), np.max(combined_apar[0]))/scalar * 10  # rescale so 0.1 is equal to max protein quantity in the plotting of v
+
+    fig, ax = plt.subplots()
+    line1, = ax.plot(kvals["X"], combined_apar[0]/scalar, label="anterior", color="green")
+    line2, = ax.plot(kvals["X"], sol.y[3*Nx:, 0]/scalar, label="posterior", color="orange")
+    p_m_all, _ = polarity_batch(kvals["X"], species_blocks(sol.y, 4, Nx), 2, 3)  # polarisation metric
+    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m_all[0]:.4f}", transform=ax.transAxes, ha="center")
+    linev, = ax.plot(kvals["X"], [v_rescale_for_visibility*kvals["v_func"](kvals, x, 0) for x in kvals["X"]], label="v", linestyle="--", color="black")
+
+    ax.text(0.7, 1.05, kvals["label"] + ";Nx:" + str(Nx), transform=ax.transAxes, ha="center")
+
+    maxy = np.maximum(np.max(sol.y), np.max(combined_apar));
+
+    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y)/scalar-0.05,maxy/scalar+0.05], xlabel="x", ylabel="par3,A/P")
+    ax.legend()
+    ax.set_title("apar combo, plot without par3" if no_par3 else "apar combo")
+
+    def animate(t_i):
+        linev.set_ydata([v_rescale_for_visibility*kvals["v_func"](kvals, x, sol.t[t_i]) for x in kvals["X"]])
+        line1.set_ydata(combined_apar[t_i]/scalar)
+        line2.set_ydata(sol.y[3*Nx:, t_i]/scalar)
+        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m_all[t_i]:.4f}")
+        return (line1, line2, linev, time_label)
+
+    ani = animation.FuncAnimation(fig, animate, interval=10000/len(sol.t), blit=True, frames=len(sol.t))
+
+    if save_file:
+        file_name = f"{file_code}_spatialPar.mp4"
+        print(f"Saving animation to {file_name}")
+        ani.save(file_name)
+
+    plt.show(block=False)
+
+
+def plot_final_timestep_apar_combo(sol, kvals):
+    plt.figure()
+    ax = plt.subplot()
+
+    Nx = kvals["Nx"]
+    scalar = 1
+
+    combined_apar = (sol.y[:Nx, -1] + sol.y[Nx:2*Nx, -1] + sol.y[2*Nx:3*Nx, -1])
+
+    ax.plot(kvals["X"], combined_apar / scalar, label="anterior", color="green")
+    ax.plot(kvals["X"], sol.y[3 * Nx:, -1] / scalar, label="posterior", color="orange")
+
+    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
+    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
+    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
+
+    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+    ax.set_title("apar combo")
+
+    ax.legend()
+
+    plt.show(block=False)
+
+
+    p_m, _, _ = polarity_get_all(kvals["X"], sol.y[2*Nx:3*Nx, -1], sol.y[3*Nx:, -1], Nx)
+    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time value
+    ax.plot(kvals["X"], [kvals["v_func"](kvals, x, sol.t[-1]) for x in kvals["X"]], label="v", linestyle="--", color="black")  # v_func
+
+    ax.text(0.7, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+
+    # ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:, -1])/scalar-0.05, np.max(sol.y[:, -1])/scalar+0.05], xlabel="x", ylabel="A/P")
+    ax.legend()
+
+    plt.show(block=False)
\ No newline at end of file
@@ -0,0 +1,161 @@
+# Getting to steady states without integrating to tL
+# integrate: time integration that can stop once the state stops changing (steady_state_event_tol)
+# solve: run_model's mode "steady_state", integrate for a short while then solve F(U) = 0 directly
+# with Newton's method on the model's sparse jacobian, rather than integrating until nothing changes
+# Both return sols whose last column is at tL so code taking sol.y[:, -1] works as for a full run
+import numpy as np
+from scipy import sparse
+from scipy.optimize import OptimizeResult
+from scipy.sparse import linalg
+from . import task_budget
+
+# Newton iterations before a solve is counted as not converging
+MAX_NEWTON_ITERATIONS = 30
+
+# largest problem the stability of a steady state is checked for, it takes a dense eigenvalue solve
+MAX_STABILITY_SIZE = 1000
+
+
+# damped Newton iterations from U, returns (U, max |F(U)|, iterations, converged)
+def newton(fun, jac, U, tol):
+    F = fun(U)
+    norm = np.max(np.abs(F))
+    for iteration in range(MAX_NEWTON_ITERATIONS):
+        if norm < tol:
+            return U, norm, iteration, True
+
+        J = jac(U)
+        dU = linalg.spsolve(sparse.csc_matrix(J), -F)
+        if not np.all(np.isfinite(dU)):
+            break
+
+        # halve the step until the residual goes down
+        step = 1.0
+        while step > 1 / 64:
+            U_new = U + step * dU
+            F_new = fun(U_new)
+            norm_new = np.max(np.abs(F_new))
+            if norm_new < (1 - 1e-4 * step) * norm:
+                break
+            step /= 2
+        else:
+            break
+
+        U, F, norm = U_new, F_new, norm_new
+
+    return U, norm, MAX_NEWTON_ITERATIONS, norm < tol
+
+
+# largest real part of the jacobian's eigenvalues, positive means the steady state is unstable
+def max_real_eigenvalue(J):
+    if J.shape[0] > MAX_STABILITY_SIZE:
+        return None
+    J = J.toarray() if sparse.issparse(J) else np.asarray(J)
+    return float(np.max(np.linalg.eigvals(J).real))
+
+
+# v_func etc. are evaluated at tL, so this is only meaningful for models that are autonomous by then
+# jac_integrate is the jacobian used for time stepping (None for BDF's own), jac_newton must give a matrix
+# the transient is integrated for steady_state_transient, and doubled each time Newton fails or
+# finds an unstable state, up to tL where the integrated state is returned as it is
+def solve(kvals: dict, rhs, rhs_args, jac_integrate, jac_newton):
+    t0, tL = kvals["t0"], kvals["tL"]
+    y0 = np.asarray(kvals["initial_condition"], dtype=float)
+    tol = kvals["steady_state_tol"]
+
+    def fun(U):
+        return rhs(tL, U, *rhs_args)
+
+    def jac(U):
+        return jac_newton(tL, U, *rhs_args)
+
+    t, U, T = t0, y0, kvals["steady_state_transient"]
+    nfev = 0
+    transients = 0
+    while True:
+        t_next = min(t + T, tL)
+        transient = task_budget.solve_ivp(kvals, rhs, [t, t_next], U, method="BDF", t_eval=[t_next],
+                                          args=rhs_args, jac=jac_integrate)
+        nfev += transient.nfev
+        transients += 1
+        if transient.status != 0 or len(transient.t) == 0:
+            transient.steady_state_converged = False
+            return transient
+        t, U = t_next, transient.y[:, -1]
+
+        U_ss, residual, iterations, converged = newton(fun, jac, U, tol)
+        eigenvalue = max_real_eigenvalue(jac(U_ss)) if converged else None
+        stable = eigenvalue is None or eigenvalue < tol
+
+        if converged and stable:
+            message = f"Newton converged to a steady state after integrating to t={t:g}"
+            break
+        if t >= tL:
+            U_ss, residual = U, np.max(np.abs(fun(U)))
+            converged, eigenvalue = False, None
+            message = f"no stable steady state found by Newton, returning the state at t={tL:g}"
+            break
+        T *= 2
+
+    return OptimizeResult(t=np.array([t0, tL]), y=np.column_stack([y0, U_ss]), sol=None,
+                          t_events=None, y_events=None, nfev=nfev, njev=0, nlu=0,
+                          status=0, message=message, success=True,
+                          steady_state_converged=converged, residual_norm=residual,
+                          newton_iterations=iterations, transient_time=t, transients=transients,
+                          max_real_eigenvalue=eigenvalue)
+
+
+# terminal event for when max |dU/dt| has stayed below tol for window (model time)
+# checked once per accepted step, costing one extra right hand side call
+class SteadyStateEvent:
+    terminal = True
+    direction = -1
+
+    def __init__(self, fun, tol, window):
+        self.fun = fun
+        self.tol = tol
+        self.window = window
+        self.below_since = None
+        self.reached_at = None
+
+    def __call__(self, t, y, *args):
+        if self.reached_at is None:
+            if np.max(np.abs(self.fun(t, np.asarray(y, dtype=float), *args))) < self.tol:
+                self.below_since = t if self.below_since is None else self.below_since
+                if t - self.below_since >= self.window:
+                    self.reached_at = t
+            else:
+                self.below_since = None
+        # once reached, zero at that step so solve_ivp stops there
+        return 1.0 if self.reached_at is None else self.reached_at - t
+
+
+# task_budget.solve_ivp over [t0, tL] at t_eval, options are passed on (args, jac, ...)
+# with kvals["steady_state_event_tol"] set the solve stops once the state has settled, the output is then
+# padded with the settled state up to tL and sol["steady_state_time"] says when it settled
+def integrate(kvals: dict, fun, y0, **options):
+    if kvals["steady_state_event_tol"] is None:
+        return task_budget.solve_ivp(kvals, fun, [kvals["t0"], kvals["tL"]], y0, t_eval=kvals["t_eval"], **options)
+
+    event = SteadyStateEvent(fun, kvals["steady_state_event_tol"], kvals["steady_state_event_window"])
+    sol = task_budget.solve_ivp(kvals, fun, [kvals["t0"], kvals["tL"]], y0, t_eval=kvals["t_eval"],
+                                events=[event], **options)
+
+    # the event is ours, leave t_events as a run without it would have them
+    y_settled = sol.y_events[-1][0] if sol.t_events is not None and len(sol.t_events[-1]) > 0 else None
+    if sol.t_events is not None:
+        sol.t_events = sol.t_events[:-1] or None
+        sol.y_events = sol.y_events[:-1] or None
+
+    if event.reached_at is None or y_settled is None:
+        return sol
+
+    t_eval = kvals["t_eval"]
+    t_pad = np.asarray(t_eval if t_eval is not None else [kvals["tL"]], dtype=float)
+    t_pad = t_pad[t_pad > (sol.t[-1] if len(sol.t) > 0 else event.reached_at)]
+    sol.t = np.concatenate([sol.t, t_pad])
+    sol.y = np.concatenate([sol.y.reshape(len(y_settled), -1), np.repeat(y_settled[:, None], len(t_pad), axis=1)], axis=1)
+    sol.status = 0
+    sol.message = f"steady state reached at t={event.reached_at:g}, padded to tL"
+    sol["steady_state_time"] = event.reached_at
+    return sol
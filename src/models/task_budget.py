@@ -0,0 +1,137 @@
+# Per task limits on a solve so a pathological parameter set can't hold up a sweep
+# kvals "max_seconds" (wall time), "max_nfev" (right hand side calls) and "min_step" (smallest
+# accepted time step below which the solve is considered stuck, once the steps have first grown past it),
+# None for no limit
+# kvals "divergence_bounds" (lower, upper) stops a solve whose state leaves them, as the models'
+# right hand sides used to by raising AssertionError, None to not check
+# A solve that hits a limit stops at the step where it did, keeping the output up to there
+import time
+import numpy as np
+from scipy import integrate
+from scipy.optimize import OptimizeResult
+
+BUDGET_KEYS = ["max_seconds", "max_nfev", "min_step", "divergence_bounds"]
+
+# the budget is checked after every accepted step, a step that never finishes (e.g. newton
+# iterations failing over and over) is stopped from the right hand side once it is this far over
+HARD_LIMIT_FACTOR = 1.5
+
+
+# stands in for the "FAILURE" string in results, so checks like sol == "FAILURE" still work,
+# but carries why the task failed and any solution computed before it did
+class TaskFailure(str):
+    def __new__(cls, reason: str, partial_sol=None):
+        failure = super().__new__(cls, "FAILURE")
+        failure.reason = reason
+        failure.partial_sol = partial_sol
+        return failure
+
+    def __repr__(self):
+        return f"TaskFailure({self.reason!r})"
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, kvals: dict, t_end: float):
+        self.max_seconds = kvals.get("max_seconds")
+        self.max_nfev = kvals.get("max_nfev")
+        self.min_step = kvals.get("min_step")
+        self.divergence_bounds = kvals.get("divergence_bounds")
+        self.t_end = t_end
+
+        self.start = time.time()
+        self.nfev = 0
+        self.reason = None
+        self.tripped_at = None
+        self.last_step = None  # (t, y) of the last accepted step
+        self.min_step_reached = False
+
+    def over(self, factor=1):
+        if self.max_seconds is not None and time.time() - self.start > factor * self.max_seconds:
+            return f"wall time over max_seconds={self.max_seconds}"
+        if self.max_nfev is not None and self.nfev > factor * self.max_nfev:
+            return f"right hand side calls over max_nfev={self.max_nfev}"
+        return None
+
+    def wrap(self, fun):
+        def counted_fun(t, y, *args):
+            self.nfev += 1
+            reason = self.over(HARD_LIMIT_FACTOR)
+            if reason is not None:
+                self.reason = reason
+                raise BudgetExceeded(reason)
+            return fun(t, y, *args)
+        return counted_fun
+
+    # terminal event, positive until a limit is hit and then zero at that step
+    # solve_ivp calls it once per accepted step, and only locates the root once it has been hit
+    def event(self, t, y, *args):
+        if self.tripped_at is None:
+            reason = self.over()
+            if reason is None and self.min_step is not None and self.last_step is not None and t < self.t_end:
+                step = t - self.last_step[0]
+                # BDF starts with steps far below min_step, so it only applies once a step has reached it
+                if step >= self.min_step:
+                    self.min_step_reached = True
+                elif 0 < step and self.min_step_reached:
+                    reason = f"step {step:.3g} below min_step={self.min_step}"
+            if reason is None and self.divergence_bounds is not None:
+                lower, upper = self.divergence_bounds
+                if np.min(y) < lower or np.max(y) > upper:
+                    reason = f"diverged, state left divergence_bounds=({lower}, {upper}) at t={t:.4f}"
+            if reason is not None:
+                self.reason, self.tripped_at = reason, t
+            else:
+                self.last_step = (t, np.array(y))
+        return 1.0 if self.tripped_at is None else self.tripped_at - t
+
+    event.terminal = True
+    event.direction = -1
+
+
+def has_budget(kvals: dict) -> bool:
+    return any(kvals.get(key) is not None for key in BUDGET_KEYS)
+
+
+# integrate.solve_ivp with the limits in kvals
+# if a limit is hit sol["stop_reason"] holds the reason, sol.t and sol.y stop where the solve did and
+# sol["last_good_t"], sol["last_good_y"] are the last accepted step before it
+def solve_ivp(kvals: dict, fun, t_span, y0, **options):
+    if not has_budget(kvals):
+        return integrate.solve_ivp(fun, t_span, y0, **options)
+
+    budget = Budget(kvals, t_span[1])
+    events = options.pop("events", None)
+    events = [] if events is None else list(events) if isinstance(events, (list, tuple)) else [events]
+
+    try:
+        sol = integrate.solve_ivp(budget.wrap(fun), t_span, y0, events=events + [budget.event], **options)
+    except BudgetExceeded:
+        t_last, y_last = budget.last_step if budget.last_step is not None else (t_span[0], np.asarray(y0))
+        sol = OptimizeResult(t=np.array([t_last]), y=np.asarray(y_last)[:, None], sol=None,
+                             t_events=[np.empty(0)] * len(events) or None,
+                             y_events=[np.empty((0, len(y0)))] * len(events) or None,
+                             nfev=budget.nfev, njev=0, nlu=0, status=-1, message=budget.reason, success=False)
+    else:
+        # the budget's event is ours, leave the caller's events as they passed them
+        sol.t_events = sol.t_events[:-1] or None
+        sol.y_events = sol.y_events[:-1] or None
+        if budget.reason is not None:
+            sol.message = budget.reason
+            sol.success = False
+
+    if budget.reason is not None:
+        sol["stop_reason"] = budget.reason
+        if budget.last_step is not None:
+            sol["last_good_t"], sol["last_good_y"] = budget.last_step
+    return sol
+
+
+# (sol, kvals) from run_model, or (TaskFailure, kvals) if the solve hit a limit
+def result_or_failure(sol, kvals: dict) -> tuple:
+    if isinstance(sol, dict) and "stop_reason" in sol:
+        return TaskFailure(sol["stop_reason"], sol), kvals
+    return sol, kvals
@@ -1,16 +1,14 @@
 # Based on Tostevin, Howard (2008)
-import time
+import functools
 import numpy as np
-from scipy import integrate
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from .metric_functions import polarity_measure, polarity_orientation, orientation_marker
+from scipy import integrate, sparse
+from . import task_budget, steady_state
+from .discretisation import diffusion_term, expand_to, RHSContext, diffusion_matrix, diag, local_sparsity, group_columns, \
+    grouped_jacobian
 
+# x can be a single point or an array of points
 def default_a_func(kvals, lt, x):
-    if 0 <= x <= lt:
-        return kvals["a_0"] * kvals["L"] / lt
-    else:
-        return 0
+    return np.where((0 <= x) & (x <= lt), kvals["a_0"] * kvals["L"] / lt, 0)
 
 
 DEFAULT_PARAMETERS = {
@@ -41,7 +39,32 @@ DEFAULT_PARAMETERS = {
     "a_0": 1,
     "epsilon": 0.4,
 
-    "a_func": default_a_func
+    "a_func": default_a_func,
+
+    # "vectorised" evaluates the right hand side over whole arrays, "loop" goes point by point
+    "rhs_mode": "vectorised",
+    # "analytic" passes jacobian to the solver, "sparsity" passes sparsity_jacobian (grouped finite differences)
+    # None leaves BDF to estimate it by finite differences
+    # tostevin is the one model left on None: a_func and m_t step where l crosses a grid point, and once l
+    # slides along one (e.g. cA2 >= 0.1) Newton stalls with jacobian or sparsity_jacobian whatever the
+    # difference step in l, while BDF's own differences, which adapt their step per column, get through
+    "jacobian": None,
+
+    # "integrate" solves over [t0, tL], "steady_state" integrates for steady_state_transient then solves
+    # for the steady state directly (see steady_state.py), stopping at max|dU/dt| < steady_state_tol
+    "mode": "integrate",
+    "steady_state_transient": 100,
+    "steady_state_tol": 1e-9,
+    # with mode "integrate", stop once max|dU/dt| < steady_state_event_tol for steady_state_event_window
+    # and pad the output with the settled state, None to always integrate to tL
+    "steady_state_event_tol": None,
+    "steady_state_event_window": 100,
+
+    # limits on the solve, None for no limit, see task_budget
+    "max_seconds": None,
+    "max_nfev": None,
+    "min_step": None,
+    "divergence_bounds": (-100, 100),  # stop if any value leaves these, numerical issues can otherwise run forever
 }
 
 
@@ -59,12 +82,6 @@ def discrete_diffusion_term(kvals: dict, Y, x_i):
 def odefunc(t, U, kvals):
     assert len(U) == 4 * kvals["Nx"] + 1
 
-    # Failure so odefunc doesn't run forever trying to fix numerical issues
-    if min(U) < -100 or max(U) > 100:
-        print(f"FAILURE with tostevin labelled {kvals['label']} at simulation time {t:.4f}")
-        # plot_failure(U, t, kvals)
-        raise AssertionError
-
     Am = U[:kvals["Nx"]]
     Ac = U[kvals["Nx"]:2 * kvals["Nx"]]
     Pm = U[2 * kvals["Nx"]:3 * kvals["Nx"]]
@@ -98,240 +115,197 @@ def odefunc(t, U, kvals):
     return np.append(np.ravel([dudt_Am, dudt_Ac, dudt_Pm, dudt_Pc]), dudt_L)
 
 
-def run_model(args=None):
-    if args is None:
-        args = {}
-
-    params = {**DEFAULT_PARAMETERS, **args}
-
-    # calculate other widely used values
-    X = np.linspace(params["x0"], params["xL"], params["Nx"])
-    deltax = np.abs(X[1] - X[0])
-
-    # key values
-    kvals: dict = {**params, "X": X, "deltax": deltax}
-
-    # default time points for solver output
-    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"]*np.abs(kvals["tL"]-kvals["t0"])))
-
-    # default initial condition if none passed
-    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else np.append(
-        np.ravel([[1, 0, 0, 1] for x_i in np.arange(0, kvals["Nx"])], order='F'), kvals["L"])
-
-    sol = integrate.solve_ivp(odefunc, [kvals["t0"], kvals["tL"]], kvals["initial_condition"], method="BDF",
-                              t_eval=kvals["t_eval"], args=(kvals,))
-
-    return sol, kvals
-
-
-# Plotting Functions
-def animate_plot(sol, kvals: dict, save_file=False, file_code: str = None, rescale=False):
-    if file_code is None:
-        file_code = f'{time.time_ns()}'[5:]
-
-    # rescale so maximal protein quantity is 1
-    scalar = 1 if not rescale else np.max(sol.y[:-1, :])
-
-    fig, ax = plt.subplots()
-    linePc, = ax.plot(kvals["X"], sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], 0]/scalar, label="Pc", color="orange", linestyle="--")
-    lineAc, = ax.plot(kvals["X"], sol.y[kvals["Nx"]:2 * kvals["Nx"], 0]/scalar, label="Ac", color="blue", linestyle="--")
-    linePm, = ax.plot(kvals["X"], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], 0]/scalar, label="Pm", color="orange")
-    lineAm, = ax.plot(kvals["X"], sol.y[:kvals["Nx"], 0]/scalar, label="Am", color="blue")
-
-    p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], 0], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], 0], kvals["Nx"])
-    time_label = ax.text(0.1, 1.05, f"t={sol.t[0]} p={p_m:.4f}", transform=ax.transAxes, ha="center")
-
-    if rescale:
-        ax.text(1, 1.05, kvals["label"] + " (quantities scaled)", transform=ax.transAxes, ha="center")
-    else:
-        ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:-1, :])/scalar - 0.05, np.max(sol.y[:-1, :])/scalar + 0.05], xlabel="x", ylabel="A/P")
-    ax.legend()
-
-    def animate(t_i):
-        lineAm.set_ydata(sol.y[:kvals["Nx"], t_i] / scalar)  # Am
-        lineAc.set_ydata(sol.y[kvals["Nx"]:2 * kvals["Nx"], t_i] / scalar)  # Ac
-        linePm.set_ydata(sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], t_i] / scalar)  # Pm
-        linePc.set_ydata(sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], t_i] / scalar)  # Pc
-
-        p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], t_i], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], t_i], kvals["Nx"])
-        time_label.set_text(f"t={sol.t[t_i]:.2f} p={p_m:.4f}")
-        return lineAm, lineAc, linePm, linePc, time_label
+# vectorised a_func contract is a_func(kvals, lt, X) -> array over X
+# a_funcs written for a single x (e.g. with if statements) are wrapped to be called point by point
+def pointwise_a_func(a_func, kvals, lt, X):
+    return np.array([a_func(kvals, lt, x) for x in X])
 
-    ani = animation.FuncAnimation(fig, animate, interval=5000/len(sol.t), blit=True, frames=len(sol.t))
 
-    if save_file:
-        file_name = f"{file_code}_refParModelOut.mp4"
-        print(f"Saving animation to {file_name}")
-        ani.save(file_name)
+def vectorise_a_func(a_func, kvals):
+    try:
+        a = np.asarray(a_func(kvals, kvals["L"], kvals["X"]), dtype=float)
+        if a.shape in [(), kvals["X"].shape]:
+            return a_func
+    except (ValueError, TypeError):
+        pass
+    return functools.partial(pointwise_a_func, a_func)
 
-    plt.show(block=False)
 
+# trapezoid weights for the integral over X < l
+# X is increasing so those points are the first n = searchsorted(X, l) of the grid
+def moving_boundary_weights(X, l, deltax):
+    n = np.searchsorted(X, l)
+    idx = np.arange(len(X)).reshape((-1,) + (1,) * np.ndim(n))
+    return deltax * ((idx < n) - 0.5 * ((idx == 0) & (n > 0)) - 0.5 * (idx == n - 1))
 
-def plot_lt(sol, kvals):
-    plt.figure()
-    ax = plt.subplot()
-    ax.plot(sol.t, sol.y[-1, :], label="l(t)")
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-    plt.xlabel("t")
-    plt.ylabel("length")
-    plt.show(block=False)
 
+# the nonlocal value [m_t], the membrane A over the region X < l
+def cytoplasm_pools(U, kvals):
+    m_t = np.sum(moving_boundary_weights(kvals["X"], U[-1], kvals["deltax"]) * U[:kvals["Nx"]], axis=0) / kvals["L"]
+    return np.array([m_t])
 
-def plot_final_timestep(sol, kvals, rescale=False):
-    plt.figure()
-    ax = plt.subplot()
 
-    # scaling takes into account all time
-    scalar = 1 if not rescale else np.max(sol.y[:-1, :])
+# same system as odefunc but evaluated over the whole grid at once
+# results are written into the preallocated buffer held by ctx (an RHSContext for 4 species and l)
+# ctx.a_func is kvals["a_func"] passed through vectorise_a_func
+# pools overrides cytoplasm_pools(U), used to hold m_t fixed for sparsity_jacobian
+def odefunc_vectorised(t, U, kvals, ctx, pools=None):
+    Nx = kvals["Nx"]
 
-    ax.plot(kvals["X"], sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], -1]/scalar, label="Pc", color="orange", linestyle="--")
-    ax.plot(kvals["X"], sol.y[kvals["Nx"]:2 * kvals["Nx"], -1]/scalar, label="Ac", color="blue", linestyle="--")
-    ax.plot(kvals["X"], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1]/scalar, label="Pm", color="orange")
-    ax.plot(kvals["X"], sol.y[:kvals["Nx"], -1]/scalar, label="Am", color="blue")
+    assert len(U) == 4 * Nx + 1
 
-    p_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"], -1], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1], kvals["Nx"])
-    ax.text(0.1, 1.05, f"t={sol.t[-1]},p={p_m:.4f}", transform=ax.transAxes, ha="center")  # time label
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(sol.y[:-1, -1])/scalar - 0.05, np.max(sol.y[:-1, -1])/scalar + 0.05],
-           xlabel="x",
-           ylabel="A/P")
-    ax.legend()
-
-    plt.show(block=False)
-
-
-def plot_overall_quantities_over_time(sol, kvals, rescale_by_length=True):
-    plt.figure()
-    ax = plt.subplot()
-
-    # since this is overall quantity, rescale by space length
-    length_scalar = 1 if not rescale_by_length else np.abs(kvals["xL"] - kvals["x0"])
-
-    ax.plot(sol.t, [integrate.trapezoid(sol.y[:kvals["Nx"], t_i], dx=kvals["deltax"])/length_scalar for t_i in np.arange(0, len(sol.t))], label="Am", color="blue")
-    ax.plot(sol.t, [integrate.trapezoid(sol.y[kvals["Nx"]:2 * kvals["Nx"], t_i], dx=kvals["deltax"])/length_scalar for t_i in np.arange(0, len(sol.t))], label="Ac", color="blue", linestyle="--")
-    ax.plot(sol.t, [integrate.trapezoid(sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], t_i], dx=kvals["deltax"])/length_scalar for t_i in np.arange(0, len(sol.t))], label="Pm", color="orange")
-    ax.plot(sol.t, [integrate.trapezoid(sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], t_i], dx=kvals["deltax"])/length_scalar for t_i in np.arange(0, len(sol.t))], label="Pc", color="orange", linestyle="--")
-
-    ax.plot(sol.t, sol.y[-1, :]/length_scalar, label="l(t)")
-
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
-
-    ax.set(xlabel="time")
-
-    ax.title.set_text("Quantities")
-
-    ax.legend()
-    plt.show(block=False)
+    Am = U[:Nx]
+    Ac = U[Nx:2 * Nx]
+    Pm = U[2 * Nx:3 * Nx]
+    Pc = U[3 * Nx:4 * Nx]
+    l = U[-1]
 
+    dudt_Am, dudt_Ac, dudt_Pm, dudt_Pc = ctx.species
 
-def plot_multi_final_timestep(sol_list, kvals_list, label=DEFAULT_PARAMETERS["label"], plot_Am=True, plot_Ac=True, plot_Pm=True, plot_Pc=True):
-    assert plot_Am or plot_Ac or plot_Pm or plot_Pc
+    # calculate dudt_L
+    m_t, = cytoplasm_pools(U, kvals) if pools is None else pools
+    lambda_t = kvals["lambda_0"] - kvals["lambda_1"] * m_t
+    ctx.extra[0] = -kvals["epsilon"] * (l - lambda_t) / lambda_t
 
-    kvals = kvals_list[0]
+    # net flux from cytoplasm to membrane
+    # X is expanded to (Nx, 1) for stacked states so a_func broadcasts against one l per member
+    A_exchange = (kvals["cA1"] + kvals["cA2"] * ctx.a_func(kvals, l, expand_to(kvals["X"], Am))) * Ac \
+        - kvals["cA3"] * Am - kvals["cA4"] * Am * Pm
+    P_exchange = kvals["cP1"] * Pc - kvals["cP3"] * Pm - kvals["cP4"] * Am * Pm
 
-    plt.figure()
-    ax = plt.subplot()
+    dudt_Am[:] = kvals["Dm"] * diffusion_term(Am, kvals["deltax"]) + A_exchange
+    dudt_Ac[:] = kvals["Dc"] * diffusion_term(Ac, kvals["deltax"]) - A_exchange
+    dudt_Pm[:] = kvals["Dm"] * diffusion_term(Pm, kvals["deltax"]) + P_exchange
+    dudt_Pc[:] = kvals["Dc"] * diffusion_term(Pc, kvals["deltax"]) - P_exchange
 
-    bounds = (np.inf, -np.inf)
+    return ctx.result()
 
-    for i in np.arange(0, len(sol_list)):
-        sol = sol_list[i]
-        kvals_this_sol = kvals_list[i]
 
-        if plot_Am:
-            ax.plot(kvals["X"], sol.y[:kvals["Nx"], -1], label=f"Am_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)))
-            bounds = (np.minimum(np.min(sol.y[:kvals["Nx"], -1]), bounds[0]), np.maximum(np.max(sol.y[:kvals["Nx"], -1]), bounds[1]))
-        if plot_Ac:
-            ax.plot(kvals["X"], sol.y[kvals["Nx"]:2 * kvals["Nx"], -1], label=f"Ac_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)), linestyle="--")
-            bounds = (np.minimum(np.min(sol.y[kvals["Nx"]:2 * kvals["Nx"], -1]), bounds[0]), np.maximum(np.max(sol.y[kvals["Nx"]:2 * kvals["Nx"], -1]), bounds[1]))
-        if plot_Pm:
-            ax.plot(kvals["X"], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1], label=f"Pm_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)))
-            bounds = (np.minimum(np.min(sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1]), bounds[0]), np.maximum(np.max(sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1]), bounds[1]))
-        if plot_Pc:
-            ax.plot(kvals["X"], sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], -1], label=f"Pc_{kvals_this_sol['label']}", color=(0.3 + (i % 3)/4, 0.75 - 0.50*i/len(sol_list),0.5 + 0.50*i/len(sol_list)), linestyle="--")
-            bounds = (np.minimum(np.min(sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], -1]), bounds[0]), np.maximum(np.max(sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], -1]), bounds[1]))
+# derivative of a_func with respect to the length l, as a forward difference in l
+# the step in default_a_func at x = l has no analytic derivative, and when l slides along a grid point
+# the difference has to see that point switching on, as BDF's own finite differences do, or Newton stalls
+def a_func_l_derivative(kvals, a_func, l, h):
+    return (a_func(kvals, l + h, kvals["X"]) - a_func(kvals, l, kvals["X"])) / h
 
-    ax.text(0.1, 1.05, f"t={sol_list[0].t[-1]}", transform=ax.transAxes, ha="center") # timestamp
-    ax.text(1, 1.05, label, transform=ax.transAxes, ha="center") # label
 
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[bounds[0]-0.05, bounds[1]+0.05], xlabel="x", ylabel="A/P")
-    ax.title.set_text("Multiple Sims")
-    ax.legend()
+# analytic jacobian of odefunc as a sparse matrix
+# l couples to every point through a_func (dense column) and m_t (dense row)
+# the X < l mask in m_t is differentiated in l the same way
+def jacobian(t, U, kvals, ctx=None):
+    Nx = kvals["Nx"]
+    Am = U[:Nx]
+    Ac = U[Nx:2 * Nx]
+    Pm = U[2 * Nx:3 * Nx]
+    l = U[-1]
 
-    plt.show(block=False)
+    a_func = ctx.a_func if ctx is not None else vectorise_a_func(kvals["a_func"], kvals)
+    a = np.broadcast_to(a_func(kvals, l, kvals["X"]), (Nx,))
 
-#     ax.plot(kvals["X"], sol.y[:kvals["Nx"], -1], label="Am", color="blue")
-#     ax.plot(kvals["X"], sol.y[kvals["Nx"]:2 * kvals["Nx"], -1], label="Ac", color="blue", linestyle="--")
-#     ax.plot(kvals["X"], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1], label="Pm", color="orange")
-#     ax.plot(kvals["X"], sol.y[3 * kvals["Nx"]:4 * kvals["Nx"], -1], label="Pc", color="orange", linestyle="--")
+    weights = moving_boundary_weights(kvals["X"], l, kvals["deltax"])
+    m_t = np.sum(weights * Am) / kvals["L"]
+    lambda_t = kvals["lambda_0"] - kvals["lambda_1"] * m_t
 
+    # derivatives of the membrane exchange terms
+    dAex_dAm = diag(-kvals["cA3"] - kvals["cA4"] * Pm, Nx)
+    dAex_dAc = diag(kvals["cA1"] + kvals["cA2"] * a, Nx)
+    dAex_dPm = diag(-kvals["cA4"] * Am, Nx)
+    h = np.sqrt(np.finfo(float).eps) * max(1, abs(l))
+    dAex_dl = sparse.csr_matrix((kvals["cA2"] * a_func_l_derivative(kvals, a_func, l, h) * Ac).reshape(-1, 1))
+    dPex_dAm = diag(-kvals["cP4"] * Pm, Nx)
+    dPex_dPm = diag(-kvals["cP3"] - kvals["cP4"] * Am, Nx)
+    dPex_dPc = diag(kvals["cP1"], Nx)
+
+    Lm = kvals["Dm"] * diffusion_matrix(Nx, kvals["deltax"])
+    Lc = kvals["Dc"] * diffusion_matrix(Nx, kvals["deltax"])
+
+    dL_dAm = sparse.csr_matrix(-kvals["epsilon"] * l * kvals["lambda_1"] * weights / (kvals["L"] * lambda_t ** 2))
+    dm_dl = np.sum((moving_boundary_weights(kvals["X"], l + h, kvals["deltax"]) - weights) * Am) / (h * kvals["L"])
+    dlambda_dl = -kvals["lambda_1"] * dm_dl
+    dL_dl = sparse.csr_matrix([[-kvals["epsilon"] * (1 / lambda_t - l * dlambda_dl / lambda_t ** 2)]])
+
+    return sparse.bmat([[Lm + dAex_dAm, dAex_dAc, dAex_dPm, None, dAex_dl],
+                        [-dAex_dAm, Lc - dAex_dAc, -dAex_dPm, None, -dAex_dl],
+                        [dPex_dAm, None, Lm + dPex_dPm, dPex_dPc, None],
+                        [-dPex_dAm, None, -dPex_dPm, Lc - dPex_dPc, None],
+                        [dL_dAm, None, None, None, dL_dl]], format="csc")
+
+
+# pattern of odefunc's jacobian with m_t held fixed, and its column groups
+# a_func(l) gives l a dense column in the A rows, with m_t fixed l's row only depends on l
+@functools.lru_cache
+def jac_sparsity(Nx):
+    species = local_sparsity(Nx, [[1, 1, 1, 0],
+                                  [1, 1, 1, 0],
+                                  [1, 0, 1, 1],
+                                  [1, 0, 1, 1]])
+    l_column = sparse.csr_matrix(np.concatenate((np.ones(2 * Nx), np.zeros(2 * Nx))).reshape(-1, 1))
+    pattern = sparse.bmat([[species, l_column], [None, sparse.csr_matrix([[1.0]])]], format="csc")
+    pattern.eliminate_zeros()
+    return pattern, group_columns(pattern)
+
+
+# finite difference jacobian needing one call per column group plus one for m_t
+# ctx is created if missing so this also works alongside the loop odefunc
+def sparsity_jacobian(t, U, kvals, ctx=None):
+    if ctx is None:
+        ctx = RHSContext(4, kvals["Nx"], n_extra=1)
+        ctx.a_func = vectorise_a_func(kvals["a_func"], kvals)
+    return grouped_jacobian(lambda Y, pools: odefunc_vectorised(t, Y, kvals, ctx, pools),
+                            lambda Y: cytoplasm_pools(Y, kvals), U, *jac_sparsity(kvals["Nx"]))
+
+
+# kvals for a run: the parameters plus the grid, output times and initial condition
+def setup_kvals(args=None):
+    if args is None:
+        args = {}
 
-def plot_failure(U, t, kvals):
-    plt.figure()
-    ax = plt.subplot()
+    params = {**DEFAULT_PARAMETERS, **args}
 
-    ax.plot(kvals["X"], U[:kvals["Nx"]], label="Am", color="blue")
-    ax.plot(kvals["X"], U[kvals["Nx"]:2 * kvals["Nx"]], label="Ac", color="blue", linestyle="--")
-    ax.plot(kvals["X"], U[2 * kvals["Nx"]:3 * kvals["Nx"]], label="Pm", color="orange")
-    ax.plot(kvals["X"], U[3 * kvals["Nx"]:4 * kvals["Nx"]], label="Pc", color="orange", linestyle="--")
+    # calculate other widely used values
+    X = np.linspace(params["x0"], params["xL"], params["Nx"])
+    deltax = np.abs(X[1] - X[0])
 
-    ax.text(0.1, 1.05, f"t={t}", transform=ax.transAxes, ha="center")
+    # key values
+    kvals: dict = {**params, "X": X, "deltax": deltax}
 
-    ax.text(1, 1.05, kvals["label"], transform=ax.transAxes, ha="center")
+    # default time points for solver output
+    kvals["t_eval"] = kvals["t_eval"] if "t_eval" in kvals else np.linspace(kvals["t0"], kvals["tL"], int(kvals["points_per_second"]*np.abs(kvals["tL"]-kvals["t0"])))
 
-    ax.set(xlim=[kvals["x0"], kvals["xL"]], ylim=[np.min(U[:-1])-0.05, np.max(U[:-1])+0.05], xlabel="x", ylabel="A/P")
-    ax.title.set_text("Failure Plot")
-    ax.legend()
+    # default initial condition if none passed
+    kvals["initial_condition"] = kvals["initial_condition"] if "initial_condition" in kvals else np.append(
+        np.ravel([[1, 0, 0, 1] for x_i in np.arange(0, kvals["Nx"])], order='F'), kvals["L"])
 
-    plt.show(block=True)
+    return kvals
 
 
-# variation_sets is a list [([sol,sol,sol], [kvals, kvals, kvals]), ... ]
-# assumes kvals has key_varied property
-def plot_variation_sets(variation_sets, label=DEFAULT_PARAMETERS["label"], x_axis_labels: list[str] | None = None, show_orientation=True, xlim=None):
-    plt.figure()
-    ax = plt.subplot()
+# right hand side and its extra solve_ivp args for rhs_mode "vectorised"
+# batch_shape sizes any output buffer for a stack of states (n, ...), as used by ensemble.py
+def vectorised_rhs(kvals, batch_shape=()):
+    ctx = RHSContext(4, kvals["Nx"], n_extra=1, batch_shape=batch_shape)
+    ctx.a_func = vectorise_a_func(kvals["a_func"], kvals)
+    return odefunc_vectorised, (kvals, ctx)
 
-    # add then remove plot with xticks so that they get ordered correctly in the figure
-    sentinel, = ax.plot(x_axis_labels, [0.5] * len(x_axis_labels))
-    sentinel.remove()
 
-    for i in np.arange(0, len(variation_sets)):
-        variation = variation_sets[i]
-        sol_list = variation[0]
-        kvals_list = variation[1]
+def run_model(args=None):
+    kvals = setup_kvals(args)
 
-        polarity_m_list = []
-        xticks = []
-        if len(variation_sets) > 7:
-            color = (np.minimum(1, 0.3 + (i % 6)/7), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
-        else:
-            color = (np.minimum(1, 0.3 + (i % 3)/4), 0.75 - 0.50*i/len(variation_sets),0.5 + 0.50*i/len(variation_sets))
+    rhs, rhs_args = vectorised_rhs(kvals) if kvals["rhs_mode"] == "vectorised" else (odefunc, (kvals,))
 
-        for j in np.arange(0, len(sol_list)):
-            sol = sol_list[j]
-            kvals = kvals_list[j]
+    jac = {"analytic": jacobian, "sparsity": sparsity_jacobian}.get(kvals["jacobian"])
 
-            if not sol == "FAILURE":
-                polarity_m = polarity_measure(kvals["X"], sol.y[:kvals["Nx"],-1], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1], kvals["Nx"])
-                xtick = x_axis_labels[j] if x_axis_labels is not None else j
-                marker = 'o' if not show_orientation else orientation_marker(polarity_orientation(kvals["X"], sol.y[:kvals["Nx"],-1], sol.y[2 * kvals["Nx"]:3 * kvals["Nx"], -1], kvals["Nx"]))
+    if kvals["mode"] == "steady_state":
+        return steady_state.solve(kvals, rhs, rhs_args, jac, jac or sparsity_jacobian), kvals
 
-                # jitter the near-0 values so they are visible
-                if polarity_m < 0.02:
-                    polarity_m += 0.02 * i / len(variation_sets) - 0.01
+    sol = steady_state.integrate(kvals, rhs, kvals["initial_condition"], method="BDF", args=rhs_args, jac=jac)
 
-                polarity_m_list.append(polarity_m)
-                xticks.append(xtick)
-                ax.scatter(xtick, polarity_m, color=color, marker=marker, s=100)
+    return sol, kvals
 
-        ax.plot(xticks, polarity_m_list, "--", label=kvals_list[1]["key_varied"], color=color)
 
-    ax.legend()
-    ax.set(xlabel="percentage of baseline value", ylabel="polarity", ylim=[-0.1,1.1], xlim=xlim)
-    ax.title.set_text(label)
-    plt.show(block=False)
\ No newline at end of file
+# Plotting functions are in tostevin_plots, imported on first use of one through this module
+# (e.g. tostevin.animate_plot) so that solving doesn't import matplotlib
+def __getattr__(attr):
+    if not attr.startswith("__"):
+        from . import tostevin_plots
+        if hasattr(tostevin_plots, attr):
+            return getattr(tostevin_plots, attr)
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
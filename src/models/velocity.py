@@ -0,0 +1,123 @@
+# Advection velocity v(x, t) on a run's grid, from kvals["v_func"]
+# The models used to call v_func at every point (twice more at the right boundary) on every right hand
+# side call, but the fields used are a fixed spatial profile scaled in time (default_v_func) or zero
+# (the v_func_zero of maintenance runs), so each v_func is classified once per run:
+# - zero: its code is that of v_func_zero, velocity returns None and the models skip advection
+# - separable, only for a v_func marked with v_func.separable = True (as the models' default_v_func are)
+#   or with kvals["v_func_separable"] set, which overrides the mark, as a v_func can factor at the probes
+#   without being separable: its profiles over the grid at PROBE_TIMES times across [t0, tL] are multiples
+#   of one profile g, so v(x, t) = v(x_ref, t) / g(x_ref) * g(x) from one scalar call, checked against a
+#   second point each time
+# - otherwise: evaluated over the grid at once, or point by point if v_func doesn't take arrays
+#   v = velocity(kvals, t)
+import numpy as np
+
+PROBE_TIMES = 32
+SEPARABLE_RTOL = 1e-10
+
+
+def v_func_zero(kvals, x, t):
+    return 0
+
+
+# whether v_func has the same code as v_func_zero, the tasks each define their own
+def is_zero(v_func) -> bool:
+    code, zero_code = getattr(v_func, "__code__", None), v_func_zero.__code__
+    return code is not None and code.co_code == zero_code.co_code and code.co_consts == zero_code.co_consts
+
+
+class VelocityField:
+    def __init__(self, kvals: dict):
+        self.kvals = kvals
+        self.v_func = kvals["v_func"]
+        self.X = kvals["X"]
+        self.zero = is_zero(self.v_func)
+        self.vectorised = True
+        self.profile = None
+        self.last_t, self.last_v = None, None
+
+        if not self.zero:
+            self.vectorised = self.takes_arrays()
+            if kvals.get("v_func_separable", getattr(self.v_func, "separable", False)):
+                self.profile = self.separable_profile()
+
+    def takes_arrays(self) -> bool:
+        try:
+            v = np.asarray(self.v_func(self.kvals, self.X, self.kvals["t0"]), dtype=float)
+        except (TypeError, ValueError):
+            return False
+        return v.ndim == 0 or v.shape == np.shape(self.X)
+
+    def grid_values(self, t):
+        if self.vectorised:
+            return np.broadcast_to(np.asarray(self.v_func(self.kvals, self.X, t), dtype=float), np.shape(self.X))
+        v = np.array([self.v_func(self.kvals, x, t) for x in self.X], dtype=float)
+        v.setflags(write=False)
+        return v
+
+    # (g, i, j) with v(x, t) a multiple of g at every probe, i the reference point and j the check point,
+    # None if the probes aren't multiples of one profile (or are all zero)
+    def separable_profile(self):
+        probes = [self.grid_values(t) for t in np.linspace(self.kvals["t0"], self.kvals["tL"], PROBE_TIMES)]
+        g = np.array(max(probes, key=lambda p: np.max(np.abs(p))))
+        i = int(np.argmax(np.abs(g)))
+        if g[i] == 0:
+            return None
+        for p in probes:
+            if not np.allclose(p, p[i] / g[i] * g, rtol=SEPARABLE_RTOL, atol=SEPARABLE_RTOL * abs(g[i])):
+                return None
+
+        # check at the point where g is closest to half its peak, away from the reference
+        j = int(np.argmin(np.abs(np.abs(g) - abs(g[i]) / 2)))
+        g.setflags(write=False)
+        return g, i, j
+
+    # the last time's v is kept, BDF calls the right hand side and jacobian several times at each time
+    def __call__(self, t):
+        if self.zero:
+            return None
+        if t == self.last_t:
+            return self.last_v
+
+        v = None
+        if self.profile is not None:
+            g, i, j = self.profile
+            scale = float(self.v_func(self.kvals, self.X[i], t)) / g[i]
+            v_j = float(self.v_func(self.kvals, self.X[j], t))
+            if abs(v_j - scale * g[j]) <= SEPARABLE_RTOL * (abs(v_j) + abs(scale * g[i])):
+                v = scale * g
+                v.setflags(write=False)
+            else:
+                # v_func isn't separable after all (e.g. changes outside the probed times), stop assuming it is
+                self.profile = None
+        if v is None:
+            v = self.grid_values(t)
+
+        self.last_t, self.last_v = t, v
+        return v
+
+
+# velocity fields of the runs seen so far, by the kvals dict of the run
+fields_of_kvals_id = {}
+MAX_FIELDS_BY_ID = 64
+
+
+def field_of(kvals: dict) -> VelocityField:
+    field = fields_of_kvals_id.get(id(kvals))
+    if field is None or field.kvals is not kvals or field.v_func is not kvals["v_func"] or field.X is not kvals["X"]:
+        if len(fields_of_kvals_id) >= MAX_FIELDS_BY_ID:
+            fields_of_kvals_id.clear()
+        field = VelocityField(kvals)  # holding kvals keeps its id from being reused
+        fields_of_kvals_id[id(kvals)] = field
+    return field
+
+
+# v_func on the grid at t, None when it is zero everywhere
+# the field is worked out once per kvals (and v_func), the result is read only
+def velocity(kvals: dict, t):
+    return field_of(kvals)(t)
+
+
+# drop the kept v after changing parameters of kvals in place (see continuation), as v_func may read them
+def forget(kvals: dict):
+    field_of(kvals).last_t = None
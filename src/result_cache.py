@@ -0,0 +1,267 @@
+# Per task cache of model results in ./savedata/cache
+# Each task is stored under a digest of everything that decides its result: the model, every
+# parameter after run_model's defaults are filled in (so t_eval, X and the initial condition too),
+# array bytes, and the source code of callable parameters such as v_func
+import copy
+import functools
+import hashlib
+import os
+import time
+from enum import Enum
+import shutil
+import numpy as np
+from .models import MODELS, model_to_module, model_to_string, task_budget
+from . import result_format
+
+SAVEDATA_FOLDER = "./savedata"
+CACHE_FOLDER = "./savedata/cache"
+
+# total bytes the cache may hold, checked after every load_or_run that ran tasks, None for no limit
+MAX_CACHE_BYTES = None
+
+# kvals entries that don't change the result (labels within a sweep, timings, solve limits) so aren't
+# part of the digest and are taken from the current task when a cached result is returned
+BOOKKEEPING_KEYS = ["label", "sort", "task_list_i", "key_varied", "variation_multiplier", "variation_info", "task_key",
+                   "compute_seconds", "warm_start_index", "warm_start_from",
+                   "warm_start_lineage", "pipeline_index", "pipeline_stage"] + task_budget.BUDGET_KEYS
+
+
+def update_digest(h, tag: str, data: bytes):
+    h.update(f"{tag}:{len(data)}:".encode())
+    h.update(data)
+
+
+# functions that couldn't be found when a result was loaded are digested by the source saved with it
+def callable_source(func) -> bytes:
+    return result_format.callable_source(func).encode()
+
+
+def digest_value(h, value):
+    if isinstance(value, functools.partial):
+        update_digest(h, "partial", callable_source(value.func))
+        digest_value(h, list(value.args))
+        digest_value(h, value.keywords)
+    elif callable(value):
+        update_digest(h, "callable", callable_source(value))
+    elif isinstance(value, dict):
+        update_digest(h, "dict", str(len(value)).encode())
+        for key in sorted(value, key=str):
+            update_digest(h, "key", str(key).encode())
+            digest_value(h, value[key])
+    elif isinstance(value, Enum):
+        update_digest(h, "enum", str(value).encode())
+    elif isinstance(value, str):
+        update_digest(h, "str", value.encode())
+    elif value is None or isinstance(value, bool):
+        update_digest(h, "const", repr(value).encode())
+    elif isinstance(value, (int, float, np.number)):
+        update_digest(h, "number", repr(float(value)).encode())  # 1 and 1.0 give the same run
+    else:
+        array = np.asarray(value)
+        if array.dtype.kind in "biuf":
+            array = array.astype(float)
+            update_digest(h, "array", str(array.shape).encode() + array.tobytes())
+        else:
+            update_digest(h, "other", repr(value).encode())
+
+
+# stable hex digest for a (model, args) task
+def task_key(model: MODELS, args: dict) -> str:
+    kvals = model_to_module(model).setup_kvals(copy.deepcopy(args))
+    h = hashlib.sha256()
+    update_digest(h, "model", model_to_string(model).encode())
+    digest_value(h, {key: value for key, value in kvals.items() if key not in BOOKKEEPING_KEYS})
+    return h.hexdigest()
+
+
+# each result is a folder in the format of result_format, meta.json also holds the entry metadata
+# used to list and prune the cache
+def cache_path(key: str) -> str:
+    return os.path.join(CACHE_FOLDER, key)
+
+
+# returns (model, sol, kvals) or None if the task isn't cached
+# sol.t and sol.y are read only memory maps, copy them before changing them in place
+def load_result(key: str, args: dict):
+    try:
+        model, sol, kvals = result_format.load_result(cache_path(key))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Failed loading cached result {key} because: " + str(e))
+        return None
+
+    os.utime(cache_path(key))  # modification time doubles as the last use for eviction
+    kvals = {**kvals, **{k: args[k] for k in BOOKKEEPING_KEYS if k in args}}
+    return model, sol, kvals
+
+
+def save_result(key: str, result: tuple):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    model, sol, kvals = result
+
+    entry = {"model": model_to_string(model), "Nx": kvals.get("Nx"), "tL": kvals.get("tL"),
+             "created": time.time(), "compute_seconds": kvals.get("compute_seconds")}
+    result_format.save_result(cache_path(key), sol, kvals, model, {"entry": result_format.encode_value(entry)})
+
+
+# Output of form [(model, sol, kvals),...] in the same order as tasks
+# only tasks without a cached result are passed to run_tasks, failures aren't cached so they are retried
+def load_or_run(name: str, tasks: list[tuple], run_tasks, force_run=False) -> list[tuple]:
+    keys = [task_key(model, args) for model, args in tasks]
+    results = [None if force_run else load_result(key, args) for key, (model, args) in zip(keys, tasks)]
+
+    missing = [i for i in range(len(tasks)) if results[i] is None]
+    print(f"Loaded {len(tasks) - len(missing)}/{len(tasks)} results of {name} from the cache")
+
+    # identical tasks in the list are only run once
+    indices_of_key = {}
+    for i in missing:
+        indices_of_key.setdefault(keys[i], []).append(i)
+
+    if len(indices_of_key) > 0:
+        # the key travels with the task so results, which come back in any order, can be matched up
+        to_run = [(tasks[indices[0]][0], {**tasks[indices[0]][1], "task_key": key}) for key, indices in indices_of_key.items()]
+
+        for res in run_tasks(to_run):
+            model, sol, kvals = res
+            if not sol == "FAILURE":
+                save_result(kvals["task_key"], res)
+            for i in indices_of_key[kvals["task_key"]]:
+                results[i] = (model, sol, {**kvals, **{k: tasks[i][1][k] for k in BOOKKEEPING_KEYS if k in tasks[i][1]}})
+
+        if MAX_CACHE_BYTES is not None:
+            prune(MAX_CACHE_BYTES, keep=set(keys))
+
+    return results
+
+
+# Cache inspection and eviction, see src/tasks/manage_savedata.py for the command line
+
+# [{"key", "bytes", "last_used", metadata...},...] for every result in the cache
+# entries saved without metadata only have their size and last use
+def cache_entries() -> list[dict]:
+    if not os.path.isdir(CACHE_FOLDER):
+        return []
+
+    entries = []
+    for key in sorted(os.listdir(CACHE_FOLDER)):
+        if key.endswith(".tmp"):
+            continue
+        entry = {"model": None, "Nx": None, "tL": None, "created": None, "compute_seconds": None}
+        try:
+            entry.update(result_format.decode_value(result_format.load_meta(cache_path(key))["entry"]))
+        except (OSError, ValueError, KeyError):
+            pass
+        last_used = os.path.getmtime(cache_path(key))
+        entry.update({"key": key, "bytes": result_format.folder_bytes(cache_path(key)), "last_used": last_used,
+                      "created": entry["created"] or last_used})
+        entries.append(entry)
+    return entries
+
+
+# files in ./savedata outside the cache (save_runs output, goehring references, ...)
+# these are reported but never evicted, they aren't rebuilt by load_or_run
+def other_savedata_files() -> list[tuple]:
+    files = []
+    for root, dirs, filenames in os.walk(SAVEDATA_FOLDER):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != os.path.abspath(CACHE_FOLDER)]
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            files.append((path, os.path.getsize(path), os.path.getmtime(path)))
+    return files
+
+
+# entries in the order they should be evicted
+# an entry is worth its compute time, discounted by how long ago it was last used, so cheap
+# results go first and an expensive one has to sit unused for much longer before it goes
+# entries with unknown compute time are evicted least recently used first, before any timed entry
+def eviction_order(entries: list[dict], now=None) -> list[dict]:
+    now = time.time() if now is None else now
+
+    def value(entry):
+        age = max(now - entry["last_used"], 1.0)
+        return (entry["compute_seconds"] or 0) / age, entry["last_used"]
+
+    return sorted(entries, key=value)
+
+
+def remove_entry(key: str):
+    shutil.rmtree(cache_path(key), ignore_errors=True)
+
+
+# evict entries until the cache holds at most max_bytes, keys in keep are never evicted
+# also clears temporary files left behind by interrupted saves
+# returns the evicted entries
+def prune(max_bytes: int, keep=(), dry_run=False) -> list[dict]:
+    if os.path.isdir(CACHE_FOLDER):
+        for filename in os.listdir(CACHE_FOLDER):
+            path = os.path.join(CACHE_FOLDER, filename)
+            if filename.endswith(".tmp") and time.time() - os.path.getmtime(path) > 3600 and not dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+
+    entries = cache_entries()
+    total = sum(entry["bytes"] for entry in entries)
+
+    evicted = []
+    for entry in eviction_order(entries):
+        if total <= max_bytes:
+            break
+        if entry["key"] in keep:
+            continue
+        if not dry_run:
+            remove_entry(entry["key"])
+        total -= entry["bytes"]
+        evicted.append(entry)
+
+    if len(evicted) > 0:
+        print(f"{'Would evict' if dry_run else 'Evicted'} {len(evicted)} cached results, cache is now {total} bytes")
+    return evicted
+
+
+# functions in value that couldn't be found on loading and were saved without their source
+def unresolvable_callables(value) -> list[str]:
+    if isinstance(value, result_format.MissingCallable):
+        return [value.name] if value.source is None else []
+    if isinstance(value, functools.partial):
+        return unresolvable_callables(value.func) + unresolvable_callables([value.args, value.keywords])
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return [name for item in value for name in unresolvable_callables(item)]
+    return []
+
+
+# ([(key, problem),...], [(key, reason),...])
+# problems are entries that can't be loaded, don't match their metadata, or whose key no longer matches
+# their parameters (e.g. the source of a v_func changed), and are removed with delete
+# unverifiable entries have functions that can't be found and were saved without their source (before
+# it was stored), so their key can't be checked, they are reported but never removed
+def verify(delete=False) -> tuple[list, list]:
+    problems, unverifiable = [], []
+    for entry in cache_entries():
+        key = entry["key"]
+        try:
+            model, sol, kvals = result_format.load_result(cache_path(key))
+        except Exception as e:
+            problems.append((key, f"unreadable: {e}"))
+            continue
+
+        missing = unresolvable_callables(kvals)
+        if entry["model"] is not None and entry["model"] != model_to_string(model):
+            problems.append((key, f"metadata says {entry['model']} but result is {model_to_string(model)}"))
+        elif np.shape(sol.y)[-1] != len(sol.t):
+            problems.append((key, f"y has {np.shape(sol.y)[-1]} time points but t has {len(sol.t)}"))
+        elif len(missing) > 0:
+            unverifiable.append((key, f"unverifiable, {', '.join(missing)} can't be found and has no saved source"))
+        else:
+            try:
+                if task_key(model, kvals) != key:
+                    problems.append((key, "stale, parameters or function source no longer give this key"))
+            except Exception as e:
+                problems.append((key, f"parameters can't be resolved: {e}"))
+
+    if delete:
+        for key, _ in problems:
+            remove_entry(key)
+    return problems, unverifiable
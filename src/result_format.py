@@ -0,0 +1,161 @@
+# On disk format for model results without pickle
+# Each result is a folder holding t.npy and y.npy, which are opened memory mapped so only the
+# parts that are read (e.g. the final time step) are paid for, and meta.json with the model,
+# the rest of the OdeResult and the kvals
+# Callables in kvals are stored by name and looked up again on loading, so loading doesn't
+# need stand-ins for functions that only existed in the script that ran the task
+# Their source is stored alongside, so a result whose function can't be found again (e.g. a v_func
+# defined in a task run as __main__) can still be checked against its cache key
+import enum
+import functools
+import importlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import numpy as np
+from scipy.optimize import OptimizeResult  # solve_ivp's OdeResult adds nothing to OptimizeResult
+from .models import MODELS, model_to_string
+
+MODEL_FROM_STRING = {model_to_string(model): model for model in MODELS}
+
+# OdeResult fields other than t and y, sol (dense output) isn't stored
+SOL_FIELDS = ["t_events", "y_events", "nfev", "njev", "nlu", "status", "message", "success"]
+
+
+# stands in for a function that couldn't be found on loading, e.g. one defined in another script
+# source is the function's source as it was saved, None for results saved before it was stored
+class MissingCallable:
+    def __init__(self, name, source=None):
+        self.name = name
+        self.source = source
+
+    def __call__(self, *args, **kwargs):
+        raise RuntimeError(f"function {self.name} from savedata could not be found")
+
+    def __repr__(self):
+        return f"MissingCallable({self.name})"
+
+
+def callable_name(func) -> str:
+    return f"{func.__module__}:{func.__qualname__}"
+
+
+# what identifies a function's behaviour, its source code or its name if the source isn't available
+def callable_source(func) -> str:
+    if isinstance(func, MissingCallable):
+        return func.source if func.source is not None else func.name.replace(":", ".")
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+
+
+# source is what was saved with the name, if given
+# a name in __main__ only refers to the same function if the script loading it is the one that saved it,
+# so one whose source doesn't match is taken as missing
+def find_callable(name: str, source=None):
+    module_name, qualname = name.split(":")
+    try:
+        value = sys.modules.get(module_name) or importlib.import_module(module_name)
+        for part in qualname.split("."):
+            value = getattr(value, part)
+    except (ImportError, AttributeError):
+        return MissingCallable(name, source)
+    if module_name == "__main__" and source is not None and callable_source(value) != source:
+        return MissingCallable(name, source)
+    return value
+
+
+# json compatible version of a kvals value, arrays are kept inline as they're small next to y
+def encode_value(value):
+    if isinstance(value, MODELS):
+        return {"model": model_to_string(value)}
+    if isinstance(value, enum.Enum):
+        return {"enum": callable_name(type(value)), "name": value.name}
+    if isinstance(value, functools.partial):
+        return {"partial": encode_value(value.func), "args": encode_value(list(value.args)),
+                "keywords": encode_value(value.keywords)}
+    if isinstance(value, MissingCallable):
+        return {"callable": value.name, "source": value.source}
+    if callable(value) and hasattr(value, "__qualname__"):
+        return {"callable": callable_name(value), "source": callable_source(value)}
+    if isinstance(value, dict):
+        return {"dict": {str(key): encode_value(item) for key, item in value.items()}}
+    if isinstance(value, tuple):
+        return {"tuple": [encode_value(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return {"array": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return {"repr": repr(value)}
+
+
+def decode_value(value):
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "model" in value:
+        return MODEL_FROM_STRING[value["model"]]
+    if "enum" in value:
+        return getattr(find_callable(value["enum"]), value["name"])
+    if "partial" in value:
+        return functools.partial(decode_value(value["partial"]), *decode_value(value["args"]),
+                                 **decode_value(value["keywords"]))
+    if "callable" in value:
+        return find_callable(value["callable"], value.get("source"))
+    if "dict" in value:
+        return {key: decode_value(item) for key, item in value["dict"].items()}
+    if "tuple" in value:
+        return tuple(decode_value(item) for item in value["tuple"])
+    if "array" in value:
+        return np.array(value["array"], dtype=np.dtype(value["dtype"]))
+    return value["repr"]
+
+
+# write sol and kvals to folder, replacing whatever was there
+# written to a temporary folder first so a half written result is never picked up
+def save_result(folder: str, sol, kvals: dict, model: MODELS = None, extra: dict = None):
+    temp_folder = folder.rstrip("/") + f".{os.getpid()}.tmp"
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    os.makedirs(temp_folder)
+
+    np.save(os.path.join(temp_folder, "t.npy"), np.asarray(sol.t))
+    np.save(os.path.join(temp_folder, "y.npy"), np.asarray(sol.y))
+    meta = {"model": None if model is None else model_to_string(model),
+            "sol": {field: encode_value(sol.get(field)) for field in SOL_FIELDS},
+            "kvals": encode_value(kvals),
+            **(extra or {})}
+    with open(os.path.join(temp_folder, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temp_folder, folder)
+
+
+def load_meta(folder: str) -> dict:
+    with open(os.path.join(folder, "meta.json")) as f:
+        return json.load(f)
+
+
+# returns (model, sol, kvals), model is None if it wasn't saved
+# t and y are read only memory maps unless mmap_mode is None, so changing sol.y in place raises
+# ValueError, copy it first (np.array(sol.y)) or load with mmap_mode=None
+def load_result(folder: str, mmap_mode="r"):
+    meta = load_meta(folder)
+    sol = OptimizeResult(t=np.load(os.path.join(folder, "t.npy"), mmap_mode=mmap_mode),
+                         y=np.load(os.path.join(folder, "y.npy"), mmap_mode=mmap_mode),
+                         sol=None,
+                         **{field: decode_value(value) for field, value in meta["sol"].items()})
+    model = None if meta["model"] is None else MODEL_FROM_STRING[meta["model"]]
+    return model, sol, decode_value(meta["kvals"])
+
+
+def folder_bytes(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder, filename)) for filename in os.listdir(folder))
@@ -0,0 +1,88 @@
+# Gaussian process surrogate for expensive scores, and picking the next points to evaluate from it
+# Points are coordinates in the unit cube [0, 1]^d, scores are minimised
+#   gp = GaussianProcess().fit(X, y)
+#   batch = propose_batch(gp, 8, rng)
+import numpy as np
+from scipy import linalg
+from scipy.special import ndtr
+
+# length scales (in unit cube coordinates) and relative noise levels tried when fitting
+LENGTH_SCALES = [0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 1.5]
+NOISE_LEVELS = [1e-6, 1e-3, 1e-2, 1e-1]
+
+
+# isotropic squared exponential kernel between the rows of A and B
+def rbf_kernel(A, B, length_scale):
+    distances = np.sum(A ** 2, axis=1)[:, None] + np.sum(B ** 2, axis=1)[None, :] - 2 * A @ B.T
+    return np.exp(-0.5 * np.maximum(distances, 0) / length_scale ** 2)
+
+
+# scores are standardised before fitting, the length scale and noise are chosen by marginal likelihood
+class GaussianProcess:
+    def fit(self, X, y, length_scale=None, noise=None):
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = np.mean(y)
+        self.y_std = np.std(y) if np.std(y) > 0 else 1.0
+        self.y = (y - self.y_mean) / self.y_std
+
+        if length_scale is None or noise is None:
+            length_scale, noise = max(((l, n) for l in LENGTH_SCALES for n in NOISE_LEVELS),
+                                      key=lambda ln: self.log_marginal_likelihood(*ln))
+        self.length_scale, self.noise = length_scale, noise
+
+        K = rbf_kernel(self.X, self.X, length_scale) + noise * np.eye(len(self.X))
+        self.cholesky = linalg.cho_factor(K, lower=True)
+        self.alpha = linalg.cho_solve(self.cholesky, self.y)
+        return self
+
+    def log_marginal_likelihood(self, length_scale, noise):
+        K = rbf_kernel(self.X, self.X, length_scale) + noise * np.eye(len(self.X))
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = linalg.cho_solve((L, True), self.y)
+        return -0.5 * self.y @ alpha - np.sum(np.log(np.diag(L)))
+
+    # mean and standard deviation of the score at the rows of X
+    def predict(self, X):
+        K_s = rbf_kernel(np.asarray(X, dtype=float), self.X, self.length_scale)
+        mean = K_s @ self.alpha
+        v = linalg.cho_solve(self.cholesky, K_s.T)
+        variance = np.maximum(1 - np.sum(K_s * v.T, axis=1), 1e-12)
+        return self.y_mean + self.y_std * mean, self.y_std * np.sqrt(variance)
+
+
+# expected amount by which a point improves on (goes below) best
+# the normal cdf is scipy.special.ndtr and the pdf is written out, as importing scipy.stats for them costs
+# about half a second per process
+def expected_improvement(mean, std, best):
+    z = (best - mean) / std
+    return (best - mean) * ndtr(z) + std * np.exp(-z ** 2 / 2) / np.sqrt(2 * np.pi)
+
+
+# n points to evaluate next, chosen by expected improvement from random candidates spread over the cube
+# and around the best points so far
+# after each pick the gp is refitted as if the point had scored its predicted mean, so the rest of the
+# batch spreads out rather than piling onto the same spot
+def propose_batch(gp: GaussianProcess, n: int, rng: np.random.Generator, candidates=4096, local_scale=0.05):
+    X, y = gp.X.copy(), gp.y_mean + gp.y_std * gp.y
+    d = X.shape[1]
+
+    best_points = X[np.argsort(y)[:min(5, len(y))]]
+    local = best_points[rng.integers(len(best_points), size=candidates // 2)] \
+        + local_scale * rng.standard_normal((candidates // 2, d))
+    pool = np.clip(np.concatenate([rng.random((candidates - candidates // 2, d)), local]), 0, 1)
+
+    believer = GaussianProcess().fit(X, y, gp.length_scale, gp.noise)
+    batch = []
+    for _ in range(n):
+        mean, std = believer.predict(pool)
+        i = int(np.argmax(expected_improvement(mean, std, np.min(y))))
+        batch.append(pool[i])
+        X, y = np.vstack([X, pool[i]]), np.append(y, mean[i])
+        pool = np.delete(pool, i, axis=0)
+        believer = GaussianProcess().fit(X, y, gp.length_scale, gp.noise)
+
+    return np.array(batch)
@@ -0,0 +1,81 @@
+# Expected run time of tasks from the times of previous runs, so TaskPool can start the longest
+# tasks first and the end of a sweep isn't one worker finishing a long task while the rest wait
+# past runs are kept in ./savedata/task_timings.json as {model: [[Nx, tL, seconds],...]}
+import json
+import os
+import numpy as np
+from .models import MODELS, model_to_module, model_to_string
+
+HISTORY_FILE = "./savedata/task_timings.json"
+
+# runs kept per model, the oldest are dropped first
+HISTORY_LENGTH = 2000
+
+# seconds per unit of Nx*tL for models with no history yet, rough values from default parameters
+DEFAULT_RATES = {MODELS.GOEHRING: 3.5e-6, MODELS.PAR3ADD: 6.5e-6, MODELS.CRUMBS: 4e-6, MODELS.TOSTEVIN: 1e-5}
+
+
+def load_history() -> dict:
+    try:
+        with open(HISTORY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# results of the form [(model, sol, kvals),...], failures and results without a time are skipped
+def record(results: list[tuple]):
+    new_runs = {}
+    for model, sol, kvals in results:
+        if isinstance(sol, str) or "compute_seconds" not in kvals:
+            continue
+        new_runs.setdefault(model_to_string(model), []).append(
+            [int(kvals["Nx"]), float(kvals["tL"]), float(kvals["compute_seconds"])])
+
+    if len(new_runs) == 0:
+        return
+
+    # other processes may be recording too, so merge with the file as it is now
+    history = load_history()
+    for name, runs in new_runs.items():
+        history[name] = (history.get(name, []) + runs)[-HISTORY_LENGTH:]
+
+    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+    temp_file = HISTORY_FILE + f".{os.getpid()}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump(history, f)
+    os.replace(temp_file, HISTORY_FILE)
+
+
+# expected seconds for a task, args can also be a list of args for an ensemble
+# scales the median time per Nx*tL of past runs of the model, using runs at the same Nx when there are any
+# as the cost per grid point changes with Nx (stiffness grows with the number of points)
+def estimate_seconds(model: MODELS, args, history: dict) -> float:
+    if isinstance(args, list):
+        return sum(estimate_seconds(model, member_args, history) for member_args in args)
+
+    # only Nx and tL are needed, not the grid, initial condition etc. that setup_kvals would build
+    params = {**model_to_module(model).DEFAULT_PARAMETERS, **args}
+    Nx, tL = params["Nx"], params["tL"]
+
+    runs = np.array(history.get(model_to_string(model), []), dtype=float).reshape(-1, 3)
+    same_Nx = runs[runs[:, 0] == Nx]
+    if len(same_Nx) > 0:
+        runs = same_Nx
+    if len(runs) == 0:
+        return DEFAULT_RATES.get(model, 1e-5) * Nx * tL
+
+    return float(np.median(runs[:, 2] / (runs[:, 0] * np.maximum(runs[:, 1], 1e-9)))) * Nx * tL
+
+
+# expected seconds for each task of task_list
+def estimate_costs(task_list: list[tuple], history=None) -> list[float]:
+    history = load_history() if history is None else history
+
+    costs = []
+    for model, args in task_list:
+        try:
+            costs.append(estimate_seconds(model, args, history))
+        except Exception:
+            costs.append(0.0)  # the worker will report the problem, no need to schedule it early
+    return costs
@@ -0,0 +1,82 @@
+# Inspect and trim the result cache in ./savedata/cache
+# python -m src.tasks.manage_savedata list
+# python -m src.tasks.manage_savedata prune --max-size 20G [--dry-run]
+# python -m src.tasks.manage_savedata verify [--delete]
+import argparse
+import time
+from src import result_cache
+
+SIZE_UNITS = {"": 1, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().removesuffix("B")
+    unit = text[-1] if text[-1] in SIZE_UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+
+
+def format_size(n_bytes) -> str:
+    for unit in ["", "K", "M", "G"]:
+        if abs(n_bytes) < 1000:
+            return f"{n_bytes:.0f}{unit}B" if unit == "" else f"{n_bytes:.1f}{unit}B"
+        n_bytes /= 1000
+    return f"{n_bytes:.1f}TB"
+
+
+def format_value(value, fmt="") -> str:
+    return "-" if value is None else format(value, fmt)
+
+
+def list_cache():
+    entries = result_cache.cache_entries()
+    print(f"{'key':<14}{'model':<14}{'Nx':>6}{'tL':>9}{'compute s':>11}{'size':>10}  {'created':<17}{'last used':<17}")
+    for entry in sorted(entries, key=lambda e: e["last_used"], reverse=True):
+        print(f"{entry['key'][:12]:<14}{format_value(entry['model']):<14}{format_value(entry['Nx']):>6}"
+              f"{format_value(entry['tL'], 'g'):>9}{format_value(entry['compute_seconds'], '.1f'):>11}"
+              f"{format_size(entry['bytes']):>10}  "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created'])):<17}"
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used'])):<17}")
+
+    cache_bytes = sum(entry["bytes"] for entry in entries)
+    compute = sum(entry["compute_seconds"] or 0 for entry in entries)
+    print(f"{len(entries)} cached results, {format_size(cache_bytes)}, {compute:.0f} s of compute")
+
+    others = result_cache.other_savedata_files()
+    if len(others) > 0:
+        print(f"{len(others)} other files in {result_cache.SAVEDATA_FOLDER} (not managed), "
+              f"{format_size(sum(size for _, size, _ in others))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and trim the result cache in " + result_cache.CACHE_FOLDER)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list cached results, most recently used first")
+
+    prune_parser = commands.add_parser("prune", help="evict cheap and long unused results until under a size")
+    prune_parser.add_argument("--max-size", required=True, type=parse_size, help="e.g. 500M or 20G")
+    prune_parser.add_argument("--dry-run", action="store_true", help="only report what would be evicted")
+
+    verify_parser = commands.add_parser("verify", help="check every cached result loads and matches its key")
+    verify_parser.add_argument("--delete", action="store_true", help="remove results that fail")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "list":
+            list_cache()
+        case "prune":
+            evicted = result_cache.prune(args.max_size, dry_run=args.dry_run)
+            for entry in evicted:
+                print(f"{entry['key'][:12]}  {format_value(entry['model'])}  "
+                      f"{format_value(entry['compute_seconds'], '.1f')} s  {format_size(entry['bytes'])}")
+        case "verify":
+            problems, unverifiable = result_cache.verify(delete=args.delete)
+            for key, problem in problems + unverifiable:
+                print(f"{key[:12]}  {problem}")
+            print(f"{len(problems)} problems found" + (", removed" if args.delete and len(problems) > 0 else "")
+                  + (f", {len(unverifiable)} results couldn't be checked and were kept" if len(unverifiable) > 0 else ""))
+
+
+if __name__ == '__main__':
+    main()
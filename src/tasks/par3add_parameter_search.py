@@ -9,8 +9,6 @@ import time
 import numpy as np
 from numpy import linalg
 from ..models import MODELS, model_to_module
-import matplotlib
-from matplotlib import pyplot as plt
 from src import model_task_handler
 
 
@@ -73,9 +71,21 @@ NX = 100  # spatial discretisation
 TL_HOM = 3000  # end time to get homogeneous steadys-state
 TL_EST = 9000  # end time for establishment
 
+# start each homogeneous run from the final state of its nearest finished neighbour in the variation grid
+# instead of INIT_COND_HOM (see model_task_handler.run_tasks_warm_start)
+WARM_START = False
+
 # initial condition for par3add to get a-dominant homogeneous steady-state
 INIT_COND_HOM = [1]*NX + [1]*(2*NX) + [0]*NX
 
+# candidates are first screened by a direct steady-state solve on a coarse grid, and only those whose
+# homogeneous state is within SCREEN_HSIM_CUTOFF of goehring get the full homogeneous run, then only those
+# within HSIM_CUTOFF get the polarisation run (see model_task_handler.run_pipeline)
+# the screen's cutoff is looser as the coarse solve only approximates the full run
+SCREEN_NX = 20
+SCREEN_HSIM_CUTOFF = 10
+HSIM_CUTOFF = 5
+
 LABEL_P_HOM = "par3add_hom_run"
 LABEL_P_POL = "par3add_pol_run"
 
@@ -122,6 +132,7 @@ def main():
         if best_point is None:
             break
 
+    from matplotlib import pyplot as plt
     plt.show()
 
 
@@ -148,45 +159,30 @@ def do_variations(params_par3add, goehring_results: tuple[list], variation_pairs
             for variation2 in variation_multipliers:
                 param_pairs.append((variation1*varied_params[p1], variation2*varied_params[p2]))
 
-        # generate tasks
-        tasks_hom = []
-
-        for ppair in param_pairs:
-            task = (MODELS.PAR3ADD, {**params_par3add, p1: ppair[0], p2: ppair[1],
-                                     "Nx": NX, "tL": TL_HOM, "initial_condition": INIT_COND_HOM,
-                                     "label": f"{LABEL_P_HOM}_{p1}_{ppair[0]:.4f}_{p2}_{ppair[1]:.4f}",
-                                     "v_func": v_func_zero,
-                                     "variation_info": {p1: ppair[0], p2: ppair[1]}
-                                     })
-            tasks_hom.append(task)
+        candidates = [{p1: ppair[0], p2: ppair[1]} for ppair in param_pairs]
 
         # load or run to get results
-        res_hom_all = load_or_run(f"{LABEL_P_HOM}_{p1}_{p2}", tasks_hom)
-
-        # generate polarisation tasks
-        tasks_pol = []
-
-        for res in res_hom_all:
-            if res[1] != "FAILURE":
-                varied_params_value = res[2]["variation_info"]
-                init_cond_pol = res[1].y[:, -1]
-
-                # takes long time, so skipping stuff that's way off
-                hsim = calculate_similarity_gp(goehring_results[0], init_cond_pol)
-                if hsim > 5:
-                    continue
-
-                task = (MODELS.PAR3ADD, {**params_par3add, **varied_params_value,
-                                         "variation_info": varied_params_value,
-                                         "Nx": NX, "tL": TL_EST, "initial_condition": init_cond_pol,
-                                         "label": f"{LABEL_P_POL}_{p1}_{varied_params_value[p1]:.4f}_{p2}_{varied_params_value[p2]:.4f}",
-                                         })
-                tasks_pol.append(task)
-            else:
-                print("failure detected")
-
-        # load or run to get results
-        res_pol_all = load_or_run(f"{LABEL_P_POL}_{p1}_{p2}", tasks_pol)
+        if WARM_START:
+            tasks_hom = [hom_task(params_par3add, varied_params_value) for varied_params_value in candidates]
+            multiplier_pairs = [(v1, v2) for v1 in variation_multipliers for v2 in variation_multipliers]
+            res_hom_all = model_task_handler.run_tasks_warm_start(
+                tasks_hom, model_task_handler.nearest_parents(multiplier_pairs, (1, 1)),
+                lambda wave: load_or_run(f"{LABEL_P_HOM}_{p1}_{p2}", wave))
+
+            tasks_pol = []
+            for res in res_hom_all:
+                if res[1] != "FAILURE":
+                    # takes long time, so skipping stuff that's way off
+                    if calculate_similarity_gp(goehring_results[0], res[1].y[:, -1]) > HSIM_CUTOFF:
+                        continue
+                    tasks_pol.append(pol_task(params_par3add, res))
+                else:
+                    print("failure detected")
+
+            res_pol_all = load_or_run(f"{LABEL_P_POL}_{p1}_{p2}", tasks_pol)
+        else:
+            res_hom_all, res_pol_all = screened_runs(f"{LABEL_P_HOM}_{p1}_{p2}", params_par3add, candidates,
+                                                     goehring_results)
 
         # compare with goehring
         comparisons = goehring_comparer(goehring_results, res_hom_all, res_pol_all)
@@ -195,8 +191,9 @@ def do_variations(params_par3add, goehring_results: tuple[list], variation_pairs
             if best_point is None or best_point[1] > c[2]:  # found lower polarised difference
                 best_point = (c[0], c[2])
 
-        # plot
+        # plot, matplotlib is only imported here so the search's worker processes don't load it
         if not NO_PLOT:
+            from matplotlib import pyplot as plt
             print("\n".join([f"{c}" for c in comparisons]))
 
             # plot for homogeneous comparison
@@ -228,7 +225,73 @@ def do_variations(params_par3add, goehring_results: tuple[list], variation_pairs
     return best_point
 
 
+def hom_task(params_par3add, varied_params_value: dict) -> tuple:
+    return (MODELS.PAR3ADD, {**params_par3add, **varied_params_value,
+                             "Nx": NX, "tL": TL_HOM, "initial_condition": INIT_COND_HOM,
+                             "label": f"{LABEL_P_HOM}_{variation_label(varied_params_value)}",
+                             "v_func": v_func_zero,
+                             "variation_info": varied_params_value
+                             })
+
+
+def pol_task(params_par3add, res_hom: tuple) -> tuple:
+    varied_params_value = res_hom[2]["variation_info"]
+    return (MODELS.PAR3ADD, {**params_par3add, **varied_params_value,
+                             "variation_info": varied_params_value,
+                             "Nx": NX, "tL": TL_EST, "initial_condition": res_hom[1].y[:, -1],
+                             "label": f"{LABEL_P_POL}_{variation_label(varied_params_value)}",
+                             })
+
+
+def variation_label(varied_params_value: dict) -> str:
+    return "_".join(f"{p}_{v:.4f}" for p, v in varied_params_value.items())
+
+
+# screen, homogeneous and polarisation runs of each candidate as a pipeline, returns (res_hom_all, res_pol_all)
+# of the candidates that got that far
+def screened_runs(name: str, params_par3add, candidates: list[dict], goehring_results: tuple[list]) -> tuple:
+    def screen(varied_params_value, results):
+        return (MODELS.PAR3ADD, {**params_par3add, **varied_params_value,
+                                 "Nx": SCREEN_NX, "tL": TL_HOM, "mode": "steady_state",
+                                 "initial_condition": [1]*SCREEN_NX + [1]*(2*SCREEN_NX) + [0]*SCREEN_NX,
+                                 "label": f"{LABEL_P_HOM}_screen_{variation_label(varied_params_value)}",
+                                 "v_func": v_func_zero,
+                                 "variation_info": varied_params_value
+                                 })
+
+    # a failed screen isn't taken as a rejection, the full run decides
+    def hom(varied_params_value, results):
+        res_screen = results[-1]
+        if res_screen[1] != "FAILURE":
+            state = resample_state(res_screen[1].y[:, -1], 4, NX)
+            if calculate_similarity_gp(goehring_results[0], state) > SCREEN_HSIM_CUTOFF:
+                return None
+        return hom_task(params_par3add, varied_params_value)
+
+    # takes long time, so skipping stuff that's way off
+    def pol(varied_params_value, results):
+        res_hom = results[-1]
+        if res_hom[1] == "FAILURE":
+            print("failure detected")
+            return None
+        if calculate_similarity_gp(goehring_results[0], res_hom[1].y[:, -1]) > HSIM_CUTOFF:
+            return None
+        return pol_task(params_par3add, res_hom)
+
+    outputs = model_task_handler.run_pipeline(name, candidates, [screen, hom, pol])
+    return [output[1] for output in outputs if len(output) > 1], [output[2] for output in outputs if len(output) > 2]
+
+
+# state of n_species blocks interpolated onto a grid of Nx points
+def resample_state(U, n_species: int, Nx: int) -> np.ndarray:
+    blocks = np.asarray(U).reshape(n_species, -1)
+    x_from = np.linspace(0, 1, blocks.shape[1])
+    return np.concatenate([np.interp(np.linspace(0, 1, Nx), x_from, block) for block in blocks])
+
+
 def plot_gcomparisons(p1, p2, comparisons: list[tuple[dict, float]], baseline_point):
+    import matplotlib
+    from matplotlib import pyplot as plt
     plt.figure()
 
     max_val = np.max([[v[1]] for v in comparisons])
@@ -275,23 +338,18 @@ def goehring_comparer(goehring_results: tuple[list], res_hom_all: list[tuple],
             # calculate goehring simularity (polarised)
             goehring_sim_pol = calculate_similarity_gp(goehring_results[1], res[1].y[:, -1])
 
-            # calculate goehring simularity during establishment
-            full_g_res_multi = [
-                                (get_goehring_res(pol_time_divider=10)[1], 10),
-                                (get_goehring_res(pol_time_divider=5)[1], 5),
-                                (get_goehring_res(pol_time_divider=4)[1], 4),
-                                (get_goehring_res(pol_time_divider=3)[1], 3),
-                                (get_goehring_res(pol_time_divider=2)[1], 2),
-                                (get_goehring_res(pol_time_divider=1.5)[1], 1.5),
-                                ]
+            # calculate goehring simularity during establishment, at the same times as the snapshots of res
+            pol_time_dividers = [10, 5, 4, 3, 2, 1.5]
 
             goehring_sim_partway_all = []
 
-            for full_g_res_tuple in full_g_res_multi:
-                goehring_sim_partway = calculate_similarity_gp(full_g_res_tuple[0], res[1].y[:, int(res[1].y.shape[1]//full_g_res_tuple[1])])
+            for pol_time_divider in pol_time_dividers:
+                i_partway = int(res[1].y.shape[1]//pol_time_divider)
+                goehring_partway = get_goehring_polarised(res[1].t[i_partway] / TL_EST)
+                goehring_sim_partway = calculate_similarity_gp(goehring_partway, res[1].y[:, i_partway])
                 goehring_sim_partway_all.append(goehring_sim_partway)
 
-            goehring_sim_partway = sum(goehring_sim_partway_all)//len(full_g_res_multi)
+            goehring_sim_partway = sum(goehring_sim_partway_all)//len(pol_time_dividers)
 
             if goehring_sim_hom is not None:
                 out_list.append((varied_param_values, goehring_sim_hom, goehring_sim_pol+goehring_sim_partway/2))
@@ -306,66 +364,51 @@ def calculate_similarity_gp(goehring_res: list, par3add_res: list):
                               np.concatenate((par3add_res[NX:2*NX] + par3add_res[2*NX:3*NX], par3add_res[3*NX:])))
 
 
-def get_goehring_res(pol_time_divider: int = 1) -> tuple[list]:
-    try:
-        loaded = np.load("./savedata/goehring_for_par3add_2_sensitivity200225.npy", allow_pickle=True)
-        print("Loaded goehring results")
-        return loaded
-    except Exception as e:
-        print("Failed to load goehring: " + str(e))
-        res_h = get_goehring_homo_ic()
-        res_p = get_goehring_polarised(res_h, pol_time_divider)
-        np.save("./savedata/goehring_for_par3add_2_sensitivity200225.npy", (res_h, res_p), allow_pickle=True)
-        return (res_h, res_p)
-
-
-def get_goehring_homo_ic():
-    task = (MODELS.GOEHRING, {**params_goehring, "tL": TL_HOM,
-                              "initial_condition": [1]*NX + [0]*NX, "v_func": v_func_zero})
-    res = model_task_handler.run_tasks([task])[0]
-    return res[1].y[:, -1]
+# Goehring reference run, the homogeneous steady state and the establishment run from it
+# run (or loaded from the result cache) once per process and kept, the establishment run's y memory mapped
+# t_eval is every GOEHRING_REFERENCE_DT so any time of a par3add run has a reference state close by
+GOEHRING_REFERENCE_DT = 1
+goehring_reference = None
 
 
-def get_goehring_polarised(initial_condition, pol_time_divider: int = 1):
-    task = (MODELS.GOEHRING, {**params_goehring, "tL": TL_EST,
-                              "initial_condition": initial_condition})
-    res = model_task_handler.run_tasks([task])[0]
-    # return res[1].y[:, -1] if not pol_half_time else res[1].y[:, res[1].y.shape(1)//pol_time_divider]
-    return res[1].y[:, res[1].y.shape(1)//pol_time_divider]
+def get_goehring_reference() -> tuple:
+    global goehring_reference
+    if goehring_reference is None:
+        res_h = get_goehring_homo_ic()
+        task = (MODELS.GOEHRING, {**params_goehring, "Nx": NX, "tL": TL_EST, "initial_condition": res_h,
+                                  "t_eval": np.linspace(0, TL_EST, int(TL_EST / GOEHRING_REFERENCE_DT) + 1),
+                                  "label": "goehring_reference_establishment"})
+        res_p = load_or_run("goehring_reference_establishment", [task])[0]
+        assert res_p[1] != "FAILURE", "goehring reference establishment run failed"
+        goehring_reference = (res_h, res_p[1])
+    return goehring_reference
 
 
-def load_or_run(name: str, tasks: list[tuple]) -> list[tuple]:
-    filename = f"{name}_{bad_hash_for_filename(tasks):.7g}"
+# (homogeneous state, establishment state at 1/pol_time_divider of TL_EST)
+def get_goehring_res(pol_time_divider: int = 1) -> tuple[list]:
+    return get_goehring_reference()[0], get_goehring_polarised(1 / pol_time_divider)
 
-    try:
-        loaded_data = np.load("./savedata/"+filename+".npy", allow_pickle=True)
-        print(f"Loading of {name} succeeded!")
-        return loaded_data
-    except Exception as e:
-        print(f"Failed loading of {name} because: " + str(e))
-        res = model_task_handler.run_tasks_parallel(tasks)
 
-        print("Saving results")
-        np.save("./savedata/"+filename+".npy", res, allow_pickle=True)
+def get_goehring_homo_ic():
+    task = (MODELS.GOEHRING, {**params_goehring, "Nx": NX, "tL": TL_HOM,
+                              "initial_condition": [1]*NX + [0]*NX, "v_func": v_func_zero,
+                              "label": "goehring_reference_homogeneous"})
+    res = load_or_run("goehring_reference_homogeneous", [task])[0]
+    return np.array(res[1].y[:, -1])
 
-        return res
 
+# establishment state at fraction of TL_EST, from the nearest point of the reference run
+def get_goehring_polarised(fraction: float):
+    sol = get_goehring_reference()[1]
+    i = int(round(fraction * (len(sol.t) - 1)))
+    return sol.y[:, min(max(i, 0), len(sol.t) - 1)]
 
-def bad_hash_for_filename(tasks):
-    bad_hash = 0
 
-    for task in tasks:
-        params = task[1]
-        for key in params:
-            element = params[key]
-            if isinstance(element, (int, float)):
-                bad_hash += element
-            elif key == "initial_condition":
-                bad_hash += np.sum(element)
-    bad_hash += len(tasks)
-    return bad_hash
+def load_or_run(name: str, tasks: list[tuple]) -> list[tuple]:
+    return model_task_handler.load_or_run(name, tasks)
 
 
 if __name__ == '__main__':
+    import matplotlib
     matplotlib.use('Agg')  # block plots from appearing
     main()
@@ -0,0 +1,138 @@
+# Discover parameters by surrogate guided search over all of PARAMS_TO_VARY together
+# Instead of the pairwise grids of par3add_parameter_search, a Gaussian process (src/surrogate.py) is fitted
+# to the goehring_comparer scores of every point evaluated so far and proposes the next batch, which is run
+# through the task handler like any other sweep, until the best score stops improving
+# Evaluations are kept in SEARCH_HISTORY_FILE and the runs in the result cache, so a restarted search
+# carries on from where it got to
+# Output is grep-able, search for 'Best point was'
+
+import os
+os.environ['OPENBLAS_NUM_THREADS'] = '1'
+
+import json
+import numpy as np
+from .. import surrogate
+from .par3add_parameter_search import base_params_par3add, PARAMS_TO_VARY, get_goehring_res, goehring_comparer, \
+    screened_runs
+
+# range searched for each parameter, as multipliers of base_params_par3add (searched in log scale)
+MIN_MULTIPLIER = 0.25
+MAX_MULTIPLIER = 4
+
+INITIAL_POINTS = 20  # points evaluated before the surrogate is first fitted, including the base point
+BATCH_SIZE = 8  # points proposed and run at a time
+MAX_EVALUATIONS = 400
+PATIENCE = 5  # batches without the best score improving by MIN_IMPROVEMENT before stopping
+MIN_IMPROVEMENT = 1e-3
+
+SEED = 0
+
+LABEL_SEARCH = "par3add_search"
+
+SEARCH_HISTORY_FILE = "./savedata/par3add_surrogate_search.json"
+
+
+# unit cube coordinates of parameter values and back
+def to_unit(params: dict) -> np.ndarray:
+    multipliers = np.array([params[p] / base_params_par3add[p] for p in PARAMS_TO_VARY])
+    return np.log(multipliers / MIN_MULTIPLIER) / np.log(MAX_MULTIPLIER / MIN_MULTIPLIER)
+
+
+def from_unit(x) -> dict:
+    multipliers = MIN_MULTIPLIER * (MAX_MULTIPLIER / MIN_MULTIPLIER) ** np.asarray(x)
+    return {p: float(base_params_par3add[p] * m) for p, m in zip(PARAMS_TO_VARY, multipliers)}
+
+
+# [{"params": {...}, "score": float or None},...], score None for points screened out or failed
+def load_history() -> list[dict]:
+    try:
+        with open(SEARCH_HISTORY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_history(history: list[dict]):
+    os.makedirs(os.path.dirname(SEARCH_HISTORY_FILE), exist_ok=True)
+    with open(SEARCH_HISTORY_FILE + ".tmp", "w") as f:
+        json.dump(history, f)
+    os.replace(SEARCH_HISTORY_FILE + ".tmp", SEARCH_HISTORY_FILE)
+
+
+# goehring_comparer polarised score for each of params_list, None if screened out or failed
+def evaluate(params_list: list[dict], goehring_results: tuple[list]) -> list:
+    res_hom_all, res_pol_all = screened_runs(LABEL_SEARCH, base_params_par3add, params_list, goehring_results)
+
+    scores = [None] * len(params_list)
+    for c in goehring_comparer(goehring_results, res_hom_all, res_pol_all):
+        scores[params_list.index(c[0])] = float(c[2])
+    return scores
+
+
+# spread out starting points, one per stratum in each parameter
+def initial_design(n: int, rng: np.random.Generator) -> np.ndarray:
+    d = len(PARAMS_TO_VARY)
+    strata = np.array([rng.permutation(n) for _ in range(d)]).T
+    return (strata + rng.random((n, d))) / n
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+
+    print("Getting goehring results")
+    goehring_results = get_goehring_res()
+
+    history = load_history()
+    print(f"Loaded {len(history)} previous evaluations from {SEARCH_HISTORY_FILE}")
+
+    def run_batch(params_list):
+        scores = evaluate(params_list, goehring_results)
+        history.extend({"params": params, "score": score} for params, score in zip(params_list, scores))
+        save_history(history)
+
+    if len(history) < INITIAL_POINTS:
+        points = [{p: float(base_params_par3add[p]) for p in PARAMS_TO_VARY}]
+        points += [from_unit(x) for x in initial_design(INITIAL_POINTS - 1, rng)]
+        run_batch(points[len(history):])
+
+    def best():
+        scored = [h for h in history if h["score"] is not None]
+        return min(scored, key=lambda h: h["score"]) if len(scored) > 0 else None
+
+    best_point = best()
+    stalled = 0
+
+    while len(history) < MAX_EVALUATIONS and stalled < PATIENCE:
+        scored = [h for h in history if h["score"] is not None]
+        if len(scored) == 0:
+            print("No points evaluated successfully, widen the search or check the base parameters")
+            break
+
+        # points outside the search range (from a previous range) are left out
+        # screened out and failed points are given the worst score seen, so the search moves away from them
+        worst = max(h["score"] for h in scored)
+        X, y = [], []
+        for h in history:
+            x = to_unit(h["params"])
+            if np.all((x >= 0) & (x <= 1)):
+                X.append(x)
+                y.append(worst if h["score"] is None else h["score"])
+
+        gp = surrogate.GaussianProcess().fit(X, y)
+        batch = surrogate.propose_batch(gp, BATCH_SIZE, rng)
+
+        print(f"Evaluated {len(history)}/{MAX_EVALUATIONS}, best score {best_point['score']:.4f}, running next batch")
+        run_batch([from_unit(x) for x in batch])
+
+        new_best = best()
+        stalled = stalled + 1 if new_best["score"] > best_point["score"] - MIN_IMPROVEMENT else 0
+        best_point = new_best
+
+    if best_point is not None:
+        print(f"Best point was {(best_point['params'], best_point['score'])}")
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('Agg')  # block plots from appearing
+    main()
@@ -0,0 +1,57 @@
+# Measures how long a fresh interpreter takes to import each python -m src.tasks.<name> entry point,
+# which every run pays before it starts and a spawned worker pays again for the task module and
+# model_task_handler, and whether matplotlib was imported along the way
+# python -m src.tasks.startup_benchmark [--repeats 5] [module ...]
+import argparse
+import os
+import pkgutil
+import statistics
+import subprocess
+import sys
+from src import tasks
+
+# imported by the workers of model_task_handler, compared against the task entry points
+WORKER_MODULES = ["src.models", "src.model_task_handler"]
+
+IMPORT_TIMER = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, "matplotlib" in sys.modules)
+"""
+
+
+def entry_points() -> list[str]:
+    return [f"src.tasks.{m.name}" for m in pkgutil.iter_modules(tasks.__path__) if m.name != "startup_benchmark"]
+
+
+# (seconds to import module in a new interpreter, matplotlib imported), or the last line of the error
+def time_import(module: str):
+    result = subprocess.run([sys.executable, "-c", IMPORT_TIMER.format(module=module)], capture_output=True, text=True,
+                            env={**os.environ, "MPLBACKEND": "Agg"})
+    if result.returncode != 0:
+        return result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"
+    seconds, matplotlib_loaded = result.stdout.split()[-2:]
+    return float(seconds), matplotlib_loaded == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time importing the task entry points in a new interpreter")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("modules", nargs="*", help="modules to time, by default the worker modules and every task")
+    args = parser.parse_args()
+
+    modules = args.modules or WORKER_MODULES + entry_points()
+
+    print(f"{'module':<48}{'median s':>10}{'min s':>9}  matplotlib")
+    for module in modules:
+        times = [time_import(module) for _ in range(args.repeats)]
+        if isinstance(times[0], str):
+            print(f"{module:<48}{'failed':>10}  {times[0]}")
+            continue
+        seconds = [t[0] for t in times]
+        print(f"{module:<48}{statistics.median(seconds):>10.3f}{min(seconds):>9.3f}  {'yes' if times[0][1] else 'no'}")
+
+
+if __name__ == '__main__':
+    main()
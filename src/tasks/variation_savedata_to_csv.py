@@ -4,10 +4,10 @@
 
 import numpy as np
 from src.tasks import variation_task_helper as t_helper
-from src.models.metric_functions import polarity_measure
+from src.models.metric_functions import polarity_of_results
 
 
-# need this for data loading
+# need this for loading savedata in the old pickled format, see variation_task_helper.load_runs_pickled
 def v_func_zero():
     pass
 
@@ -41,6 +41,12 @@ for vary_group in results_by_variable:
     variable_data = []
     key_varied = vary_group[1][1]["key_varied"]
 
+    # final time polarity of the whole group at once
+    if is_goehring:
+        pm_all, _ = polarity_of_results(vary_group[0], vary_group[1], 2, 0, 1)
+    else:
+        pm_all, _ = polarity_of_results(vary_group[0], vary_group[1], 4, [0, 1, 2], 3)
+
     for i in range(0, len(vary_group[0])):
         sol = vary_group[0][i]
         kvals = vary_group[1][i]
@@ -49,20 +55,7 @@ for vary_group in results_by_variable:
             variable_data.append((kvals[key_varied], -1)) # -1 used as failure marker
             continue
 
-        Nx = kvals["Nx"]
-
-        if is_goehring:
-            pm = polarity_measure(kvals["X"],
-                                  sol.y[:Nx, -1],
-                                  sol.y[Nx:, -1],
-                                  Nx)
-        else:
-            pm = polarity_measure(kvals["X"],
-                                  sol.y[:Nx, -1] + sol.y[Nx:2*Nx, -1] + sol.y[2*Nx:3*Nx, -1],
-                                  sol.y[3*Nx:, -1],
-                                  Nx)
-
-        variable_data.append((kvals[key_varied], pm))
+        variable_data.append((kvals[key_varied], pm_all[i]))
 
     wanted_data[key_varied] = variable_data
 
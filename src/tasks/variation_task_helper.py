@@ -1,7 +1,10 @@
 # Helper code for varying a bunch of parameters
 
+import json
+import os
+import shutil
 import numpy as np
-from src import model_task_handler
+from src import model_task_handler, result_format
 from src.models import MODELS, model_to_module, model_to_string
 from multiprocessing import cpu_count
 
@@ -54,7 +57,11 @@ def generate_tasks(model_type: MODELS, variations_list: list[float], default_par
 
 
 # assume tasks have sort property "sort"
-def run_grouped_tasks(tasks: list[list[tuple]], NUMBER_OF_PROCESSES=int(cpu_count()/1.5),):
+# ENSEMBLE_SIZE stacks compatible tasks into ensembles of that many runs (see model_task_handler.run_tasks_ensemble)
+# WARM_START starts each variation from the final state of the next multiplier towards 1, with the
+# baseline starting the chains (see model_task_handler.run_tasks_warm_start), for maintenance type runs
+def run_grouped_tasks(tasks: list[list[tuple]], NUMBER_OF_PROCESSES=int(cpu_count()/1.5), ENSEMBLE_SIZE=None,
+                      WARM_START=False):
     tasks_collapsed = []
 
     for task_list_i in range(0,len(tasks)):
@@ -64,7 +71,17 @@ def run_grouped_tasks(tasks: list[list[tuple]], NUMBER_OF_PROCESSES=int(cpu_coun
 
     assert len(tasks_collapsed) == sum([len(task_list) for task_list in tasks])
 
-    results = model_task_handler.run_tasks_parallel(tasks_collapsed, NUMBER_OF_PROCESSES)
+    if ENSEMBLE_SIZE is None:
+        def run_tasks(task_list):
+            return model_task_handler.run_tasks_parallel(task_list, NUMBER_OF_PROCESSES)
+    else:
+        def run_tasks(task_list):
+            return model_task_handler.run_tasks_ensemble(task_list, NUMBER_OF_PROCESSES, ENSEMBLE_SIZE)
+
+    if WARM_START:
+        results = model_task_handler.run_tasks_warm_start(tasks_collapsed, warm_start_parents(tasks), run_tasks)
+    else:
+        results = run_tasks(tasks_collapsed)
     results.sort(key=lambda res: res[2]["sort"])
 
     results_by_variable = [[] for _ in range(0, len(tasks))]
@@ -78,6 +95,18 @@ def run_grouped_tasks(tasks: list[list[tuple]], NUMBER_OF_PROCESSES=int(cpu_coun
     return results_by_variable
 
 
+# parents for run_tasks_warm_start over the collapsed tasks of generate_tasks, tasks[0] is the baseline
+# within each varied parameter a run starts from its neighbour towards multiplier 1
+def warm_start_parents(tasks: list[list[tuple]]) -> list:
+    parents = [None] * len(tasks[0])
+    for task_list in tasks[1:]:
+        offset = len(parents)
+        multipliers = [1] + [task[1]["variation_multiplier"] for task in task_list]
+        group_parents = model_task_handler.nearest_parents(multipliers, 1)  # index 0 is the baseline
+        parents += [0 if parent == 0 else offset + parent - 1 for parent in group_parents[1:]]
+    return parents
+
+
 def split_baseline_from_results(model_type: MODELS, all_results_by_variable: list[list[tuple]], index_for_100x, extra_plot=None):
     if extra_plot is None:  # mutable default argument fix
         extra_plot = []
@@ -126,29 +155,71 @@ def split_baseline_from_results(model_type: MODELS, all_results_by_variable: lis
     return baseline_result, results_by_variable
 
 
+# runs are saved to ./savedata/<filename>/ as runs/<i>/ folders in the format of result_format
+# plus index.json saying which run goes where, so loading maps the solutions rather than unpickling them
 def save_runs(filename, tasks, baseline, results_by_variable):
-    save_data = {
+    folder = "./savedata/" + filename
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+
+    run_names = {}  # the baseline is in every variation set, only save it once
+
+    def save_run(sol, kvals):
+        if id(sol) not in run_names:
+            run_names[id(sol)] = f"runs/{len(run_names)}"
+            result_format.save_result(os.path.join(folder, run_names[id(sol)]), sol, kvals)
+        return run_names[id(sol)]
+
+    index = {
         "filename": filename,
-        "tasks": tasks,
-        "baseline": baseline,
-        "results_by_variable": results_by_variable
+        "tasks": result_format.encode_value(tasks),
+        "baseline": save_run(*baseline),
+        "results_by_variable": [[save_run(sol, kvals) for sol, kvals in zip(sol_list, kvals_list)]
+                                for sol_list, kvals_list in results_by_variable]
         }
 
-    np.save("./savedata/"+filename, save_data, allow_pickle=True)
-    
+    # written last so an interrupted save doesn't load
+    with open(os.path.join(folder, "index.json"), "w") as f:
+        json.dump(index, f)
 
 
 def load_runs(filename):
     try:
-        loaded_data = np.load("./savedata/"+filename+".npy", allow_pickle=True)
-        loaded_data = loaded_data.item()
+        if not os.path.isdir("./savedata/" + filename):
+            return load_runs_pickled(filename)
+
+        folder = "./savedata/" + filename
+        with open(os.path.join(folder, "index.json")) as f:
+            index = json.load(f)
+
+        loaded_runs = {}
+
+        def load_run(name):
+            if name not in loaded_runs:
+                _, sol, kvals = result_format.load_result(os.path.join(folder, name))
+                loaded_runs[name] = (sol, kvals)
+            return loaded_runs[name]
 
-        return [True, loaded_data["baseline"], loaded_data["results_by_variable"]]
+        baseline = load_run(index["baseline"])
+        results_by_variable = []
+        for names in index["results_by_variable"]:
+            runs = [load_run(name) for name in names]
+            results_by_variable.append(([sol for sol, _ in runs], [kvals for _, kvals in runs]))
+
+        return [True, baseline, results_by_variable]
     except Exception as e:
         print("Error occurred while loading: " + str(e))
         return [False]
 
 
+# savedata from before save_runs used result_format
+def load_runs_pickled(filename):
+    loaded_data = np.load("./savedata/"+filename+".npy", allow_pickle=True)
+    loaded_data = loaded_data.item()
+
+    return [True, loaded_data["baseline"], loaded_data["results_by_variable"]]
+
+
 def generate_variation_save_filename(name: str, model: MODELS, Nx: int, end_time: int,
                                     point_per_second: float, params: dict, varied_params: list,
                                     initial_condition, tasks) -> str:
@@ -0,0 +1,5 @@
+# lets the tests import src the same way python -m src.tasks.<name> does, from the repository root
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+from src.models import MODELS, continuation
+
+
+# at Nx=20 the polarised goehring branch snakes in rho_A, each fold trading stability, so the first two
+# folds bound a range where the branch has two stable states
+def test_goehring_rho_A_branch_reaches_fold():
+    branch = continuation.follow_branch(MODELS.GOEHRING, {"Nx": 20}, "rho_A", 3.0, max_steps=14)
+    points = branch["points"]
+
+    assert points[0]["kind"] == "start" and points[0]["stable"]
+    assert len(branch["folds"]) >= 2
+    first_fold = next(i for i, point in enumerate(points) if point["kind"] == "fold")
+    assert points[first_fold - 1]["stable"] != points[first_fold + 1]["stable"]
+
+    ranges = continuation.bistable_ranges(branch)
+    assert len(ranges) > 0
+    assert all(min(branch["folds"]) <= low < high <= max(branch["folds"]) for low, high in ranges)
+
+
+# the example at the top of continuation.py
+def test_par3add_konA_example():
+    branch = continuation.follow_branch(MODELS.PAR3ADD, {"Nx": 50}, "konA", 0.02)
+
+    assert branch["parameter"] == "konA"
+    assert branch["points"][0]["p"] == 0
+    assert max(point["p"] for point in branch["points"]) > 0
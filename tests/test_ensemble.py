@@ -0,0 +1,36 @@
+import numpy as np
+from src.models import MODELS, ensemble, goehring, steady_state
+
+ARGS = [{"Nx": 30, "tL": 300, "k_onA": k_onA} for k_onA in np.linspace(0.006, 0.01, 8)]
+
+
+def reference(args):
+    kvals = goehring.setup_kvals(dict(args))
+    rhs, rhs_args = goehring.vectorised_rhs(kvals)
+    return steady_state.integrate(kvals, rhs, kvals["initial_condition"], method="BDF", args=rhs_args,
+                                  rtol=1e-9, atol=1e-12)
+
+
+# a member is held to the tolerance of its single run, so both are within that tolerance's global error of
+# each other and the member is no further from the exact solution than the single run
+def test_member_matches_single_run():
+    members = ensemble.run_ensemble(MODELS.GOEHRING, ARGS)
+    assert all(isinstance(kvals, dict) for _, _, kvals in members)
+
+    for k in [0, len(ARGS) - 1]:
+        _, member, _ = members[k]
+        single, _ = goehring.run_model(dict(ARGS[k]))
+        exact = reference(ARGS[k]).y
+
+        scale = np.max(np.abs(exact))
+        assert np.max(np.abs(member.y - single.y)) <= 10 * ensemble.RTOL * scale
+        assert np.max(np.abs(member.y - exact)) <= np.max(np.abs(single.y - exact)) + ensemble.ATOL
+
+
+def test_separate_models_are_not_stacked(monkeypatch):
+    stacked = []
+    monkeypatch.setattr(ensemble, "solve_ensemble", lambda module, kvals_list: stacked.append(kvals_list))
+
+    members = ensemble.run_ensemble(MODELS.TOSTEVIN, [{"Nx": 30, "tL": 10}, {"Nx": 30, "tL": 10}])
+    assert stacked == []
+    assert [model for model, _, _ in members] == [MODELS.TOSTEVIN] * 2
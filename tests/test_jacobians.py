@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from src.models import goehring, par3addition, crumbs, tostevin
+
+
+# central differences of the vectorised right hand side, column by column
+def difference_jacobian(module, t, U, kvals):
+    rhs, rhs_args = module.vectorised_rhs(kvals)
+    J = np.empty((len(U), len(U)))
+    for i in range(len(U)):
+        h = 1e-6 * max(1, abs(U[i]))
+        up, down = U.copy(), U.copy()
+        up[i] += h
+        down[i] -= h
+        J[:, i] = (np.array(rhs(t, up, *rhs_args)) - np.array(rhs(t, down, *rhs_args))) / (2 * h)
+    return J
+
+
+# a state part way through a run, so every term of the jacobian is away from its initial value
+@pytest.mark.parametrize("module", [goehring, par3addition, crumbs, tostevin])
+def test_analytic_jacobian_matches_differences(module):
+    sol, kvals = module.run_model({"Nx": 12, "tL": 500, "jacobian": None})
+    t, U = sol.t[-1], sol.y[:, -1]
+
+    J = module.jacobian(t, U, kvals).toarray()
+    J_diff = difference_jacobian(module, t, U, kvals)
+
+    assert np.max(np.abs(J - J_diff)) <= 1e-9 * np.max(np.abs(J_diff))
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+from src import model_task_handler
+from src.models import MODELS
+
+TASK = (MODELS.GOEHRING, {"Nx": 10, "tL": 10})
+
+
+# kills the worker running it, only ever called in a worker
+def v_func_exit(kvals, x, t):
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return 0
+
+
+# failures the pool makes itself reach the callback like any other result, and its tasks are run
+def test_pool_failures_reach_callback(monkeypatch):
+    monkeypatch.setattr(model_task_handler.TaskPool, "POLL_INTERVAL", 0.1)
+    seen = []
+
+    def callback(res):
+        seen.append(res)
+        return [TASK] if len(seen) == 1 else []
+
+    unpicklable = (MODELS.GOEHRING, {**TASK[1], "v_func": lambda kvals, x, t: 0})
+    killer = (MODELS.GOEHRING, {**TASK[1], "v_func": v_func_exit})
+    with model_task_handler.TaskPool(1) as pool:
+        output = pool.run([unpicklable, killer], callback)
+
+    assert output == seen
+    failures = [res[1].reason for res in seen if res[1] == "FAILURE"]
+    assert len(seen) == 3 and len(failures) == 2
+    assert "can't be sent to a worker" in failures[0]
+    assert "killed 2 workers" in failures[1]
+
+
+# run_tasks asks for one process, it mustn't replace the larger pool run_tasks_parallel started
+def test_shared_pool_kept_for_fewer_processes(monkeypatch):
+    class Pool:
+        NUMBER_OF_PROCESSES = 4
+        closed = False
+    pool = Pool()
+    monkeypatch.setattr(model_task_handler, "shared_pool", pool)
+
+    assert model_task_handler.get_shared_pool(1) is pool
+    assert model_task_handler.get_shared_pool(4) is pool
@@ -0,0 +1,54 @@
+import json
+import os
+from src import result_cache
+from src.models import MODELS, goehring
+
+
+def v_func_script(kvals, x, t):
+    return 0.01 * x
+
+
+# as if defined in a task run with python -m, where it can't be found again on loading
+v_func_script.__module__ = "__main__"
+
+
+def cache_run(args, key=None):
+    key = key or result_cache.task_key(MODELS.GOEHRING, args)
+    sol, kvals = goehring.run_model(dict(args))
+    result_cache.save_result(key, (MODELS.GOEHRING, sol, kvals))
+    return key
+
+
+def test_verify_keeps_results_of_functions_from_main(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_FOLDER", str(tmp_path))
+    key = cache_run({"Nx": 20, "tL": 300, "v_func": v_func_script})
+
+    assert result_cache.verify(delete=True) == ([], [])
+    assert os.path.isdir(result_cache.cache_path(key))
+
+
+def test_verify_never_deletes_unverifiable_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_FOLDER", str(tmp_path))
+    key = cache_run({"Nx": 20, "tL": 300, "v_func": v_func_script})
+
+    # as saved before callable sources were stored
+    meta_file = os.path.join(result_cache.cache_path(key), "meta.json")
+    with open(meta_file) as f:
+        meta = json.load(f)
+    del meta["kvals"]["dict"]["v_func"]["source"]
+    with open(meta_file, "w") as f:
+        json.dump(meta, f)
+
+    problems, unverifiable = result_cache.verify(delete=True)
+    assert problems == []
+    assert [k for k, _ in unverifiable] == [key]
+    assert os.path.isdir(result_cache.cache_path(key))
+
+
+def test_verify_deletes_stale_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_FOLDER", str(tmp_path))
+    key = cache_run({"Nx": 20, "tL": 300}, key="0" * 64)
+
+    problems, unverifiable = result_cache.verify(delete=True)
+    assert [k for k, _ in problems] == [key]
+    assert not os.path.isdir(result_cache.cache_path(key))
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from src import result_cache, result_format
+from src.models import MODELS, goehring
+
+
+def v_func_script(kvals, x, t):
+    return 0.01 * x
+
+
+# as if defined in a task run with python -m, where it can't be found again on loading
+v_func_script.__module__ = "__main__"
+
+
+def saved_run(folder):
+    args = {"Nx": 20, "tL": 300, "v_func": v_func_script}
+    sol, kvals = goehring.run_model(dict(args))
+    result_format.save_result(str(folder), sol, kvals, MODELS.GOEHRING)
+    return args, sol
+
+
+def test_missing_callable_keeps_its_source(tmp_path):
+    args, _ = saved_run(tmp_path / "run")
+    model, sol, kvals = result_format.load_result(str(tmp_path / "run"))
+
+    assert isinstance(kvals["v_func"], result_format.MissingCallable)
+    assert kvals["v_func"].source == result_format.callable_source(v_func_script)
+    assert result_cache.task_key(model, kvals) == result_cache.task_key(MODELS.GOEHRING, args)
+
+
+def test_loaded_arrays_are_read_only(tmp_path):
+    _, sol_saved = saved_run(tmp_path / "run")
+    _, sol, _ = result_format.load_result(str(tmp_path / "run"))
+
+    np.testing.assert_array_equal(sol.y, sol_saved.y)
+    with pytest.raises(ValueError):
+        sol.y[0, 0] = 1
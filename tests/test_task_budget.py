@@ -0,0 +1,19 @@
+from src.models import goehring, task_budget
+
+
+# BDF's first steps are far below min_step, a healthy run mustn't be stopped for them
+def test_min_step_ignores_startup_ramp():
+    sol, kvals = goehring.run_model({"min_step": 1e-3})
+    res, _ = task_budget.result_or_failure(sol, kvals)
+
+    assert res != "FAILURE"
+    assert sol.status == 0
+    assert sol.t[-1] == kvals["tL"]
+
+
+def test_min_step_stops_stuck_solve():
+    budget = task_budget.Budget({"min_step": 1.0}, t_end=100)
+    for t in [0, 1e-4, 2, 4]:
+        assert budget.event(t, [0.0]) > 0
+    assert budget.event(4.5, [0.0]) == 0
+    assert "below min_step" in budget.reason
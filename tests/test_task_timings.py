@@ -0,0 +1,14 @@
+from src import task_timings
+from src.models import MODELS, goehring
+
+
+# scheduling reads Nx and tL from the args and defaults, it mustn't build the whole problem
+def test_estimate_seconds_from_args_and_defaults(monkeypatch):
+    def setup_kvals(args=None):
+        raise AssertionError("setup_kvals called to estimate a task")
+    monkeypatch.setattr(goehring, "setup_kvals", setup_kvals)
+
+    history = {"goehring": [[50, 1000, 1.0], [100, 1000, 4.0]]}
+    assert task_timings.estimate_seconds(MODELS.GOEHRING, {"Nx": 50, "tL": 2000}, history) == 2.0
+    assert task_timings.estimate_seconds(MODELS.GOEHRING, {"tL": 1000}, history) == 4.0
+    assert task_timings.estimate_seconds(MODELS.GOEHRING, [{"Nx": 50}, {"Nx": 50}], history) == 2 * 9.0
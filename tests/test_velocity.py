@@ -0,0 +1,60 @@
+import numpy as np
+from src.models import goehring, velocity
+
+TL = 3100  # probe times of velocity.VelocityField are multiples of 100 from 0
+NX = 50
+
+
+def v_func_profile(kvals, x, t):
+    return -x * (x - 67.3) * (x - 30) / 50000
+
+
+# points the separable path would evaluate v_func at
+_, I, J = velocity.VelocityField(goehring.setup_kvals({"Nx": NX, "tL": TL, "v_func": v_func_profile,
+                                                       "v_func_separable": True})).profile
+X = goehring.setup_kvals({"Nx": NX})["X"]
+
+
+# x t coupled term that vanishes at every probe time and at those two points, so it looks separable
+def v_func_coupled(kvals, x, t):
+    return v_func_profile(kvals, x, t) \
+        + 1e-4 * np.sin(x / 10) * (x - X[I]) * (x - X[J]) * np.sin(np.pi * t / 100)
+
+
+def direct(kvals, t):
+    return np.array([v_func_coupled(kvals, x, t) for x in kvals["X"]])
+
+
+def test_coupled_v_func_matches_direct_evaluation():
+    kvals = goehring.setup_kvals({"Nx": NX, "tL": TL, "v_func": v_func_coupled})
+
+    for t in [0, 50, 125.5, 1000, 2550]:
+        np.testing.assert_allclose(velocity.velocity(kvals, t), direct(kvals, t), rtol=1e-12, atol=1e-15)
+
+
+def test_rhs_matches_loop_with_coupled_v_func():
+    kvals = goehring.setup_kvals({"Nx": NX, "tL": TL, "v_func": v_func_coupled})
+    rhs, rhs_args = goehring.vectorised_rhs(kvals)
+    U = np.random.default_rng(0).random(2 * NX)
+
+    for t in [50, 125.5]:
+        np.testing.assert_allclose(rhs(t, U, *rhs_args), goehring.odefunc(t, U, kvals), rtol=1e-10, atol=1e-12)
+
+
+# default_v_func is marked separable, so default runs scale one profile unless kvals turns that off
+def test_default_v_func_is_separable_and_matches_direct_evaluation():
+    kvals = goehring.setup_kvals({"Nx": NX})
+    assert velocity.field_of(kvals).profile is not None
+    assert velocity.VelocityField(goehring.setup_kvals({"Nx": NX, "v_func_separable": False})).profile is None
+
+    for t in [0, 3000, 6500, 9000]:
+        np.testing.assert_allclose(velocity.velocity(kvals, t), goehring.default_v_func(kvals, kvals["X"], t),
+                                   rtol=1e-12, atol=1e-15)
+
+
+def test_zero_v_func_skips_advection():
+    def v_func_zero(kvals, x, t):
+        return 0
+
+    kvals = goehring.setup_kvals({"Nx": NX, "v_func": v_func_zero})
+    assert velocity.velocity(kvals, 10) is None